@@ -2,6 +2,9 @@ from backend.database.connection import user_collection, department_collection
 from backend.models.user_model import User
 from backend.models.department_model import Department
 from backend.utils.serializer import serialize_doc, serialize_list
+from backend.utils.face_encoding import WITHOUT_FACE_ENCODING
+from backend.utils import face_cache, duplicate_faces, pagination, list_versions
+from fastapi.concurrency import run_in_threadpool
 from bson import ObjectId
 from fastapi import HTTPException
 import bcrypt
@@ -17,13 +20,14 @@ async def add_department(department: Department):
     department_dict.pop("id", None)
     
     new_department = await department_collection.insert_one(department_dict)
+    await list_versions.bump(list_versions.DEPARTMENTS)
     created_department = await department_collection.find_one({"_id": new_department.inserted_id})
     return created_department
 
 async def get_user_profile(user_id: str):
     """Get user profile by user_id"""
     try:
-        user = await user_collection.find_one({"_id": ObjectId(user_id)})
+        user = await user_collection.find_one({"_id": ObjectId(user_id)}, WITHOUT_FACE_ENCODING)
         
         if not user:
             raise HTTPException(status_code=404, detail="User not found")
@@ -38,22 +42,21 @@ async def get_user_profile(user_id: str):
             raise e
         raise HTTPException(status_code=400, detail=str(e))
 
-async def get_all_users():
-    """Get all users - for admin"""
+async def get_all_users(page: dict):
+    """Get one page of users - for admin. Returns (users, next_cursor)"""
     try:
-        users = []
-        async for user in user_collection.find():
+        users, next_cursor = await pagination.fetch(user_collection, {}, page, WITHOUT_FACE_ENCODING)
+        for user in users:
             user.pop("password", None)
             user.pop("hashed_password", None)
-            users.append(user)
-        return serialize_list(users)
+        return serialize_list(users), next_cursor
     except Exception as e:
         raise HTTPException(status_code=400, detail=str(e))
 
 async def update_user(user_id: str, update_data: dict, is_admin: bool = False):
     """Update user details - admin can update anyone, users can update themselves"""
     try:
-        existing_user = await user_collection.find_one({"_id": ObjectId(user_id)})
+        existing_user = await user_collection.find_one({"_id": ObjectId(user_id)}, {"_id": 1})
         
         if not existing_user:
             raise HTTPException(status_code=404, detail="User not found")
@@ -82,9 +85,10 @@ async def update_user(user_id: str, update_data: dict, is_admin: bool = False):
                 {"_id": ObjectId(user_id)},
                 {"$set": update_fields}
             )
+            face_cache.invalidate(user_id)
         
         # Return updated user
-        updated_user = await user_collection.find_one({"_id": ObjectId(user_id)})
+        updated_user = await user_collection.find_one({"_id": ObjectId(user_id)}, WITHOUT_FACE_ENCODING)
         updated_user.pop("password", None)
         updated_user.pop("hashed_password", None)
         
@@ -94,3 +98,46 @@ async def update_user(user_id: str, update_data: dict, is_admin: bool = False):
         if isinstance(e, HTTPException):
             raise e
         raise HTTPException(status_code=400, detail=str(e))
+
+async def find_duplicate_faces(threshold: float = None):
+    """Find clusters of accounts whose registered faces look like the same person"""
+    try:
+        ids, matrix = await duplicate_faces.load_all_encodings()
+        
+        # The blocked distance computation is CPU-bound; keep it off the event loop
+        clusters = await run_in_threadpool(duplicate_faces.find_duplicate_clusters, ids, matrix, threshold)
+        
+        # Resolve names for every flagged account in one query
+        flagged = {user_id for cluster in clusters for user_id in cluster["user_ids"]}
+        users = {}
+        if flagged:
+            async for user in user_collection.find(
+                {"_id": {"$in": [ObjectId(user_id) for user_id in flagged]}},
+                {"first_name": 1, "last_name": 1, "name": 1, "email": 1, "id_number": 1, "role": 1}
+            ):
+                users[str(user["_id"])] = user
+        
+        report = []
+        for cluster in sorted(clusters, key=lambda c: c["min_distance"]):
+            members = []
+            for user_id in cluster["user_ids"]:
+                user = users.get(user_id, {})
+                full_name = f"{user.get('first_name', '')} {user.get('last_name', '')}".strip()
+                members.append({
+                    "user_id": user_id,
+                    "name": full_name or user.get("name", "Unknown"),
+                    "email": user.get("email", "Unknown"),
+                    "id_number": user.get("id_number", "N/A"),
+                    "role": user.get("role", "Unknown")
+                })
+            report.append({"min_distance": cluster["min_distance"], "users": members})
+        
+        return {
+            "total_faces": len(ids),
+            "threshold": threshold or duplicate_faces.DUPLICATE_FACE_THRESHOLD,
+            "clusters": report
+        }
+    except Exception as e:
+        if isinstance(e, HTTPException):
+            raise e
+        raise HTTPException(status_code=400, detail=str(e))
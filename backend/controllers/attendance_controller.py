@@ -1,59 +1,177 @@
 from backend.database.connection import attendance_collection, event_collection, user_collection
 from backend.models.attendance_model import Attendance
-from backend.utils.location_validator import is_within_radius
 from backend.utils.serializer import serialize_doc
+from backend.utils import face_pool, face_cache, roster_matrix, image_dedup, geofence, event_cache, attendance_writer, pagination
+from backend.utils.face_encoding import WITHOUT_FACE_ENCODING
+from backend.utils.image_pipeline import GROUP_IMAGE_MAX_SIDE
+from backend.controllers import verification_controller
+from backend.controllers.event_controller import department_id_values
 from datetime import datetime
 from bson import ObjectId
-import face_recognition
-import numpy as np
+from pymongo import UpdateOne, ReturnDocument
+from pymongo.errors import BulkWriteError, DuplicateKeyError
 from fastapi.concurrency import run_in_threadpool
-import io
+import asyncio
+import os
+
+import numpy as np
+
+GROUP_PHOTO_JOB_TIMEOUT = float(os.getenv("GROUP_PHOTO_JOB_TIMEOUT", "30"))
+# Offline records older than this, or this far ahead of server time, are rejected
+OFFLINE_MAX_AGE_HOURS = float(os.getenv("OFFLINE_MAX_AGE_HOURS", "72"))
+OFFLINE_CLOCK_SKEW_SECONDS = float(os.getenv("OFFLINE_CLOCK_SKEW_SECONDS", "300"))
+
+async def _get_known_encoding(student_id: str):
+    """Return (encoding, error) for a student, serving from the face cache when possible"""
+    known_encoding = await face_cache.get(student_id)
+    if known_encoding is not None:
+        return known_encoding, None
+    
+    user = await user_collection.find_one({"_id": ObjectId(student_id)}, face_cache.ENCODING_PROJECTION)
+    if not user:
+        return None, "User not found"
+    if not user.get("face_encoding"):
+        return None, "Face not registered. Please register your face in profile settings."
+    
+    return face_cache.put_document(user), None
 
-def _verify_face_sync(known_encoding, image_bytes):
+def _as_local(value):
+    """MongoDB stores datetimes as UTC. Strip any timezone info and treat the value as local time"""
+    if isinstance(value, datetime) and value.tzinfo:
+        return value.replace(tzinfo=None)
+    return value
+
+def _same_instant(stored, value) -> bool:
+    """Compare a datetime read back from MongoDB (millisecond precision) with the one written"""
+    return stored is not None and value is not None and abs((stored - value).total_seconds()) < 0.001
+
+def _check_in_window(event: dict):
+    """Return (check_in_start, check_in_end) as naive local datetimes"""
+    return (
+        _as_local(event.get("check_in_start") or event.get("start_time")),
+        _as_local(event.get("check_in_end") or event.get("end_time")),
+    )
+
+def _check_out_window(event: dict):
+    """Return (check_out_start, check_out_end) as naive local datetimes"""
+    return (
+        _as_local(event.get("check_out_start") or event.get("end_time")),
+        _as_local(event.get("check_out_end")),
+    )
+
+def _check_in_window_error(event: dict, now: datetime):
+    """Return an error message if check-in is not open at `now`, else None"""
+    check_in_start, check_in_end = _check_in_window(event)
+    if check_in_start and now < check_in_start:
+        return f"Check-in not yet open. Opens at {check_in_start.strftime('%I:%M %p')}"
+    if check_in_end and now > check_in_end:
+        return "Check-in period has ended"
+    return None
+
+def _check_out_window_error(event: dict, now: datetime):
+    """Return an error message if check-out is not open at `now`, else None"""
+    check_out_start, check_out_end = _check_out_window(event)
+    if check_out_start and now < check_out_start:
+        return f"Check-out not yet open. Opens at {check_out_start.strftime('%I:%M %p')}"
+    if check_out_end and now > check_out_end:
+        return "Check-out period has ended"
+    return None
+
+# Fields needed to tell whether a check-in or check-out is still possible, plus
+# what a rolled-back provisional check-in has to restore
+ATTENDANCE_STATE_PROJECTION = {"check_in_time": 1, "check_in_status": 1, "check_in_source": 1, "check_out_time": 1, "timestamp": 1, "status": 1}
+# A check-in still pending face verification blocks check-out; an offline one
+# pending a teacher's review does not
+CHECK_OUT_ALLOWED_FILTER = {"$or": [{"check_in_status": {"$ne": "Pending"}}, {"check_in_source": "offline"}]}
+# Fields behind the check-in/check-out flags shown on event cards
+ATTENDANCE_STATUS_PROJECTION = {"event_id": 1, "check_in_time": 1, "check_in_status": 1, "check_out_time": 1, "check_out_status": 1}
+
+def _check_in_state_error(attendance: dict):
+    if attendance and attendance.get("check_in_time"):
+        return "Already checked in"
+    return None
+
+def _check_out_state_error(attendance: dict):
+    if not attendance or not attendance.get("check_in_time"):
+        return "You must check in first before checking out"
+    if attendance.get("check_out_time"):
+        return "Already checked out"
+    # Offline check-ins wait for a teacher's review, which may come after the event
+    if attendance.get("check_in_status") == "Pending" and attendance.get("check_in_source") != "offline":
+        return "Your check-in is still being verified. Please try again shortly."
+    return None
+
+async def _upsert_check_in(student_id: str, event_id: ObjectId, fields: dict):
+    """Record a check-in in one round trip.
+
+    Returns (attendance, created), or (None, False) if the student was already
+    checked in. The unique (student_id, event_id) index turns a lost race into
+    a duplicate key error instead of a second record.
+    """
+    new_id = ObjectId()
+    record_filter = {"student_id": student_id, "event_id": event_id, "check_in_time": None}
+    update = {"$set": fields, "$setOnInsert": {"_id": new_id}}
     try:
-        unknown_image = face_recognition.load_image_file(io.BytesIO(image_bytes))
-        unknown_encodings = face_recognition.face_encodings(unknown_image)
+        if attendance_writer.enabled():
+            result = await attendance_writer.write(UpdateOne(record_filter, update, upsert=True))
+            if result["upserted_id"] is not None:
+                return {"_id": new_id, "student_id": student_id, "event_id": event_id, **fields}, True
+            # Filled in a record that existed without a check-in (rare)
+            return await attendance_collection.find_one({"student_id": student_id, "event_id": event_id}), False
         
-        if not unknown_encodings:
-            return False
-            
-        unknown_encoding = unknown_encodings[0]
-        results = face_recognition.compare_faces([np.array(known_encoding)], unknown_encoding, tolerance=0.6)
-        return bool(results[0])
-    except Exception as e:
-        print(f"Face verification error: {e}")
-        return False
+        attendance = await attendance_collection.find_one_and_update(
+            record_filter,
+            update,
+            upsert=True,
+            return_document=ReturnDocument.AFTER
+        )
+    except DuplicateKeyError:
+        return None, False
+    return attendance, attendance["_id"] == new_id
+
+async def _record_check_out(student_id: str, event_id: ObjectId, fields: dict, known: dict = None):
+    """Record a check-out if the student's record still allows one.
 
-async def check_in(student_id: str, event_id: ObjectId, user_lat: float, user_lon: float, face_image_bytes: bytes = None):
-    from geopy.distance import geodesic
+    Returns the updated attendance, or None if nothing matched. `known` is a
+    previously read copy of the record, used to build the response when the
+    write goes through the write-behind buffer.
+    """
+    record_filter = {
+        "student_id": student_id,
+        "event_id": event_id,
+        "check_in_time": {"$ne": None},
+        "check_out_time": None,
+        **CHECK_OUT_ALLOWED_FILTER
+    }
+    if not attendance_writer.enabled():
+        return await attendance_collection.find_one_and_update(
+            record_filter,
+            {"$set": fields},
+            return_document=ReturnDocument.AFTER
+        )
     
-    event = await event_collection.find_one({"_id": event_id})
+    result = await attendance_writer.write(UpdateOne(record_filter, {"$set": fields}))
+    if result["matched"] and known:
+        return {**known, "student_id": student_id, "event_id": event_id, **fields}
+    # The batch could not confirm this update, or there is no copy to answer with
+    attendance = await attendance_collection.find_one({"student_id": student_id, "event_id": event_id})
+    if attendance and _same_instant(attendance.get("check_out_time"), fields["check_out_time"]):
+        return attendance
+    return None
+
+async def check_in(student_id: str, event_id: ObjectId, user_lat: float, user_lon: float, face_image_bytes: bytes = None, face_box=None, verify_async: bool = False, read_face_image=None):
+    """`read_face_image` is an optional coroutine function returning the photo bytes.
+    It is only awaited once every cheap check has passed, so rejected requests
+    never load the upload.
+    """
+    event = await event_cache.get(event_id)
     if not event:
         return None, "Event not found"
 
     # Check if check-in is currently allowed
     # Use local time - no UTC conversion
     now = datetime.now()
-    check_in_start_raw = event.get("check_in_start") or event.get("start_time")
-    check_in_end_raw = event.get("check_in_end") or event.get("end_time")
-    
-    # MongoDB stores datetimes as UTC. We need to treat them as naive local times.
-    # Strip any timezone information and treat as local time
-    check_in_start = None
-    check_in_end = None
-    
-    if check_in_start_raw:
-        if isinstance(check_in_start_raw, datetime):
-            # If it has timezone info, remove it (treat the time as-is in local timezone)
-            check_in_start = check_in_start_raw.replace(tzinfo=None) if check_in_start_raw.tzinfo else check_in_start_raw
-        else:
-            check_in_start = check_in_start_raw
-    
-    if check_in_end_raw:
-        if isinstance(check_in_end_raw, datetime):
-            check_in_end = check_in_end_raw.replace(tzinfo=None) if check_in_end_raw.tzinfo else check_in_end_raw
-        else:
-            check_in_end = check_in_end_raw
+    check_in_start, check_in_end = _check_in_window(event)
     
     print(f"[CHECK-IN] Time validation:")
     print(f"   Current time (local): {now.strftime('%Y-%m-%d %I:%M:%S %p')}")
@@ -62,29 +180,12 @@ async def check_in(student_id: str, event_id: ObjectId, user_lat: float, user_lo
     print(f"   Comparison: now={now}, check_in_start={check_in_start}")
     print(f"   Can check in? {not (check_in_start and now < check_in_start)}")
     
-    if check_in_start and now < check_in_start:
-        return None, f"Check-in not yet open. Opens at {check_in_start.strftime('%I:%M %p')}"
-    
-    if check_in_end and now > check_in_end:
-        return None, "Check-in period has ended"
-    
-    if check_in_end and now > check_in_end:
-        return None, "Check-in period has ended"
-
-    # Check if student already checked in for this event
-    existing_attendance = await attendance_collection.find_one({
-        "student_id": student_id,
-        "event_id": event_id
-    })
-    
-    if existing_attendance and existing_attendance.get("check_in_time"):
-        print(f"[WARNING] Student {student_id} already checked in for event {event.get('name')}")
-        return None, "Already checked in"
+    window_error = _check_in_window_error(event, now)
+    if window_error:
+        return None, window_error
 
-    # Calculate distance for debugging
-    event_location = (event["latitude"], event["longitude"])
-    user_location = (user_lat, user_lon)
-    distance = geodesic(user_location, event_location).meters
+    # Geofence check - the distance is computed once and reused for logging
+    inside, distance = geofence.check_event(event, user_lat, user_lon)
     
     print(f"[DEBUG] Check-in Debug:")
     print(f"   Event: {event.get('name', 'Unknown')}")
@@ -94,152 +195,650 @@ async def check_in(student_id: str, event_id: ObjectId, user_lat: float, user_lo
     print(f"   Allowed Radius: {event['radius']} meters")
     
     # Only record attendance if student is within range (Present)
-    if is_within_radius(user_lat, user_lon, event["latitude"], event["longitude"], event["radius"]):
+    if inside:
+        
+        # With a photo, look for an existing check-in first so a duplicate does not
+        # pay for the upload or face verification. Without one the conditional
+        # write below is the only check needed.
+        existing_attendance = None
+        if face_image_bytes or read_face_image:
+            existing_attendance = await attendance_collection.find_one({
+                "student_id": student_id,
+                "event_id": event_id
+            }, ATTENDANCE_STATE_PROJECTION)
+            
+            state_error = _check_in_state_error(existing_attendance)
+            if state_error:
+                print(f"[WARNING] Student {student_id} already checked in for event {event.get('name')}")
+                return None, state_error
+            
+            if read_face_image:
+                face_image_bytes = await read_face_image()
         
         # Face Verification Logic
+        pending = False
         if face_image_bytes:
-            user = await user_collection.find_one({"_id": ObjectId(student_id)})
-            if user:
-                if user.get("face_encoding"):
-                    is_match = await run_in_threadpool(_verify_face_sync, user["face_encoding"], face_image_bytes)
-                    if not is_match:
-                        return None, "Face verification failed. Face does not match registered user."
-                else:
-                    return None, "Face not registered. Please register your face in profile settings."
+            # Cheap replay check before any dlib work
+            fp = await run_in_threadpool(image_dedup.fingerprint, face_image_bytes)
+            dedup_error = image_dedup.check(event_id, student_id, "check_in", fp)
+            if dedup_error:
+                return None, dedup_error
+            
+            known_encoding, error = await _get_known_encoding(student_id)
+            if error:
+                return None, error
+            if verify_async:
+                # Record a provisional check-in now and match the face in the background
+                pending = True
+                image_dedup.record(event_id, student_id, "check_in", fp)
             else:
-                return None, "User not found"
+                is_match = await face_pool.run(face_pool.verify_face, known_encoding, face_image_bytes, face_box)
+                image_dedup.record(event_id, student_id, "check_in", fp, is_match)
+                if not is_match:
+                    return None, "Face verification failed. Face does not match registered user."
         
-        print(f"   [OK] Status: PRESENT (within range)")
+        print(f"   [OK] Status: {'PENDING VERIFICATION' if pending else 'PRESENT'} (within range)")
         
         # Create or update attendance record
         attendance_dict = {
-            "student_id": student_id,
-            "event_id": event_id,
             "check_in_time": now,
-            "check_in_status": "Present",
+            "check_in_status": "Pending" if pending else "Present",
             "timestamp": now,
-            "status": "Present"
+            "status": "Pending" if pending else "Present"
         }
-
-        if existing_attendance:
-            # Update existing record with check-in
-            await attendance_collection.update_one(
-                {"_id": existing_attendance["_id"]},
-                {"$set": attendance_dict}
+        
+        attendance, created = await _upsert_check_in(student_id, event_id, attendance_dict)
+        if not attendance:
+            print(f"[WARNING] Student {student_id} already checked in for event {event.get('name')}")
+            return None, "Already checked in"
+        
+        attendance_id = attendance["_id"]
+        attendance = serialize_doc(attendance)
+        if pending:
+            previous = None if created else (existing_attendance or {"check_in_time": None})
+            attendance["verification_id"] = await verification_controller.submit(
+                student_id, event_id, "check_in", attendance_id, previous,
+                known_encoding, face_image_bytes, face_box
             )
-            updated_attendance = await attendance_collection.find_one({"_id": existing_attendance["_id"]})
-            return serialize_doc(updated_attendance), "Checked in successfully"
-        else:
-            # Create new attendance record
-            new_attendance = await attendance_collection.insert_one(attendance_dict)
-            created_attendance = await attendance_collection.find_one({"_id": new_attendance.inserted_id})
-            return serialize_doc(created_attendance), "Checked in successfully"
+            return attendance, "Check-in submitted for face verification"
+        return attendance, "Checked in successfully"
     else:
         print(f"   [ERROR] Status: OUT OF RANGE (distance exceeds radius)")
         return None, "Out of Range"
 
-async def check_out(student_id: str, event_id: ObjectId, user_lat: float, user_lon: float, face_image_bytes: bytes = None):
-    from geopy.distance import geodesic
-    
-    event = await event_collection.find_one({"_id": event_id})
+async def check_out(student_id: str, event_id: ObjectId, user_lat: float, user_lon: float, face_image_bytes: bytes = None, face_box=None, verify_async: bool = False, read_face_image=None):
+    """`read_face_image` is an optional coroutine function returning the photo bytes.
+    It is only awaited once every cheap check has passed, so rejected requests
+    never load the upload.
+    """
+    event = await event_cache.get(event_id)
     if not event:
         return None, "Event not found"
 
     # Check if check-out is currently allowed
     # Use local time - no UTC conversion
     now = datetime.now()
-    check_out_start_raw = event.get("check_out_start") or event.get("end_time")
-    check_out_end_raw = event.get("check_out_end")
-    
-    # MongoDB stores datetimes as UTC. Strip timezone info and treat as local time
-    check_out_start = None
-    check_out_end = None
-    
-    if check_out_start_raw:
-        if isinstance(check_out_start_raw, datetime):
-            check_out_start = check_out_start_raw.replace(tzinfo=None) if check_out_start_raw.tzinfo else check_out_start_raw
-        else:
-            check_out_start = check_out_start_raw
-    
-    if check_out_end_raw:
-        if isinstance(check_out_end_raw, datetime):
-            check_out_end = check_out_end_raw.replace(tzinfo=None) if check_out_end_raw.tzinfo else check_out_end_raw
-        else:
-            check_out_end = check_out_end_raw
+    check_out_start, check_out_end = _check_out_window(event)
     
     print(f"[CHECK-OUT] Time validation:")
     print(f"   Current time (local): {now.strftime('%I:%M %p')}")
     print(f"   Check-out start (stored): {check_out_start.strftime('%I:%M %p') if check_out_start else 'N/A'}")
     
-    if check_out_start and now < check_out_start:
-        return None, f"Check-out not yet open. Opens at {check_out_start.strftime('%I:%M %p')}"
-    
-    if check_out_end and now > check_out_end:
-        return None, "Check-out period has ended"
-    
-    if check_out_end and now > check_out_end:
-        return None, "Check-out period has ended"
-
-    # Check if student has checked in
-    existing_attendance = await attendance_collection.find_one({
-        "student_id": student_id,
-        "event_id": event_id
-    })
-    
-    if not existing_attendance or not existing_attendance.get("check_in_time"):
-        return None, "You must check in first before checking out"
-    
-    if existing_attendance.get("check_out_time"):
-        return None, "Already checked out"
+    window_error = _check_out_window_error(event, now)
+    if window_error:
+        return None, window_error
 
-    # Calculate distance
-    event_location = (event["latitude"], event["longitude"])
-    user_location = (user_lat, user_lon)
-    distance = geodesic(user_location, event_location).meters
+    # Geofence check - the distance is computed once and reused for logging
+    inside, distance = geofence.check_event(event, user_lat, user_lon)
     
     print(f"[DEBUG] Check-out Debug:")
     print(f"   Event: {event.get('name', 'Unknown')}")
     print(f"   Distance: {distance:.2f} meters")
     
     # Record check-out if within range
-    if is_within_radius(user_lat, user_lon, event["latitude"], event["longitude"], event["radius"]):
+    if inside:
+        
+        # With a photo, rule out an impossible check-out before reading it or
+        # running face verification; otherwise the conditional write below settles it
+        existing_attendance = None
+        if face_image_bytes or read_face_image:
+            existing_attendance = await attendance_collection.find_one({
+                "student_id": student_id,
+                "event_id": event_id
+            }, ATTENDANCE_STATE_PROJECTION)
+            
+            state_error = _check_out_state_error(existing_attendance)
+            if state_error:
+                return None, state_error
+            
+            if read_face_image:
+                face_image_bytes = await read_face_image()
         
         # Face Verification Logic
+        pending = False
         if face_image_bytes:
-            user = await user_collection.find_one({"_id": ObjectId(student_id)})
-            if user:
-                if user.get("face_encoding"):
-                    is_match = await run_in_threadpool(_verify_face_sync, user["face_encoding"], face_image_bytes)
-                    if not is_match:
-                        return None, "Face verification failed. Face does not match registered user."
-                else:
-                    return None, "Face not registered. Please register your face in profile settings."
+            # Cheap replay check before any dlib work
+            fp = await run_in_threadpool(image_dedup.fingerprint, face_image_bytes)
+            dedup_error = image_dedup.check(event_id, student_id, "check_out", fp)
+            if dedup_error:
+                return None, dedup_error
+            
+            known_encoding, error = await _get_known_encoding(student_id)
+            if error:
+                return None, error
+            if verify_async:
+                pending = True
+                image_dedup.record(event_id, student_id, "check_out", fp)
             else:
-                return None, "User not found"
+                is_match = await face_pool.run(face_pool.verify_face, known_encoding, face_image_bytes, face_box)
+                image_dedup.record(event_id, student_id, "check_out", fp, is_match)
+                if not is_match:
+                    return None, "Face verification failed. Face does not match registered user."
         
-        print(f"   [OK] Check-out: PRESENT (within range)")
+        print(f"   [OK] Check-out: {'PENDING VERIFICATION' if pending else 'PRESENT'} (within range)")
         
-        # Update attendance with check-out
-        await attendance_collection.update_one(
-            {"_id": existing_attendance["_id"]},
-            {"$set": {
-                "check_out_time": now,
-                "check_out_status": "Present"
-            }}
-        )
+        # Update attendance with check-out, only if the record still allows it
+        updated_attendance = await _record_check_out(student_id, event_id, {
+            "check_out_time": now,
+            "check_out_status": "Pending" if pending else "Present"
+        }, existing_attendance)
+        if not updated_attendance:
+            # Work out which condition failed (rare, so the extra read is fine)
+            current = await attendance_collection.find_one({
+                "student_id": student_id,
+                "event_id": event_id
+            }, ATTENDANCE_STATE_PROJECTION)
+            return None, _check_out_state_error(current) or "Already checked out"
         
-        updated_attendance = await attendance_collection.find_one({"_id": existing_attendance["_id"]})
-        return serialize_doc(updated_attendance), "Checked out successfully"
+        attendance_id = updated_attendance["_id"]
+        updated_attendance = serialize_doc(updated_attendance)
+        if pending:
+            # The filter guarantees there was no check-out before this write
+            previous = {"check_out_time": None, "check_out_status": None}
+            updated_attendance["verification_id"] = await verification_controller.submit(
+                student_id, event_id, "check_out", attendance_id, previous,
+                known_encoding, face_image_bytes, face_box
+            )
+            return updated_attendance, "Check-out submitted for face verification"
+        return updated_attendance, "Checked out successfully"
     else:
         print(f"   [ERROR] Check-out: OUT OF RANGE")
         return None, "Out of Range"
 
-async def get_attendance_history(student_id: str):
-    """Get attendance history for a student with event names and society/department"""
+async def _is_event_staff(teacher_id: str, event: dict) -> bool:
+    """True if the teacher is approved in the event's department"""
+    from backend.database.connection import enrollment_collection
+    
+    department_id = event.get("department_id")
+    if not department_id:
+        return False
+    enrollment = await enrollment_collection.find_one({
+        "user_id": teacher_id,
+        "department_id": department_id,
+        "status": "approved"
+    }, {"_id": 1})
+    return enrollment is not None
+
+async def kiosk_check_in(teacher_id: str, event_id: ObjectId, face_image_bytes: bytes, user_lat: float = None, user_lon: float = None):
+    """Identify a student from a kiosk photo (1:N against the event roster) and check them in"""
+    event = await event_cache.get(event_id)
+    if not event:
+        return None, "Event not found"
+    
+    if not await _is_event_staff(teacher_id, event):
+        return None, "You are not approved in this event's department"
+    
+    now = datetime.now()
+    window_error = _check_in_window_error(event, now)
+    if window_error:
+        return None, window_error
+    
+    # The kiosk device itself must be at the venue when it reports a location
+    if user_lat is not None and user_lon is not None:
+        if not geofence.check_event(event, user_lat, user_lon)[0]:
+            return None, "Out of Range"
+    
+    encodings = await face_pool.run(face_pool.encode_faces, face_image_bytes)
+    if not encodings:
+        return None, "No face found in the image"
+    if len(encodings) > 1:
+        return None, "Multiple faces found. Please check in one person at a time."
+    
+    roster = await roster_matrix.get_roster(event)
+    student_id, distance = roster_matrix.identify(roster, encodings[0], face_pool.FACE_MATCH_TOLERANCE)
+    if not student_id:
+        print(f"[KIOSK] No roster match for event {event.get('name')} (closest distance: {distance})")
+        return None, "Face not recognized"
+    
+    student = await user_collection.find_one(
+        {"_id": ObjectId(student_id)},
+        {"first_name": 1, "last_name": 1, "name": 1, "id_number": 1}
+    )
+    first_name = student.get("first_name", "") if student else ""
+    last_name = student.get("last_name", "") if student else ""
+    student_name = f"{first_name} {last_name}".strip() or (student.get("name", "Unknown") if student else "Unknown")
+    
+    result = {
+        "student_id": student_id,
+        "student_name": student_name,
+        "student_id_number": student.get("id_number", "N/A") if student else "N/A",
+        "distance": round(distance, 4)
+    }
+    
+    attendance, _ = await _upsert_check_in(student_id, event_id, {
+        "check_in_time": now,
+        "check_in_status": "Present",
+        "timestamp": now,
+        "status": "Present"
+    })
+    if not attendance:
+        result["attendance"] = serialize_doc(await attendance_collection.find_one({
+            "student_id": student_id,
+            "event_id": event_id
+        }))
+        return result, "Already checked in"
+    
+    print(f"[KIOSK] {student_name} checked in to {event.get('name')} (distance {distance:.3f})")
+    result["attendance"] = serialize_doc(attendance)
+    return result, "Checked in successfully"
+
+async def group_check_in(teacher_id: str, event_id: ObjectId, images: list, user_lat: float = None, user_lon: float = None):
+    """Check in every recognized student from one or more group photos"""
+    event = await event_cache.get(event_id)
+    if not event:
+        return None, "Event not found"
+    
+    if not await _is_event_staff(teacher_id, event):
+        return None, "You are not approved in this event's department"
+    
+    now = datetime.now()
+    window_error = _check_in_window_error(event, now)
+    if window_error:
+        return None, window_error
+    
+    if user_lat is not None and user_lon is not None:
+        if not geofence.check_event(event, user_lat, user_lon)[0]:
+            return None, "Out of Range"
+    
+    # Encode all photos in parallel in the face pool, then match every face
+    # against the roster in one batched distance computation
+    per_photo = await asyncio.gather(*[
+        face_pool.run(face_pool.encode_faces, image_bytes, GROUP_IMAGE_MAX_SIDE, timeout=GROUP_PHOTO_JOB_TIMEOUT)
+        for image_bytes in images
+    ])
+    encodings = [encoding for photo in per_photo for encoding in photo]
+    if not encodings:
+        return None, "No faces found in the photos"
+    
+    roster = await roster_matrix.get_roster(event)
+    matches = roster_matrix.identify_many(roster, encodings, face_pool.FACE_MATCH_TOLERANCE)
+    
+    # A student may appear in several photos; keep their closest match
+    matched = {}
+    unrecognized = 0
+    for student_id, distance in matches:
+        if not student_id:
+            unrecognized += 1
+        elif student_id not in matched or distance < matched[student_id]:
+            matched[student_id] = distance
+    
+    already_checked_in = []
+    operations = []
+    operation_students = []
+    if matched:
+        async for record in attendance_collection.find(
+            {"event_id": event_id, "student_id": {"$in": list(matched.keys())}, "check_in_time": {"$ne": None}},
+            {"student_id": 1}
+        ):
+            already_checked_in.append(record["student_id"])
+        
+        for student_id in matched:
+            if student_id in already_checked_in:
+                continue
+            # Same conditional upsert as a single check-in
+            operations.append(UpdateOne(
+                {"student_id": student_id, "event_id": event_id, "check_in_time": None},
+                {"$set": {
+                    "check_in_time": now,
+                    "check_in_status": "Present",
+                    "timestamp": now,
+                    "status": "Present"
+                }},
+                upsert=True
+            ))
+            operation_students.append(student_id)
+    
+    if operations:
+        try:
+            await attendance_collection.bulk_write(operations, ordered=False)
+        except BulkWriteError as e:
+            # Students checked in by someone else in the meantime
+            for error in e.details.get("writeErrors", []):
+                if error.get("code") != 11000:
+                    raise
+                already_checked_in.append(operation_students[error["index"]])
+    
+    # Resolve names for the response in a single query
+    names = {}
+    if matched:
+        async for student in user_collection.find(
+            {"_id": {"$in": [ObjectId(student_id) for student_id in matched]}},
+            {"first_name": 1, "last_name": 1, "name": 1, "id_number": 1}
+        ):
+            full_name = f"{student.get('first_name', '')} {student.get('last_name', '')}".strip()
+            names[str(student["_id"])] = {
+                "student_name": full_name or student.get("name", "Unknown"),
+                "student_id_number": student.get("id_number", "N/A")
+            }
+    
+    students = []
+    for student_id, distance in matched.items():
+        students.append({
+            "student_id": student_id,
+            **names.get(student_id, {"student_name": "Unknown", "student_id_number": "N/A"}),
+            "distance": round(distance, 4),
+            "status": "Already checked in" if student_id in already_checked_in else "Checked in"
+        })
+    
+    checked_in = len(matched) - len(already_checked_in)
+    print(f"[GROUP CHECK-IN] {event.get('name')}: {len(encodings)} face(s), {len(matched)} matched, "
+          f"{checked_in} checked in, {unrecognized} unrecognized")
+    
+    return {
+        "faces_detected": len(encodings),
+        "matched": len(matched),
+        "checked_in": checked_in,
+        "already_checked_in": len(already_checked_in),
+        "unrecognized": unrecognized,
+        "students": students
+    }, "Group check-in completed"
+
+def _timestamp(value):
+    return value.timestamp() if value else np.nan
+
+async def offline_batch(submitter_id: str, role: str, records: list, key_event_id: str, key_issued_at: int):
+    """Validate and record a batch of offline check-ins/check-outs.
+
+    `records` holds OfflineRecord instances, or error strings for entries that
+    failed validation. Records must be for the signing key's event and captured
+    after the key was issued. Every record is checked against its event's
+    window (at capture time) and geofence in one vectorized pass. Accepted
+    records are written with a single unordered bulk_write as pending
+    verification, since nothing but the device vouches for them. Returns one
+    result per record, in input order.
+    """
+    now = datetime.now()
+    results = [
+        {"index": i, "client_id": getattr(r, "client_id", None), "status": "rejected", "message": r if isinstance(r, str) else None}
+        for i, r in enumerate(records)
+    ]
+    candidates = [i for i, r in enumerate(records) if not isinstance(r, str)]
+    
+    def reject(i, message):
+        results[i]["message"] = message
+        candidates.remove(i)
+    
+    # Resolve events (cached) and, for teachers, the departments they may record for
+    events = {}
+    for event_id in {records[i].event_id for i in candidates}:
+        if ObjectId.is_valid(event_id):
+            events[event_id] = await event_cache.get(ObjectId(event_id))
+    
+    staff_departments = set()
+    if role == "teacher":
+        from backend.database.connection import enrollment_collection
+        async for enrollment in enrollment_collection.find(
+            {"user_id": submitter_id, "status": "approved"},
+            {"department_id": 1}
+        ):
+            staff_departments.add(str(enrollment["department_id"]))
+    
+    for i in list(candidates):
+        record = records[i]
+        event = events.get(record.event_id)
+        if record.event_id != key_event_id:
+            reject(i, "Record is for a different event than the signing key")
+        elif not event:
+            reject(i, "Event not found")
+        elif role == "student" and record.student_id not in (None, submitter_id):
+            reject(i, "Students can only submit their own records")
+        elif role == "teacher" and (not record.student_id or not ObjectId.is_valid(record.student_id)):
+            reject(i, "student_id is required")
+        elif role == "teacher" and str(event.get("department_id")) not in staff_departments:
+            reject(i, "You are not approved in this event's department")
+    
+    # Teachers may only record students on the event's roster: approved in its
+    # department and registered as students, checked with one query each
+    if role == "teacher" and candidates:
+        from backend.database.connection import enrollment_collection
+        student_ids = list({records[i].student_id for i in candidates})
+        department_ids = list({str(events[records[i].event_id].get("department_id")) for i in candidates})
+        students = set()
+        async for user in user_collection.find(
+            {"_id": {"$in": [ObjectId(student_id) for student_id in student_ids]}, "role": "student"},
+            {"_id": 1}
+        ):
+            students.add(str(user["_id"]))
+        rostered = set()
+        async for enrollment in enrollment_collection.find(
+            {"user_id": {"$in": list(students)}, "department_id": {"$in": department_id_values(department_ids)}, "status": "approved"},
+            {"user_id": 1, "department_id": 1}
+        ):
+            rostered.add((str(enrollment["user_id"]), str(enrollment["department_id"])))
+        for i in list(candidates):
+            if (records[i].student_id, str(events[records[i].event_id].get("department_id"))) not in rostered:
+                reject(i, "Student is not enrolled in this event's department")
+    
+    if candidates:
+        # Capture time and window checks for every record at once
+        captured = np.array([records[i].captured_at.timestamp() for i in candidates])
+        windows = [
+            (_check_in_window if records[i].action == "check_in" else _check_out_window)(events[records[i].event_id])
+            for i in candidates
+        ]
+        starts = np.array([_timestamp(start) for start, _ in windows])
+        ends = np.array([_timestamp(end) for _, end in windows])
+        
+        too_new = captured > now.timestamp() + OFFLINE_CLOCK_SKEW_SECONDS
+        too_old = captured < now.timestamp() - OFFLINE_MAX_AGE_HOURS * 3600
+        before_key = captured < key_issued_at - OFFLINE_CLOCK_SKEW_SECONDS
+        too_early = ~np.isnan(starts) & (captured < starts)
+        too_late = ~np.isnan(ends) & (captured > ends)
+        
+        # Geofence checks: circles in one haversine matrix, polygons per event
+        lats = np.array([records[i].latitude for i in candidates])
+        lons = np.array([records[i].longitude for i in candidates])
+        inside = np.zeros(len(candidates), dtype=bool)
+        
+        circle_ids = [event_id for event_id, event in events.items() if event and not event.get("geofence")]
+        rows = np.array([k for k, i in enumerate(candidates) if records[i].event_id in circle_ids], dtype=int)
+        if rows.size:
+            column = {event_id: c for c, event_id in enumerate(circle_ids)}
+            within, _ = geofence.check_circles_batch(
+                lats[rows], lons[rows],
+                [events[e]["latitude"] for e in circle_ids],
+                [events[e]["longitude"] for e in circle_ids],
+                [events[e]["radius"] for e in circle_ids]
+            )
+            columns = np.array([column[records[candidates[k]].event_id] for k in rows])
+            inside[rows] = within[np.arange(rows.size), columns]
+        
+        for event_id, event in events.items():
+            if event and event.get("geofence"):
+                rows = np.array([k for k, i in enumerate(candidates) if records[i].event_id == event_id], dtype=int)
+                if rows.size:
+                    inside[rows] = geofence.contains_many(geofence.prepared_for(event), lats[rows], lons[rows])
+        
+        for k, i in enumerate(list(candidates)):
+            if too_new[k]:
+                reject(i, "Capture time is in the future")
+            elif too_old[k]:
+                reject(i, "Record is too old to submit")
+            elif before_key[k]:
+                reject(i, "Captured before the signing key was issued")
+            elif too_early[k]:
+                reject(i, "Captured before the " + ("check-in" if records[i].action == "check_in" else "check-out") + " window opened")
+            elif too_late[k]:
+                reject(i, "Captured after the " + ("check-in" if records[i].action == "check_in" else "check-out") + " window closed")
+            elif not inside[k]:
+                reject(i, "Out of Range")
+    
+    # One operation per (student, event): a check-in and check-out captured in
+    # the same batch are written together so their order cannot be swapped
+    pairs = {}
+    for i in sorted(candidates, key=lambda i: records[i].captured_at):
+        record = records[i]
+        key = (record.student_id or submitter_id, record.event_id)
+        pair = pairs.setdefault(key, {})
+        if record.action in pair:
+            results[i]["message"] = "Duplicate record in batch"
+            continue
+        if record.action == "check_in" and "check_out" in pair:
+            results[i]["message"] = "Captured after a check-out in the same batch"
+            continue
+        pair[record.action] = i
+    
+    operations = []
+    owners = []
+    keys = []
+    for (student_id, event_id), pair in pairs.items():
+        fields = {}
+        if "check_in" in pair:
+            record = records[pair["check_in"]]
+            fields.update({
+                "check_in_time": record.captured_at,
+                "check_in_status": "Pending",
+                "check_in_source": "offline",
+                "check_in_photo_ref": record.photo_ref,
+                "timestamp": record.captured_at,
+                "status": "Pending"
+            })
+        if "check_out" in pair:
+            record = records[pair["check_out"]]
+            fields.update({
+                "check_out_time": record.captured_at,
+                "check_out_status": "Pending",
+                "check_out_source": "offline",
+                "check_out_photo_ref": record.photo_ref
+            })
+        
+        record_filter = {"student_id": student_id, "event_id": ObjectId(event_id)}
+        if "check_in" in pair:
+            record_filter["check_in_time"] = None
+            operations.append(UpdateOne(record_filter, {"$set": fields}, upsert=True))
+        else:
+            record_filter.update({"check_in_time": {"$ne": None}, "check_out_time": None, **CHECK_OUT_ALLOWED_FILTER})
+            operations.append(UpdateOne(record_filter, {"$set": fields}))
+        owners.append(pair)
+        keys.append((student_id, ObjectId(event_id)))
+    
+    failed = {}
+    details = {}
+    if operations:
+        try:
+            details = (await attendance_collection.bulk_write(operations, ordered=False)).bulk_api_result
+        except BulkWriteError as e:
+            details = e.details
+            for error in details.get("writeErrors", []):
+                if error.get("code") != 11000:
+                    raise
+                failed[error["index"]] = "Already checked in"
+    
+    # Non-upsert check-outs that matched nothing are found with one read
+    upserted = {entry["index"] for entry in details.get("upserted", [])}
+    check_outs_only = [k for k, pair in enumerate(owners) if "check_in" not in pair and k not in failed]
+    expected_matches = len(operations) - len(failed) - len(upserted)
+    if check_outs_only and details.get("nMatched", 0) != expected_matches:
+        check_out_times = {}
+        async for attendance in attendance_collection.find(
+            {"$or": [{"student_id": keys[k][0], "event_id": keys[k][1]} for k in check_outs_only]},
+            {"student_id": 1, "event_id": 1, "check_out_time": 1}
+        ):
+            check_out_times[(attendance["student_id"], attendance["event_id"])] = attendance.get("check_out_time")
+        for k in check_outs_only:
+            record = records[owners[k]["check_out"]]
+            if not _same_instant(check_out_times.get(keys[k]), record.captured_at):
+                failed[k] = "Not checked in, or already checked out"
+    
+    for k, pair in enumerate(owners):
+        for action, i in pair.items():
+            if k in failed:
+                results[i]["message"] = failed[k]
+            else:
+                results[i]["status"] = "recorded"
+                results[i]["message"] = ("Checked in" if action == "check_in" else "Checked out") + ", pending verification"
+    
+    recorded_count = sum(1 for r in results if r["status"] == "recorded")
+    print(f"[OFFLINE] Batch from {submitter_id}: {len(records)} record(s), {recorded_count} recorded, "
+          f"{len(operations)} write(s) in one bulk_write")
+    return results
+
+# Check-in and check-out fields an offline record adds, cleared when it is rejected
+OFFLINE_CHECK_IN_FIELDS = ["check_in_time", "check_in_status", "check_in_source", "check_in_photo_ref"]
+OFFLINE_CHECK_OUT_FIELDS = ["check_out_time", "check_out_status", "check_out_source", "check_out_photo_ref"]
+
+def _offline_pending(record: dict) -> bool:
+    return any(
+        record.get(f"{action}_source") == "offline" and record.get(f"{action}_status") == "Pending"
+        for action in ("check_in", "check_out")
+    )
+
+async def review_offline_attendance(reviewer_id: str, event_id: ObjectId, student_ids: list, approve: bool):
+    """Approve or reject students' offline records that are pending review.
+
+    Approved check-ins and check-outs become Present. A rejected check-in is
+    cleared together with its check-out and the student is Absent, so they can
+    still check in online; a rejected check-out alone is cleared. Returns
+    ({"check_ins", "check_outs"} reviewed, message), or (None, error).
+    """
+    event = await event_cache.get(event_id)
+    if not event:
+        return None, "Event not found"
+    if not await _is_event_staff(reviewer_id, event):
+        return None, "You are not approved in this event's department"
+    
+    now = datetime.now()
+    pending = {"event_id": event_id, "student_id": {"$in": list(student_ids)}}
+    pending_check_in = {**pending, "check_in_source": "offline", "check_in_status": "Pending"}
+    pending_check_out = {**pending, "check_out_source": "offline", "check_out_status": "Pending"}
+    
+    if approve:
+        check_ins = await attendance_collection.update_many(pending_check_in, {"$set": {
+            "check_in_status": "Present",
+            "status": "Present",
+            "check_in_reviewed_by": reviewer_id,
+            "check_in_reviewed_at": now
+        }})
+        check_outs = await attendance_collection.update_many(pending_check_out, {"$set": {
+            "check_out_status": "Present",
+            "check_out_reviewed_by": reviewer_id,
+            "check_out_reviewed_at": now
+        }})
+    else:
+        check_ins = await attendance_collection.update_many(pending_check_in, {
+            "$set": {"status": "Absent", "check_in_reviewed_by": reviewer_id, "check_in_reviewed_at": now},
+            "$unset": {field: "" for field in OFFLINE_CHECK_IN_FIELDS + OFFLINE_CHECK_OUT_FIELDS}
+        })
+        check_outs = await attendance_collection.update_many(pending_check_out, {
+            "$set": {"check_out_reviewed_by": reviewer_id, "check_out_reviewed_at": now},
+            "$unset": {field: "" for field in OFFLINE_CHECK_OUT_FIELDS}
+        })
+    
+    print(f"[OFFLINE] {reviewer_id} {'approved' if approve else 'rejected'} {check_ins.modified_count} "
+          f"check-in(s) and {check_outs.modified_count} check-out(s) for event {event_id}")
+    return {"check_ins": check_ins.modified_count, "check_outs": check_outs.modified_count}, \
+        "Offline records approved" if approve else "Offline records rejected"
+
+async def get_attendance_history(student_id: str, page: dict = None):
+    """Get one page of a student's attendance history with event names and society/department.
+
+    Returns (history, next_cursor).
+    """
     from backend.database.connection import department_collection
     
+    records, next_cursor = await pagination.fetch(attendance_collection, {"student_id": student_id}, page)
     history = []
-    async for record in attendance_collection.find({"student_id": student_id}):
+    for record in records:
         # Get event details to include event name and department
         event_id = record.get("event_id")
         event_name = "Unknown Event"
@@ -264,26 +863,107 @@ async def get_attendance_history(student_id: str):
         record_data["department_name"] = department_name
         history.append(record_data)
     
-    return history
+    return history, next_cursor
 
-async def get_attendance_status(student_id: str, event_id: ObjectId):
-    """Check if a student has checked in/out for an event"""
-    attendance = await attendance_collection.find_one({
-        "student_id": student_id,
-        "event_id": event_id
-    })
-    
+async def count_attendance_history(student_id: str):
+    return await attendance_collection.count_documents({"student_id": student_id})
+
+def _status_flags(attendance):
     if not attendance:
         return {
             "has_checked_in": False,
-            "has_checked_out": False
+            "has_checked_out": False,
+            "verification_pending": False
         }
     
     return {
         "has_checked_in": bool(attendance.get("check_in_time")),
-        "has_checked_out": bool(attendance.get("check_out_time"))
+        "has_checked_out": bool(attendance.get("check_out_time")),
+        "verification_pending": "Pending" in (attendance.get("check_in_status"), attendance.get("check_out_status"))
     }
 
+async def get_attendance_status(student_id: str, event_id: ObjectId):
+    """Check if a student has checked in/out for an event"""
+    attendance = await attendance_collection.find_one({
+        "student_id": student_id,
+        "event_id": event_id
+    }, ATTENDANCE_STATUS_PROJECTION)
+    return _status_flags(attendance)
+
+async def get_attendance_statuses(student_id: str, event_ids):
+    """Check-in/out flags for many events in one query, keyed by event id string"""
+    records = await attendance_collection.find({
+        "student_id": student_id,
+        "event_id": {"$in": list(event_ids)}
+    }, ATTENDANCE_STATUS_PROJECTION).to_list(None)
+    by_event = {record["event_id"]: record for record in records}
+    return {str(event_id): _status_flags(by_event.get(event_id)) for event_id in event_ids}
+
+async def get_event_attendance_counts(event_ids):
+    """Roster totals for many events, keyed by event id string.
+
+    Counts follow get_event_attendance: the roster is every approved enrollment
+    in the event's department (or everyone with a record if the event has no
+    department), and rostered students without a record count as Absent.
+    Rosters come from one query over enrollments, and attendance is grouped
+    per event and status in one $group, so no per-record $lookup is needed
+    and the pipeline runs on MongoDB 4.x.
+    """
+    from backend.database.connection import enrollment_collection
+    
+    event_ids = list(event_ids)
+    events = await event_collection.find({"_id": {"$in": event_ids}}, {"department_id": 1}).to_list(None)
+    # Department ids are compared as strings; some events store them as ObjectIds
+    departments = {event["_id"]: str(event["department_id"]) if event.get("department_id") else None for event in events}
+    
+    department_ids = [d for d in set(departments.values()) if d]
+    rosters = {department_id: set() for department_id in department_ids}
+    async for enrollment in enrollment_collection.find(
+        {"status": "approved", "department_id": {"$in": department_id_values(department_ids)}},
+        {"user_id": 1, "department_id": 1}
+    ):
+        rosters[str(enrollment["department_id"])].add(str(enrollment["user_id"]))
+    
+    counted = {event_id: {"records": 0, "present": 0, "absent": 0, "pending": 0, "checked_out": 0} for event_id in departments}
+    async for row in attendance_collection.aggregate([
+        {"$match": {"event_id": {"$in": list(departments)}}},
+        {"$group": {
+            "_id": {
+                "event_id": "$event_id",
+                "status": {"$ifNull": ["$status", "Absent"]},
+                "checked_out": {"$cond": [{"$ifNull": ["$check_out_time", False]}, True, False]},
+            },
+            "students": {"$push": "$student_id"},
+        }},
+    ]):
+        event_id = row["_id"]["event_id"]
+        roster = rosters.get(departments[event_id])
+        # Records of students who are no longer enrolled are not on the roster
+        records = len(row["students"]) if roster is None else sum(1 for s in row["students"] if s in roster)
+        totals = counted[event_id]
+        totals["records"] += records
+        if row["_id"]["status"] in ("Present", "Absent", "Pending"):
+            totals[row["_id"]["status"].lower()] += records
+        if row["_id"]["checked_out"]:
+            totals["checked_out"] += records
+    
+    counts = {}
+    for event_id in event_ids:
+        if event_id not in departments:
+            continue
+        row = counted[event_id]
+        department_id = departments[event_id]
+        total = len(rosters[department_id]) if department_id else row["records"]
+        counts[str(event_id)] = {
+            "enrolled": total,
+            "present": row["present"],
+            "pending": row["pending"],
+            # Rostered students without a record are Absent as well
+            "absent": total - (row["records"] - row["absent"]),
+            "checked_out": row["checked_out"],
+        }
+    return counts
+
 async def get_event_attendance(event_id: ObjectId):
     """Get all attendance records for a specific event with student details
     Includes all enrolled students (Present or Absent)"""
@@ -320,6 +1000,7 @@ async def get_event_attendance(event_id: ObjectId):
                 "timestamp": record.get("timestamp"),
                 "check_in_time": record.get("check_in_time"),
                 "check_out_time": record.get("check_out_time"),
+                "offline_pending": _offline_pending(record),
                 "_id": str(record.get("_id", ""))
             }
     
@@ -327,7 +1008,7 @@ async def get_event_attendance(event_id: ObjectId):
     attendance_records = []
     for student_id, attendance_info in enrolled_students.items():
         # Get student information
-        student = await user_collection.find_one({"_id": ObjectId(student_id)})
+        student = await user_collection.find_one({"_id": ObjectId(student_id)}, WITHOUT_FACE_ENCODING)
         
         attendance_data = {
             "_id": attendance_info.get("_id", ""),
@@ -335,7 +1016,9 @@ async def get_event_attendance(event_id: ObjectId):
             "status": attendance_info["status"],
             "timestamp": attendance_info["timestamp"],
             "check_in_time": attendance_info.get("check_in_time"),
-            "check_out_time": attendance_info.get("check_out_time")
+            "check_out_time": attendance_info.get("check_out_time"),
+            # Offline check-in or check-out waiting for the teacher's review
+            "offline_pending": attendance_info.get("offline_pending", False)
         }
         
         if student:
@@ -1,13 +1,13 @@
 import bcrypt
-import face_recognition
-import numpy as np
 from backend.database.connection import user_collection
 from backend.models.user_model import User
 from backend.utils.jwt_handler import signJWT
+from backend.utils import face_pool, face_cache, roster_matrix, duplicate_faces
+from backend.utils.face_encoding import pack_encoding, ENCODING_FORMAT_VERSION, WITHOUT_FACE_ENCODING
+from backend.utils.uploads import read_upload
 from fastapi import UploadFile, HTTPException
-from fastapi.concurrency import run_in_threadpool
 from bson import ObjectId
-import io
+from pymongo import ReturnDocument
 
 def get_password_hash(password: str) -> str:
     """Hash a password using bcrypt."""
@@ -65,7 +65,7 @@ async def register_user(user_data: dict):
         print(f"   Role: {user_data.get('role')}")
         
         # Check if id_number already exists
-        existing_user = await user_collection.find_one({"id_number": user_data.get('id_number')})
+        existing_user = await user_collection.find_one({"id_number": user_data.get('id_number')}, {"_id": 1})
         if existing_user:
             raise HTTPException(
                 status_code=400,
@@ -82,7 +82,7 @@ async def register_user(user_data: dict):
         
         # Insert into database
         new_user = await user_collection.insert_one(user_data)
-        created_user = await user_collection.find_one({"_id": new_user.inserted_id})
+        created_user = await user_collection.find_one({"_id": new_user.inserted_id}, WITHOUT_FACE_ENCODING)
         
         print(f"[OK] User registered successfully: {created_user['email']} (role: {created_user['role']})")
         print(f"[OK] Stored ID Number: {created_user.get('id_number', 'NOT STORED')}")
@@ -95,7 +95,7 @@ async def login_user(email: str, password: str):
     """Authenticate a user and return a JWT token."""
     try:
         # Find user by email
-        user = await user_collection.find_one({"email": email})
+        user = await user_collection.find_one({"email": email}, WITHOUT_FACE_ENCODING)
         
         if not user:
             print(f"[ERROR] Login failed: User not found for email: {email}")
@@ -115,18 +115,17 @@ async def login_user(email: str, password: str):
         print(f"[ERROR] Login exception: {str(e)}")
         raise Exception(f"Login error: {str(e)}")
 
-def _get_face_encodings(image_bytes):
-    """Helper to run face recognition in a thread pool"""
-    image = face_recognition.load_image_file(io.BytesIO(image_bytes))
-    return face_recognition.face_encodings(image)
-
 async def register_face(user_id: str, image_file: UploadFile):
-    """Register a face for a user."""
+    """Register a face for a user.
+    
+    The whole frame is always searched so photos with no face or several
+    faces are rejected.
+    """
     try:
-        contents = await image_file.read()
+        contents = await read_upload(image_file)
         
-        # Run CPU-intensive face recognition in a separate thread
-        face_encodings = await run_in_threadpool(_get_face_encodings, contents)
+        # Run CPU-intensive face recognition in the dedicated face worker pool
+        face_encodings = await face_pool.run(face_pool.encode_faces, contents)
         
         if not face_encodings:
             return False, "No face found in the image"
@@ -134,19 +133,43 @@ async def register_face(user_id: str, image_file: UploadFile):
         if len(face_encodings) > 1:
             return False, "Multiple faces found. Please ensure only your face is visible."
             
-        # Get the first face encoding
-        face_encoding = face_encodings[0].tolist()
+        # Store the first face encoding as a compact float32 blob
+        face_encoding = pack_encoding(face_encodings[0])
         
-        # Update user
-        result = await user_collection.update_one(
+        # Update user, bumping the revision so cached copies can be told apart
+        updated = await user_collection.find_one_and_update(
             {"_id": ObjectId(user_id)},
-            {"$set": {"face_encoding": face_encoding}}
+            {
+                "$set": {
+                    "face_encoding": face_encoding,
+                    "face_encoding_format": ENCODING_FORMAT_VERSION
+                },
+                "$inc": {"face_encoding_rev": 1}
+            },
+            projection=face_cache.ENCODING_PROJECTION,
+            return_document=ReturnDocument.AFTER
         )
         
-        if result.matched_count == 0:
+        if not updated:
             return False, "User not found"
+        
+        face_cache.invalidate(user_id)
+        face_cache.put_document(updated)
+        roster_matrix.invalidate_user(user_id)
+        
+        # Flag (but still accept) a face that matches another account
+        if duplicate_faces.DUPLICATE_FACE_CHECK_ON_REGISTER:
+            duplicate_of = await duplicate_faces.check_registration(user_id, face_encodings[0])
+            await user_collection.update_one(
+                {"_id": ObjectId(user_id)},
+                {"$set": {"face_duplicate_of": duplicate_of}} if duplicate_of else {"$unset": {"face_duplicate_of": ""}}
+            )
+            if duplicate_of:
+                print(f"[WARNING] Face registered by {user_id} matches account(s): {duplicate_of}")
             
         return True, "Face registered successfully"
+    except HTTPException:
+        raise
     except Exception as e:
         print(f"Face registration error: {e}")
         return False, str(e)
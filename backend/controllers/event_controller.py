@@ -1,16 +1,34 @@
-from backend.database.connection import event_collection
+from backend.database.connection import event_collection, enrollment_collection
 from backend.models.event_model import Event
 from backend.utils.serializer import serialize_doc, serialize_list
+from backend.utils import geofence, event_cache, pagination, list_versions
 from bson import ObjectId
+from datetime import datetime
 from fastapi import HTTPException
+import os
+
+# Largest venue radius the nearby search has to account for; $geoNear measures
+# to the event center, so the search reaches this far beyond `within`
+NEARBY_EVENTS_MAX_RADIUS = float(os.getenv("NEARBY_EVENTS_MAX_RADIUS", "5000"))
+NEARBY_EVENTS_LIMIT = int(os.getenv("NEARBY_EVENTS_LIMIT", "50"))
+
+# Internal bookkeeping fields that event lists do not need to send
+EVENT_LIST_PROJECTION = {"location": 0, "geofence_rev": 0, "cache_version": 0}
 
 async def create_event(event: Event):
     event_dict = event.dict(by_alias=True, exclude_unset=True)
     # Remove any _id or id fields to let MongoDB generate them
     event_dict.pop("_id", None)
     event_dict.pop("id", None)
+    event_dict["location"] = geofence.point_geometry(event_dict["latitude"], event_dict["longitude"])
+    if event_dict.get("geofence"):
+        event_dict["geofence_rev"] = 1
     new_event = await event_collection.insert_one(event_dict)
+    await list_versions.bump(list_versions.EVENTS)
     created_event = await event_collection.find_one({"_id": new_event.inserted_id})
+    if created_event.get("geofence"):
+        # Prepare the polygon now so the first check-in does not pay for it
+        geofence.prepared_for(created_event)
     return serialize_doc(created_event)
 
 async def get_events():
@@ -19,6 +37,64 @@ async def get_events():
         events.append(event)
     return serialize_list(events)
 
+def open_events_filter(now: datetime) -> dict:
+    """Events that are active and whose check_out_end (or end_time) has not passed"""
+    return {
+        "is_active": {"$ne": False},
+        "$or": [
+            {"check_out_end": {"$gte": now}},
+            {"check_out_end": None, "end_time": {"$gte": now}},
+        ],
+    }
+
+def department_id_values(department_ids) -> list:
+    """Department ids in both stored forms, for a department_id $in filter.
+
+    Most events store department_id as a string, but some store the ObjectId.
+    """
+    department_ids = [str(d) for d in department_ids]
+    return department_ids + [ObjectId(d) for d in department_ids if ObjectId.is_valid(d)]
+
+def visible_events_filter(role: str, department_ids=None, now: datetime = None) -> dict:
+    """The MongoDB filter for the events a role may see in the event list.
+
+    Students see open events of their approved departments, teachers see every
+    event of their approved departments and admins see everything.
+    """
+    if role == "admin":
+        return {}
+    query = {"department_id": {"$in": department_id_values(department_ids or [])}}
+    if role == "student":
+        query.update(open_events_filter(now or datetime.now()))
+    return query
+
+async def visible_department_ids(role: str, user_id: str):
+    """Approved department ids for students and teachers; None for admins"""
+    if role not in ["student", "teacher"]:
+        return None
+    enrollments = await enrollment_collection.find({
+        "user_id": user_id,
+        "status": "approved"
+    }, {"department_id": 1}).to_list(None)
+    return [str(e["department_id"]) for e in enrollments]
+
+async def get_visible_event_ids(role: str, user_id: str):
+    """Ids of every event in the role's event list"""
+    query = visible_events_filter(role, await visible_department_ids(role, user_id))
+    return [event["_id"] for event in await event_collection.find(query, {"_id": 1}).to_list(None)]
+
+async def get_visible_events(role: str, department_ids=None, page: dict = None):
+    """One page of events visible to a role, filtered and projected in the database.
+
+    Returns (events, next_cursor).
+    """
+    query = visible_events_filter(role, department_ids)
+    events, next_cursor = await pagination.fetch(event_collection, query, page, EVENT_LIST_PROJECTION)
+    return serialize_list(events), next_cursor
+
+async def count_visible_events(role: str, department_ids=None):
+    return await event_collection.count_documents(visible_events_filter(role, department_ids))
+
 async def update_event(event_id: str, event_data: dict, teacher_id: str):
     """Update an event - only the teacher who created it can edit"""
     try:
@@ -34,18 +110,77 @@ async def update_event(event_id: str, event_data: dict, teacher_id: str):
         
         # Update the event
         update_data = {k: v for k, v in event_data.items() if v is not None}
+        if "latitude" in update_data and "longitude" in update_data:
+            update_data["location"] = geofence.point_geometry(update_data["latitude"], update_data["longitude"])
+        # An explicit null geofence removes the polygon and falls back to the radius
+        clear_geofence = "geofence" in event_data and event_data["geofence"] is None
         
-        if update_data:
+        if update_data or clear_geofence:
+            # cache_version tells other workers' event caches to reload
+            update = {"$inc": {"cache_version": 1}}
+            if update_data:
+                update["$set"] = update_data
+            if clear_geofence:
+                update["$unset"] = {"geofence": ""}
+            if "geofence" in event_data:
+                update["$inc"]["geofence_rev"] = 1
             await event_collection.update_one(
                 {"_id": ObjectId(event_id)},
-                {"$set": update_data}
+                update
             )
+            event_cache.invalidate(existing_event["_id"])
+            await list_versions.bump(list_versions.EVENTS)
         
         # Return updated event
         updated_event = await event_collection.find_one({"_id": ObjectId(event_id)})
+        if "geofence" in event_data:
+            geofence.invalidate(updated_event["_id"])
+            if updated_event.get("geofence"):
+                geofence.prepared_for(updated_event)
         return serialize_doc(updated_event)
         
     except Exception as e:
         if isinstance(e, HTTPException):
             raise e
         raise HTTPException(status_code=400, detail=str(e))
+
+async def get_nearby_events(latitude: float, longitude: float, within: float, department_ids=None):
+    """Active, open events whose geofence contains the point or is within `within` meters.
+
+    department_ids limits the search to those departments (None means all).
+    The database does the geo search via $geoNear on the 2dsphere index; only
+    the handful of candidates it returns are checked against their geofence.
+    """
+    query = open_events_filter(datetime.now())
+    if department_ids is not None:
+        query["department_id"] = {"$in": department_id_values(department_ids)}
+
+    pipeline = [
+        {"$geoNear": {
+            "near": geofence.point_geometry(latitude, longitude),
+            "distanceField": "distance",
+            "maxDistance": within + NEARBY_EVENTS_MAX_RADIUS,
+            "query": query,
+            "spherical": True,
+        }},
+        # Circle geofences can be settled in the database: the edge is `radius` from the center
+        {"$match": {"$or": [
+            {"geofence": {"$exists": True, "$ne": None}},
+            {"$expr": {"$lte": [{"$subtract": ["$distance", "$radius"]}, within]}},
+        ]}},
+        {"$limit": NEARBY_EVENTS_LIMIT},
+    ]
+
+    events = []
+    async for event in event_collection.aggregate(pipeline):
+        if event.get("geofence"):
+            inside, edge_distance = geofence.check_event(event, latitude, longitude)
+            if edge_distance > within:
+                continue
+        else:
+            edge_distance = max(event["distance"] - event["radius"], 0.0)
+            inside = event["distance"] <= event["radius"]
+        event["inside"] = inside
+        event["distance"] = round(edge_distance, 1)
+        events.append(event)
+    return serialize_list(events)
@@ -0,0 +1,166 @@
+"""Background face verification for provisional check-ins and check-outs.
+
+In async mode check_in/check_out validate the time window and geofence, write
+the attendance record with a "Pending" status and hand the face match to
+submit(). The job runs in the face pool after the HTTP response has been sent;
+a match promotes the record to "Present", a mismatch rolls it back to exactly
+what it was before the submission.
+
+Jobs live in the face_verifications collection so any worker can answer status
+polls, and jobs orphaned by a restart are rolled back by sweep_stale().
+"""
+import asyncio
+import os
+from datetime import datetime, timedelta
+
+from bson import ObjectId
+from fastapi import HTTPException
+
+from backend.database.connection import attendance_collection, verification_collection
+from backend.utils import face_pool
+
+FACE_VERIFY_STALE_SECONDS = int(os.getenv("FACE_VERIFY_STALE_SECONDS", "120"))
+FACE_VERIFY_BUSY_RETRIES = int(os.getenv("FACE_VERIFY_BUSY_RETRIES", "3"))
+
+# Attendance fields each action writes, captured before the write for rollback
+ROLLBACK_FIELDS = {
+    "check_in": ["check_in_time", "check_in_status", "timestamp", "status"],
+    "check_out": ["check_out_time", "check_out_status"],
+}
+
+# Keep references so pending tasks are not garbage collected mid-flight
+_tasks = set()
+
+async def submit(student_id: str, event_id: ObjectId, action: str, attendance_id: ObjectId,
+                 previous: dict, known_encoding, face_image_bytes: bytes, face_box=None) -> str:
+    """Record a pending verification job and start it in the background.
+
+    `previous` is the attendance document as it was before the provisional
+    write, or None if the write created it.
+    """
+    job = {
+        "student_id": student_id,
+        "event_id": event_id,
+        "action": action,
+        "attendance_id": attendance_id,
+        "created": previous is None,
+        "previous": {field: previous.get(field) for field in ROLLBACK_FIELDS[action]} if previous else None,
+        "state": "pending",
+        "message": "Face verification in progress",
+        "submitted_at": datetime.now(),
+        "finished_at": None,
+    }
+    result = await verification_collection.insert_one(job)
+    job["_id"] = result.inserted_id
+
+    task = asyncio.create_task(_run(job, known_encoding, face_image_bytes, face_box))
+    _tasks.add(task)
+    task.add_done_callback(_tasks.discard)
+    return str(job["_id"])
+
+async def _run(job: dict, known_encoding, face_image_bytes: bytes, face_box):
+    is_match = False
+    message = "Face verification failed. Face does not match registered user."
+    for attempt in range(FACE_VERIFY_BUSY_RETRIES + 1):
+        try:
+            is_match = await face_pool.run(face_pool.verify_face, known_encoding, face_image_bytes, face_box)
+            break
+        except HTTPException as e:
+            # Pool is saturated; wait as it asks before giving up on the job
+            message = e.detail
+            await asyncio.sleep(face_pool.FACE_POOL_RETRY_AFTER * (attempt + 1))
+        except Exception as e:
+            message = f"Face verification error: {str(e)}"
+            break
+
+    try:
+        if is_match:
+            if await _promote(job):
+                await _finish(job, "verified", "Face verified")
+            else:
+                # The pending record was swept or changed before the match finished
+                await _finish(job, "failed", "Face verification expired. Please try again.")
+        else:
+            await _rollback(job)
+            await _finish(job, "failed", message)
+    except Exception as e:
+        print(f"[VERIFY] Failed to finalize job {job['_id']}: {str(e)}")
+
+async def _promote(job: dict) -> int:
+    """Mark the pending record present; returns the number of records matched"""
+    action = job["action"]
+    update = {f"{action}_status": "Present", f"{action}_verification": "verified"}
+    if action == "check_in":
+        update["status"] = "Present"
+    result = await attendance_collection.update_one(
+        {"_id": job["attendance_id"], f"{action}_status": "Pending"},
+        {"$set": update}
+    )
+    if result.matched_count:
+        print(f"[VERIFY] {action} verified for student {job['student_id']}")
+    else:
+        print(f"[VERIFY] {action} for student {job['student_id']} is no longer pending")
+    return result.matched_count
+
+async def _rollback(job: dict):
+    action = job["action"]
+    pending_filter = {"_id": job["attendance_id"], f"{action}_status": "Pending"}
+
+    if job["created"]:
+        await attendance_collection.delete_one(pending_filter)
+    else:
+        previous = job.get("previous") or {}
+        restore = {k: v for k, v in previous.items() if v is not None}
+        remove = {k: "" for k, v in previous.items() if v is None}
+        update = {}
+        if restore:
+            update["$set"] = restore
+        if remove:
+            update["$unset"] = remove
+        if update:
+            await attendance_collection.update_one(pending_filter, update)
+    print(f"[VERIFY] {action} rolled back for student {job['student_id']}")
+
+async def _finish(job: dict, state: str, message: str):
+    await verification_collection.update_one(
+        {"_id": job["_id"]},
+        {"$set": {"state": state, "message": message, "finished_at": datetime.now()}}
+    )
+
+async def get_job(job_id: str, student_id: str):
+    """Return a student's verification job status, or None if not found"""
+    if not ObjectId.is_valid(job_id):
+        return None
+    job = await verification_collection.find_one({"_id": ObjectId(job_id), "student_id": student_id})
+    if not job:
+        return None
+    return {
+        "verification_id": str(job["_id"]),
+        "event_id": str(job["event_id"]),
+        "action": job["action"],
+        "state": job["state"],
+        "message": job["message"],
+        "submitted_at": job["submitted_at"],
+        "finished_at": job.get("finished_at"),
+    }
+
+async def sweep_stale():
+    """Roll back jobs whose owning process died before finishing them"""
+    cutoff = datetime.now() - timedelta(seconds=FACE_VERIFY_STALE_SECONDS)
+    swept = 0
+    async for job in verification_collection.find({"state": "pending", "submitted_at": {"$lt": cutoff}}):
+        await _rollback(job)
+        await _finish(job, "failed", "Face verification was interrupted. Please try again.")
+        swept += 1
+    if swept:
+        print(f"[VERIFY] Rolled back {swept} stale verification job(s)")
+
+async def sweep_loop():
+    while True:
+        try:
+            await sweep_stale()
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            print(f"[VERIFY] Sweep error: {str(e)}")
+        await asyncio.sleep(FACE_VERIFY_STALE_SECONDS)
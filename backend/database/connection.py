@@ -22,4 +22,6 @@ event_collection = database.get_collection("events")
 attendance_collection = database.get_collection("attendance")
 department_collection = database.get_collection("departments")
 enrollment_collection = database.get_collection("enrollments")
-
+verification_collection = database.get_collection("face_verifications")
+idempotency_collection = database.get_collection("idempotency_keys")
+list_version_collection = database.get_collection("list_versions")
@@ -0,0 +1,84 @@
+"""Index definitions, created once at application startup"""
+from pymongo.errors import OperationFailure
+
+from backend.database.connection import (
+    attendance_collection, database, enrollment_collection, event_collection,
+    idempotency_collection, verification_collection,
+)
+from backend.utils.idempotency import IDEMPOTENCY_TTL_SECONDS
+
+# Finished face verification jobs are kept for a day for status polling
+VERIFICATION_RETENTION_SECONDS = 24 * 3600
+
+# Duplicate attendance rows removed before the unique index is built are kept here
+attendance_duplicates_collection = database.get_collection("attendance_duplicates")
+
+class MissingIndexError(RuntimeError):
+    """An index that correctness depends on could not be created"""
+
+async def dedupe_attendance() -> int:
+    """Keep one attendance record per (student_id, event_id) and archive the rest.
+
+    The kept record is the most complete one: checked out over checked in over
+    neither, then the oldest. Returns the number of records removed.
+    """
+    removed = 0
+    async for group in attendance_collection.aggregate([
+        {"$group": {"_id": {"student_id": "$student_id", "event_id": "$event_id"}, "ids": {"$push": "$_id"}, "count": {"$sum": 1}}},
+        {"$match": {"count": {"$gt": 1}}},
+    ], allowDiskUse=True):
+        records = await attendance_collection.find({"_id": {"$in": group["ids"]}}).to_list(None)
+        records.sort(key=lambda r: (not r.get("check_out_time"), not r.get("check_in_time"), r["_id"]))
+        duplicates = records[1:]
+        await attendance_duplicates_collection.insert_many(
+            [{**record, "kept_id": records[0]["_id"]} for record in duplicates]
+        )
+        await attendance_collection.delete_many({"_id": {"$in": [record["_id"] for record in duplicates]}})
+        removed += len(duplicates)
+    if removed:
+        print(f"[WARNING] Archived {removed} duplicate attendance record(s) to attendance_duplicates")
+    return removed
+
+async def _create(collection, keys, **kwargs) -> bool:
+    try:
+        await collection.create_index(keys, **kwargs)
+        return True
+    except OperationFailure as e:
+        print(f"[WARNING] Could not create index {keys} on {collection.name}: {str(e)}")
+        return False
+
+async def ensure_indexes():
+    """Create the indexes the application relies on (no-op if they exist).
+
+    Each index is created on its own, so one failure does not skip the rest.
+    Raises MissingIndexError if the unique attendance index cannot be built,
+    since check-in upserts rely on it to reject concurrent duplicates.
+    """
+    # One attendance record per student and event; check-in upserts rely on it
+    unique_attendance = [("student_id", 1), ("event_id", 1)]
+    if not await _create(attendance_collection, unique_attendance, unique=True):
+        # Legacy duplicates block the build; archive them and try once more
+        await dedupe_attendance()
+        if not await _create(attendance_collection, unique_attendance, unique=True):
+            raise MissingIndexError("Unique (student_id, event_id) attendance index is missing")
+
+    # Per-event rosters and attendance totals
+    await _create(attendance_collection, [("event_id", 1), ("status", 1)])
+    await _create(enrollment_collection, [("department_id", 1), ("status", 1)])
+    await _create(enrollment_collection, [("user_id", 1), ("department_id", 1), ("status", 1)])
+    await _create(idempotency_collection, "created_at", expireAfterSeconds=IDEMPOTENCY_TTL_SECONDS)
+    await _create(verification_collection, "finished_at", expireAfterSeconds=VERIFICATION_RETENTION_SECONDS)
+    await _create(verification_collection, [("state", 1), ("submitted_at", 1)])
+
+    # Events created before GeoJSON locations were stored get one derived
+    # from their latitude/longitude so the 2dsphere index covers them
+    backfill = await event_collection.update_many(
+        {"location": {"$exists": False}, "latitude": {"$type": "number"}, "longitude": {"$type": "number"}},
+        [{"$set": {"location": {"type": "Point", "coordinates": ["$longitude", "$latitude"]}}}]
+    )
+    if backfill.modified_count:
+        print(f"[OK] Added GeoJSON location to {backfill.modified_count} event(s)")
+    await _create(event_collection, [("location", "2dsphere")])
+    # Event list visibility: department_id $in plus the check_out_end / end_time deadline
+    await _create(event_collection, [("department_id", 1), ("check_out_end", 1), ("end_time", 1)])
+    print("[OK] Database indexes ensured")
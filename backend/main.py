@@ -1,4 +1,5 @@
 import sys
+import asyncio
 from pathlib import Path
 from contextlib import asynccontextmanager
 
@@ -9,6 +10,9 @@ from fastapi import FastAPI
 from backend.routes import auth_routes, event_routes, attendance_routes, admin_routes, enrollment_routes
 from fastapi.middleware.cors import CORSMiddleware
 from backend.database.connection import client
+from backend.database.indexes import ensure_indexes, MissingIndexError
+from backend.controllers import verification_controller
+from backend.utils import face_pool, face_cache, event_cache, attendance_writer, admission, pagination
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
@@ -30,9 +34,35 @@ async def lifespan(app: FastAPI):
         print("⚠️  Make sure MongoDB is running and accessible")
         print("="*60 + "\n")
     
+    try:
+        await ensure_indexes()
+    except MissingIndexError as e:
+        # Check-ins would silently create duplicate records without it
+        print(f"[ERROR] {str(e)}; refusing to start")
+        raise
+    except Exception as e:
+        print(f"[WARNING] Could not ensure indexes: {str(e)}")
+    
+    # Spawn face recognition workers up front so the dlib models are loaded
+    # before the first check-in arrives
+    face_pool.start()
+    
+    # Preload face encodings for events whose check-in is about to open
+    warmup_task = None
+    if face_cache.FACE_CACHE_WARMUP_LEAD_MINUTES > 0:
+        warmup_task = asyncio.create_task(face_cache.warmup_loop())
+    
+    # Roll back provisional check-ins whose background verification was lost
+    sweep_task = asyncio.create_task(verification_controller.sweep_loop())
+    
     yield
     
     # Shutdown
+    sweep_task.cancel()
+    if warmup_task:
+        warmup_task.cancel()
+    await attendance_writer.drain()
+    face_pool.shutdown()
     client.close()
     print("\n✋ Database connection closed")
 
@@ -56,6 +86,8 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    # Let the browser read the keyset cursor and ETag of list responses
+    expose_headers=[pagination.NEXT_CURSOR_HEADER, "ETag"],
 )
 
 app.include_router(auth_routes.router, tags=["Authentication"])
@@ -80,13 +112,23 @@ async def health_check():
         return {
             "status": "healthy",
             "database": "connected",
-            "service": "running"
+            "service": "running",
+            "face_pool": face_pool.stats(),
+            "face_cache": face_cache.stats(),
+            "event_cache": event_cache.stats(),
+            "attendance_writer": attendance_writer.stats(),
+            "admission": admission.stats()
         }
     except Exception as e:
         return {
             "status": "unhealthy",
             "database": "disconnected",
             "service": "running",
+            "face_pool": face_pool.stats(),
+            "face_cache": face_cache.stats(),
+            "event_cache": event_cache.stats(),
+            "attendance_writer": attendance_writer.stats(),
+            "admission": admission.stats(),
             "error": str(e)
         }
 
@@ -1,6 +1,6 @@
-from pydantic import BaseModel, Field, ConfigDict
+from pydantic import BaseModel, Field, ConfigDict, field_validator
 from datetime import datetime
-from typing import Optional
+from typing import Optional, Literal
 from .user_model import PyObjectId
 from bson import ObjectId
 
@@ -23,3 +23,41 @@ class Attendance(BaseModel):
 
 class AttendanceInDB(Attendance):
     pass
+
+class OfflineRecord(BaseModel):
+    """One check-in or check-out captured while the device was offline"""
+    client_id: Optional[str] = None          # Client-side id echoed back in the results
+    event_id: str
+    action: Literal["check_in", "check_out"]
+    student_id: Optional[str] = None         # Required when a teacher submits for students
+    captured_at: datetime                    # Local time the record was captured on the device
+    latitude: float = Field(ge=-90, le=90)
+    longitude: float = Field(ge=-180, le=180)
+    photo_ref: Optional[str] = None          # Client reference to a photo taken at capture time
+    
+    @field_validator('captured_at', mode='before')
+    @classmethod
+    def parse_captured_at(cls, v):
+        # Same convention as event times: keep the device's local wall-clock time
+        if isinstance(v, str):
+            v = datetime.fromisoformat(v.rstrip('Z'))
+        if isinstance(v, datetime) and v.tzinfo:
+            v = v.replace(tzinfo=None)
+        return v
+
+class OfflineBatch(BaseModel):
+    """A signed batch of offline records.
+
+    `payload` is the JSON text of the record list exactly as signed, so the
+    signature never depends on how either side formats JSON.
+    """
+    payload: str
+    signature: str
+    key_event_id: str                        # Event the signing key was issued for
+    key_issued_at: int                       # Unix time the signing key was issued
+    key_expires: int
+
+class OfflineReview(BaseModel):
+    """A teacher's decision on students' offline records pending review"""
+    student_ids: list[str] = Field(min_length=1, max_length=1000)
+    approve: bool
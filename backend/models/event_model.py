@@ -1,6 +1,7 @@
 from pydantic import BaseModel, Field, ConfigDict, field_validator
 from datetime import datetime
 from typing import Optional
+from backend.utils.geofence import normalize_geometry
 from .user_model import PyObjectId
 from bson import ObjectId
 
@@ -19,6 +20,7 @@ class Event(BaseModel):
     latitude: float
     longitude: float
     radius: float
+    geofence: Optional[dict] = None            # GeoJSON Polygon/MultiPolygon; overrides the radius when set
     start_time: datetime
     end_time: datetime
     check_in_start: Optional[datetime] = None  # When check-in opens
@@ -56,5 +58,12 @@ class Event(BaseModel):
                     return v
         return v
 
+    @field_validator('geofence')
+    @classmethod
+    def validate_geofence(cls, v):
+        if v is None:
+            return v
+        return normalize_geometry(v)
+
 class EventInDB(Event):
     pass
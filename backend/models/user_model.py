@@ -1,6 +1,6 @@
 from pydantic import BaseModel, EmailStr, Field, ConfigDict
 from pydantic_core import core_schema
-from typing import Optional
+from typing import Optional, Union
 from bson import ObjectId
 
 class PyObjectId(ObjectId):
@@ -36,6 +36,6 @@ class User(BaseModel):
     password: str
     role: str  # admin, teacher, student
     department_id: Optional[str] = None
-    face_encoding: Optional[list[float]] = None # Store face encoding as a list of floats
+    face_encoding: Optional[Union[bytes, list[float]]] = None # float32 blob (see utils/face_encoding), legacy docs hold a list
 class UserInDB(User):
     hashed_password: str
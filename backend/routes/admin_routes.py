@@ -1,8 +1,10 @@
-from fastapi import APIRouter, Body, HTTPException, status, Depends
+from fastapi import APIRouter, Body, HTTPException, Request, Response, status, Depends
 from fastapi.responses import StreamingResponse
 from backend.controllers import admin_controller
 from backend.models.department_model import Department
 from backend.utils.jwt_handler import decodeJWT
+from backend.utils.serializer import serialize_list
+from backend.utils import admission, pagination, list_versions
 from io import BytesIO
 import openpyxl
 from openpyxl.styles import Font, Alignment, PatternFill
@@ -12,19 +14,26 @@ router = APIRouter(
     tags=["Admin"],
 )
 
-@router.get("/events", response_description="Get all events (admin)")
-async def get_all_events(token: dict = Depends(decodeJWT)):
+@router.get("/events", response_description="Get all events (admin)", dependencies=[Depends(admission.admit("read"))])
+async def get_all_events(request: Request, response: Response, page: dict = Depends(pagination.page_params), token: dict = Depends(decodeJWT)):
     try:
         if not token or token.get("role") != "admin":
             raise HTTPException(
                 status_code=status.HTTP_403_FORBIDDEN,
                 detail="Admin access required",
             )
+        tag = await list_versions.etag([list_versions.EVENTS], "admin/events", page["limit"], page["after"])
+        cached = list_versions.not_modified(request, tag)
+        if cached:
+            return cached
+        
         from backend.database.connection import event_collection
         # Return all events, regardless of status or creator
-        events = await event_collection.find().to_list(10000)
+        events, next_cursor = await pagination.fetch(event_collection, {}, page)
         for event in events:
             event["_id"] = str(event["_id"])
+        pagination.set_next_cursor(response, next_cursor)
+        list_versions.set_etag(response, tag)
         return events
     except HTTPException:
         raise
@@ -34,8 +43,26 @@ async def get_all_events(token: dict = Depends(decodeJWT)):
             detail=f"Failed to fetch events: {str(e)}",
         )
 
-@router.get("/attendance", response_description="Get all attendance records")
-async def get_all_attendance(token: dict = Depends(decodeJWT)):
+@router.get("/events/count", response_description="Count all events (admin)", dependencies=[Depends(admission.admit("read"))])
+async def count_all_events(token: dict = Depends(decodeJWT)):
+    try:
+        if not token or token.get("role") != "admin":
+            raise HTTPException(
+                status_code=status.HTTP_403_FORBIDDEN,
+                detail="Admin access required",
+            )
+        from backend.database.connection import event_collection
+        return {"count": await event_collection.count_documents({})}
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Failed to count events: {str(e)}",
+        )
+
+@router.get("/attendance", response_description="Get all attendance records", dependencies=[Depends(admission.admit("read"))])
+async def get_all_attendance(response: Response, page: dict = Depends(pagination.page_params), token: dict = Depends(decodeJWT)):
     try:
         if not token or token.get("role") != "admin":
             raise HTTPException(
@@ -43,10 +70,9 @@ async def get_all_attendance(token: dict = Depends(decodeJWT)):
                 detail="Admin access required",
             )
         from backend.database.connection import attendance_collection
-        records = await attendance_collection.find().to_list(1000)
-        for record in records:
-            record["_id"] = str(record["_id"])
-        return records
+        records, next_cursor = await pagination.fetch(attendance_collection, {}, page)
+        pagination.set_next_cursor(response, next_cursor)
+        return serialize_list(records)
     except HTTPException:
         raise
     except Exception as e:
@@ -54,19 +80,24 @@ async def get_all_attendance(token: dict = Depends(decodeJWT)):
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=f"Failed to fetch attendance records: {str(e)}",
         )
-from fastapi import APIRouter, Body, HTTPException, status, Depends
-from fastapi.responses import StreamingResponse
-from backend.controllers import admin_controller
-from backend.models.department_model import Department
-from backend.utils.jwt_handler import decodeJWT
-from io import BytesIO
-import openpyxl
-from openpyxl.styles import Font, Alignment, PatternFill
 
-router = APIRouter(
-    prefix="/admin",
-    tags=["Admin"],
-)
+@router.get("/attendance/count", response_description="Count all attendance records", dependencies=[Depends(admission.admit("read"))])
+async def count_all_attendance(token: dict = Depends(decodeJWT)):
+    try:
+        if not token or token.get("role") != "admin":
+            raise HTTPException(
+                status_code=status.HTTP_403_FORBIDDEN,
+                detail="Admin access required",
+            )
+        from backend.database.connection import attendance_collection
+        return {"count": await attendance_collection.count_documents({})}
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Failed to count attendance records: {str(e)}",
+        )
 
 @router.post("/departments", response_description="Add new department")
 async def add_department(department: Department = Body(...), token: dict = Depends(decodeJWT)):
@@ -95,21 +126,28 @@ async def add_department(department: Department = Body(...), token: dict = Depen
             detail=f"Failed to create department: {str(e)}",
         )
 
-@router.get("/departments", response_description="Get all departments")
-async def get_departments(token: dict = Depends(decodeJWT)):
+@router.get("/departments", response_description="Get all departments", dependencies=[Depends(admission.admit("read"))])
+async def get_departments(request: Request, response: Response, page: dict = Depends(pagination.page_params), token: dict = Depends(decodeJWT)):
     try:
         if not token or token.get("role") != "admin":
             raise HTTPException(
                 status_code=status.HTTP_403_FORBIDDEN,
                 detail="Admin access required",
             )
+        tag = await list_versions.etag([list_versions.DEPARTMENTS], "admin/departments", page["limit"], page["after"])
+        cached = list_versions.not_modified(request, tag)
+        if cached:
+            return cached
+        
         from backend.database.connection import department_collection
-        departments = await department_collection.find().to_list(1000)
+        departments, next_cursor = await pagination.fetch(department_collection, {}, page)
         
         # Convert ObjectId to string for each department
         for dept in departments:
             dept["_id"] = str(dept["_id"])
         
+        pagination.set_next_cursor(response, next_cursor)
+        list_versions.set_etag(response, tag)
         return departments
     except HTTPException:
         raise
@@ -141,6 +179,7 @@ async def update_department(department_id: str, name: str = Body(..., embed=True
                 detail="Department not found or no changes made",
             )
         
+        await list_versions.bump(list_versions.DEPARTMENTS)
         return {"message": "Department updated successfully"}
     except HTTPException:
         raise
@@ -169,6 +208,7 @@ async def delete_department(department_id: str, token: dict = Depends(decodeJWT)
                 detail="Department not found",
             )
         
+        await list_versions.bump(list_versions.DEPARTMENTS)
         return {"message": "Department deleted successfully"}
     except HTTPException:
         raise
@@ -178,7 +218,7 @@ async def delete_department(department_id: str, token: dict = Depends(decodeJWT)
             detail=f"Failed to delete department: {str(e)}",
         )
 
-@router.get("/export/attendance", response_description="Export attendance to Excel")
+@router.get("/export/attendance", response_description="Export attendance to Excel", dependencies=[Depends(admission.admit("bulk"))])
 async def export_attendance(department_id: str = None, token: dict = Depends(decodeJWT)):
     try:
         if not token or token.get("role") != "admin":
@@ -189,11 +229,12 @@ async def export_attendance(department_id: str = None, token: dict = Depends(dec
         
         # Get attendance data
         from backend.database.connection import attendance_collection, user_collection, event_collection
+        from backend.utils.face_encoding import WITHOUT_FACE_ENCODING
         
         query = {}
         if department_id:
             # Get users from this department
-            users = await user_collection.find({"department_id": department_id}).to_list(1000)
+            users = await user_collection.find({"department_id": department_id}, {"_id": 1}).to_list(1000)
             user_ids = [str(user["_id"]) for user in users]
             query = {"student_id": {"$in": user_ids}}
         
@@ -225,9 +266,9 @@ async def export_attendance(department_id: str = None, token: dict = Depends(dec
             # Try ObjectId lookup first, fallback to string
             user = None
             try:
-                user = await user_collection.find_one({"_id": ObjectId(record["student_id"])})
+                user = await user_collection.find_one({"_id": ObjectId(record["student_id"])}, WITHOUT_FACE_ENCODING)
             except Exception:
-                user = await user_collection.find_one({"_id": record["student_id"]})
+                user = await user_collection.find_one({"_id": record["student_id"]}, WITHOUT_FACE_ENCODING)
 
             event = await event_collection.find_one({"_id": record["event_id"]})
             id_number = user.get("id_number", "N/A") if user else "N/A"
@@ -281,8 +322,8 @@ async def export_attendance(department_id: str = None, token: dict = Depends(dec
             detail=f"Failed to export attendance: {str(e)}",
         )
 
-@router.get("/users", response_description="Get all users")
-async def get_all_users(token: dict = Depends(decodeJWT)):
+@router.get("/faces/duplicates", response_description="Find accounts that registered the same face", dependencies=[Depends(admission.admit("bulk"))])
+async def get_duplicate_faces(threshold: float = None, token: dict = Depends(decodeJWT)):
     try:
         if not token or token.get("role") != "admin":
             raise HTTPException(
@@ -290,7 +331,26 @@ async def get_all_users(token: dict = Depends(decodeJWT)):
                 detail="Admin access required",
             )
         
-        users = await admin_controller.get_all_users()
+        return await admin_controller.find_duplicate_faces(threshold)
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Failed to find duplicate faces: {str(e)}",
+        )
+
+@router.get("/users", response_description="Get all users", dependencies=[Depends(admission.admit("read"))])
+async def get_all_users(response: Response, page: dict = Depends(pagination.page_params), token: dict = Depends(decodeJWT)):
+    try:
+        if not token or token.get("role") != "admin":
+            raise HTTPException(
+                status_code=status.HTTP_403_FORBIDDEN,
+                detail="Admin access required",
+            )
+        
+        users, next_cursor = await admin_controller.get_all_users(page)
+        pagination.set_next_cursor(response, next_cursor)
         return users
     except HTTPException:
         raise
@@ -300,6 +360,24 @@ async def get_all_users(token: dict = Depends(decodeJWT)):
             detail=f"Failed to fetch users: {str(e)}",
         )
 
+@router.get("/users/count", response_description="Count all users", dependencies=[Depends(admission.admit("read"))])
+async def count_all_users(role: str = None, token: dict = Depends(decodeJWT)):
+    try:
+        if not token or token.get("role") != "admin":
+            raise HTTPException(
+                status_code=status.HTTP_403_FORBIDDEN,
+                detail="Admin access required",
+            )
+        from backend.database.connection import user_collection
+        return {"count": await user_collection.count_documents({"role": role} if role else {})}
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Failed to count users: {str(e)}",
+        )
+
 @router.get("/users/{user_id}", response_description="Get user profile")
 async def get_user(user_id: str, token: dict = Depends(decodeJWT)):
     try:
@@ -1,10 +1,16 @@
-from fastapi import APIRouter, Body, Depends, HTTPException, status, UploadFile, File, Form
-from backend.controllers import attendance_controller
+from fastapi import APIRouter, Body, Depends, HTTPException, status, UploadFile, File, Form, Header, Query, Response
+from backend.controllers import attendance_controller, verification_controller
 from backend.utils.jwt_handler import decodeJWT
-from pydantic import BaseModel
+from backend.utils import admission, event_cache, idempotency, offline_signing, pagination
+from backend.utils.image_pipeline import parse_face_box
+from backend.utils.uploads import read_upload, deferred_reader, GROUP_IMAGE_MAX_BYTES
+from backend.models.attendance_model import OfflineRecord, OfflineBatch, OfflineReview
+from pydantic import BaseModel, ValidationError
 from bson import ObjectId
 from bson.errors import InvalidId
-from typing import Optional
+from typing import List, Optional
+import json
+import os
 
 class CheckInRequest(BaseModel):
     event_id: str
@@ -16,19 +22,29 @@ class CheckOutRequest(BaseModel):
     latitude: float
     longitude: float
 
+GROUP_CHECKIN_MAX_PHOTOS = int(os.getenv("GROUP_CHECKIN_MAX_PHOTOS", "5"))
+OFFLINE_BATCH_MAX_RECORDS = int(os.getenv("OFFLINE_BATCH_MAX_RECORDS", "500"))
+ATTENDANCE_STATUS_MAX_EVENTS = int(os.getenv("ATTENDANCE_STATUS_MAX_EVENTS", "500"))
+# Whether check-in/out photos are verified in the background when the client does not say
+FACE_VERIFY_ASYNC_DEFAULT = os.getenv("FACE_VERIFY_ASYNC_DEFAULT", "false").lower() == "true"
+
 router = APIRouter(
     prefix="/attendance",
     tags=["Attendance"],
 )
 
-@router.post("/checkin", response_description="Check in for an event")
+@router.post("/checkin", response_description="Check in for an event", dependencies=[Depends(admission.admit("interactive"))])
 async def check_in(
     event_id: str = Form(...),
     latitude: float = Form(...),
     longitude: float = Form(...),
     image: Optional[UploadFile] = File(None),
+    face_box: Optional[str] = Form(None),
+    verify_async: Optional[bool] = Form(None),
+    idempotency_key: Optional[str] = Header(None, alias="Idempotency-Key"),
     token: dict = Depends(decodeJWT)
 ):
+    claim = None
     try:
         if not token:
             raise HTTPException(
@@ -46,16 +62,24 @@ async def check_in(
         
         current_user_id = token.get("user_id")
         
-        face_image_bytes = None
-        if image:
-            face_image_bytes = await image.read()
+        # A retried submission gets the stored response without re-running verification
+        claim, replayed = await idempotency.begin(current_user_id, "check_in", idempotency_key, str(event_id_obj))
+        if replayed:
+            return replayed
+        
+        # Per-event check-in rate limit; 429 with Retry-After when exceeded
+        admission.take_check_in_token(event_id_obj)
         
         attendance, check_in_status = await attendance_controller.check_in(
             student_id=current_user_id,
             event_id=event_id_obj,
             user_lat=latitude,
             user_lon=longitude,
-            face_image_bytes=face_image_bytes
+            face_box=parse_face_box(face_box),
+            verify_async=FACE_VERIFY_ASYNC_DEFAULT if verify_async is None else verify_async,
+            # The photo is only read once the event, window, geofence and
+            # existing-record checks have passed
+            read_face_image=deferred_reader(image)
         )
         
         # Handle different check-in statuses
@@ -72,28 +96,36 @@ async def check_in(
             else:
                 raise HTTPException(status_code=400, detail=check_in_status)
         
-        return {
-            "status": "Success",
+        response = {
+            "status": "Pending" if attendance.get("verification_id") else "Success",
             "message": check_in_status,
             "attendance": attendance
         }
-    except HTTPException:
+        await idempotency.complete(claim, response)
+        return response
+    except HTTPException as e:
+        await idempotency.fail(claim, e)
         raise
     except Exception as e:
+        await idempotency.release(claim)
         print(f"[ERROR] Check-in error: {str(e)}")
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=f"Check-in failed: {str(e)}",
         )
 
-@router.post("/checkout", response_description="Check out from an event")
+@router.post("/checkout", response_description="Check out from an event", dependencies=[Depends(admission.admit("interactive"))])
 async def check_out(
     event_id: str = Form(...),
     latitude: float = Form(...),
     longitude: float = Form(...),
     image: Optional[UploadFile] = File(None),
+    face_box: Optional[str] = Form(None),
+    verify_async: Optional[bool] = Form(None),
+    idempotency_key: Optional[str] = Header(None, alias="Idempotency-Key"),
     token: dict = Depends(decodeJWT)
 ):
+    claim = None
     try:
         if not token:
             raise HTTPException(
@@ -111,16 +143,24 @@ async def check_out(
         
         current_user_id = token.get("user_id")
         
-        face_image_bytes = None
-        if image:
-            face_image_bytes = await image.read()
+        # A retried submission gets the stored response without re-running verification
+        claim, replayed = await idempotency.begin(current_user_id, "check_out", idempotency_key, str(event_id_obj))
+        if replayed:
+            return replayed
+        
+        # Per-event check-in rate limit; 429 with Retry-After when exceeded
+        admission.take_check_in_token(event_id_obj)
         
         attendance, check_out_status = await attendance_controller.check_out(
             student_id=current_user_id,
             event_id=event_id_obj,
             user_lat=latitude,
             user_lon=longitude,
-            face_image_bytes=face_image_bytes
+            face_box=parse_face_box(face_box),
+            verify_async=FACE_VERIFY_ASYNC_DEFAULT if verify_async is None else verify_async,
+            # The photo is only read once the event, window, geofence and
+            # existing-record checks have passed
+            read_face_image=deferred_reader(image)
         )
         
         # Handle different check-out statuses
@@ -139,24 +179,311 @@ async def check_out(
             else:
                 raise HTTPException(status_code=400, detail=check_out_status)
         
-        return {
-            "status": "Success",
+        response = {
+            "status": "Pending" if attendance.get("verification_id") else "Success",
             "message": check_out_status,
             "attendance": attendance
         }
-    except HTTPException:
+        await idempotency.complete(claim, response)
+        return response
+    except HTTPException as e:
+        await idempotency.fail(claim, e)
         raise
     except Exception as e:
+        await idempotency.release(claim)
         print(f"[ERROR] Check-out error: {str(e)}")
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=f"Check-out failed: {str(e)}",
         )
 
-@router.get("/history/{student_id}", response_description="Get attendance history for a student")
-async def get_history(student_id: str):
+@router.post("/kiosk/checkin", response_description="Identify a student from a kiosk photo and check them in", dependencies=[Depends(admission.admit("interactive"))])
+async def kiosk_check_in(
+    event_id: str = Form(...),
+    image: UploadFile = File(...),
+    latitude: Optional[float] = Form(None),
+    longitude: Optional[float] = Form(None),
+    token: dict = Depends(decodeJWT)
+):
+    try:
+        if not token:
+            raise HTTPException(
+                status_code=status.HTTP_401_UNAUTHORIZED,
+                detail="Invalid token or expired token",
+            )
+        
+        if token.get("role") != "teacher":
+            raise HTTPException(
+                status_code=status.HTTP_403_FORBIDDEN,
+                detail="Only teachers can run a check-in kiosk",
+            )
+        
+        try:
+            event_id_obj = ObjectId(event_id)
+        except InvalidId:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="Invalid event ID format",
+            )
+        
+        admission.take_check_in_token(event_id_obj)
+        
+        face_image_bytes = await read_upload(image)
+        
+        result, kiosk_status = await attendance_controller.kiosk_check_in(
+            teacher_id=token.get("user_id"),
+            event_id=event_id_obj,
+            face_image_bytes=face_image_bytes,
+            user_lat=latitude,
+            user_lon=longitude
+        )
+        
+        if not result:
+            if kiosk_status == "Event not found":
+                raise HTTPException(status_code=404, detail="Event not found")
+            elif kiosk_status == "You are not approved in this event's department":
+                raise HTTPException(status_code=403, detail=kiosk_status)
+            elif kiosk_status == "Out of Range":
+                raise HTTPException(status_code=400, detail="The kiosk device is out of range of the event location.")
+            else:
+                raise HTTPException(status_code=400, detail=kiosk_status)
+        
+        return {
+            "status": "Success",
+            "message": kiosk_status,
+            **result
+        }
+    except HTTPException:
+        raise
+    except Exception as e:
+        print(f"[ERROR] Kiosk check-in error: {str(e)}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Kiosk check-in failed: {str(e)}",
+        )
+
+@router.post("/group/checkin", response_description="Check in every recognized student from group photos", dependencies=[Depends(admission.admit("bulk"))])
+async def group_check_in(
+    event_id: str = Form(...),
+    images: List[UploadFile] = File(...),
+    latitude: Optional[float] = Form(None),
+    longitude: Optional[float] = Form(None),
+    token: dict = Depends(decodeJWT)
+):
+    try:
+        if not token:
+            raise HTTPException(
+                status_code=status.HTTP_401_UNAUTHORIZED,
+                detail="Invalid token or expired token",
+            )
+        
+        if token.get("role") != "teacher":
+            raise HTTPException(
+                status_code=status.HTTP_403_FORBIDDEN,
+                detail="Only teachers can run group check-in",
+            )
+        
+        if len(images) > GROUP_CHECKIN_MAX_PHOTOS:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail=f"At most {GROUP_CHECKIN_MAX_PHOTOS} photos can be submitted at once",
+            )
+        
+        try:
+            event_id_obj = ObjectId(event_id)
+        except InvalidId:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="Invalid event ID format",
+            )
+        
+        images_bytes = [await read_upload(image, GROUP_IMAGE_MAX_BYTES) for image in images]
+        
+        result, group_status = await attendance_controller.group_check_in(
+            teacher_id=token.get("user_id"),
+            event_id=event_id_obj,
+            images=images_bytes,
+            user_lat=latitude,
+            user_lon=longitude
+        )
+        
+        if not result:
+            if group_status == "Event not found":
+                raise HTTPException(status_code=404, detail="Event not found")
+            elif group_status == "You are not approved in this event's department":
+                raise HTTPException(status_code=403, detail=group_status)
+            elif group_status == "Out of Range":
+                raise HTTPException(status_code=400, detail="The device is out of range of the event location.")
+            else:
+                raise HTTPException(status_code=400, detail=group_status)
+        
+        return {
+            "status": "Success",
+            "message": group_status,
+            **result
+        }
+    except HTTPException:
+        raise
+    except Exception as e:
+        print(f"[ERROR] Group check-in error: {str(e)}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Group check-in failed: {str(e)}",
+        )
+
+@router.get("/offline/key", response_description="Issue a signing key for offline check-in batches")
+async def get_offline_key(event_id: str = Query(..., description="Event the key may sign records for"), token: dict = Depends(decodeJWT)):
     try:
-        history = await attendance_controller.get_attendance_history(student_id)
+        if not token:
+            raise HTTPException(
+                status_code=status.HTTP_401_UNAUTHORIZED,
+                detail="Invalid or expired token",
+            )
+        
+        if token.get("role") not in ["student", "teacher"]:
+            raise HTTPException(
+                status_code=status.HTTP_403_FORBIDDEN,
+                detail="Only students and teachers can record attendance offline",
+            )
+        
+        try:
+            event_id_obj = ObjectId(event_id)
+        except InvalidId:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="Invalid event ID format",
+            )
+        if not await event_cache.get(event_id_obj):
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail="Event not found",
+            )
+        
+        return offline_signing.issue_key(token.get("user_id"), str(event_id_obj))
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Failed to issue offline key: {str(e)}",
+        )
+
+@router.post("/offline/batch", response_description="Submit check-ins captured offline", dependencies=[Depends(admission.admit("bulk"))])
+async def submit_offline_batch(batch: OfflineBatch = Body(...), token: dict = Depends(decodeJWT)):
+    try:
+        if not token:
+            raise HTTPException(
+                status_code=status.HTTP_401_UNAUTHORIZED,
+                detail="Invalid or expired token",
+            )
+        
+        role = token.get("role")
+        if role not in ["student", "teacher"]:
+            raise HTTPException(
+                status_code=status.HTTP_403_FORBIDDEN,
+                detail="Only students and teachers can record attendance offline",
+            )
+        
+        current_user_id = token.get("user_id")
+        if not offline_signing.verify(
+            current_user_id, batch.key_event_id, batch.key_issued_at, batch.key_expires, batch.payload, batch.signature
+        ):
+            raise HTTPException(
+                status_code=status.HTTP_401_UNAUTHORIZED,
+                detail="Invalid or expired batch signature",
+            )
+        
+        try:
+            raw_records = json.loads(batch.payload)
+        except ValueError:
+            raise HTTPException(status_code=400, detail="Batch payload is not valid JSON")
+        if not isinstance(raw_records, list):
+            raise HTTPException(status_code=400, detail="Batch payload must be a list of records")
+        if len(raw_records) > OFFLINE_BATCH_MAX_RECORDS:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail=f"At most {OFFLINE_BATCH_MAX_RECORDS} records can be submitted at once",
+            )
+        
+        # Invalid records are reported individually instead of failing the batch
+        records = []
+        for raw in raw_records:
+            try:
+                records.append(OfflineRecord(**raw))
+            except (ValidationError, TypeError, ValueError) as e:
+                records.append(f"Invalid record: {str(e).splitlines()[0]}")
+        
+        results = await attendance_controller.offline_batch(
+            current_user_id, role, records, batch.key_event_id, batch.key_issued_at
+        )
+        return {
+            "recorded": sum(1 for r in results if r["status"] == "recorded"),
+            "rejected": sum(1 for r in results if r["status"] != "recorded"),
+            "results": results
+        }
+    except HTTPException:
+        raise
+    except Exception as e:
+        print(f"[ERROR] Offline batch error: {str(e)}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Failed to process offline batch: {str(e)}",
+        )
+
+@router.post("/event/{event_id}/offline/review", response_description="Approve or reject offline records pending review", dependencies=[Depends(admission.admit("bulk"))])
+async def review_offline_attendance(event_id: str, review: OfflineReview = Body(...), token: dict = Depends(decodeJWT)):
+    try:
+        if not token:
+            raise HTTPException(
+                status_code=status.HTTP_401_UNAUTHORIZED,
+                detail="Invalid or expired token",
+            )
+        
+        if token.get("role") != "teacher":
+            raise HTTPException(
+                status_code=status.HTTP_403_FORBIDDEN,
+                detail="Only teachers can review offline attendance",
+            )
+        
+        try:
+            event_id_obj = ObjectId(event_id)
+        except InvalidId:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="Invalid event ID format",
+            )
+        
+        result, review_status = await attendance_controller.review_offline_attendance(
+            reviewer_id=token.get("user_id"),
+            event_id=event_id_obj,
+            student_ids=review.student_ids,
+            approve=review.approve
+        )
+        
+        if not result:
+            if review_status == "Event not found":
+                raise HTTPException(status_code=404, detail="Event not found")
+            raise HTTPException(status_code=403, detail=review_status)
+        
+        return {
+            "status": "Success",
+            "message": review_status,
+            **result
+        }
+    except HTTPException:
+        raise
+    except Exception as e:
+        print(f"[ERROR] Offline review error: {str(e)}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Failed to review offline attendance: {str(e)}",
+        )
+
+@router.get("/history/{student_id}", response_description="Get attendance history for a student", dependencies=[Depends(admission.admit("read"))])
+async def get_history(student_id: str, response: Response, page: dict = Depends(pagination.page_params)):
+    try:
+        history, next_cursor = await attendance_controller.get_attendance_history(student_id, page)
+        pagination.set_next_cursor(response, next_cursor)
         return history
     except Exception as e:
         print(f"[ERROR] History fetch error: {str(e)}")
@@ -165,7 +492,60 @@ async def get_history(student_id: str):
             detail=f"Failed to fetch history: {str(e)}",
         )
 
-@router.get("/status/{event_id}", response_description="Check attendance status for current user")
+@router.get("/history/{student_id}/count", response_description="Count attendance records for a student", dependencies=[Depends(admission.admit("read"))])
+async def count_history(student_id: str):
+    try:
+        return {"count": await attendance_controller.count_attendance_history(student_id)}
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Failed to count history: {str(e)}",
+        )
+
+@router.get("/status", response_description="Check attendance status for many events at once", dependencies=[Depends(admission.admit("read"))])
+async def get_attendance_statuses(event_ids: Optional[List[str]] = Query(None, description="Event ids; omit for every event in your event list"), token: dict = Depends(decodeJWT)):
+    try:
+        if not token:
+            raise HTTPException(
+                status_code=status.HTTP_401_UNAUTHORIZED,
+                detail="Invalid or expired token",
+            )
+        
+        if event_ids:
+            # Accept both ?event_ids=a&event_ids=b and ?event_ids=a,b
+            event_ids = [value for item in event_ids for value in item.split(",") if value]
+            if len(event_ids) > ATTENDANCE_STATUS_MAX_EVENTS:
+                raise HTTPException(
+                    status_code=status.HTTP_400_BAD_REQUEST,
+                    detail=f"At most {ATTENDANCE_STATUS_MAX_EVENTS} events per request",
+                )
+            try:
+                event_id_objs = [ObjectId(event_id) for event_id in event_ids]
+            except InvalidId:
+                raise HTTPException(
+                    status_code=status.HTTP_400_BAD_REQUEST,
+                    detail="Invalid event ID format",
+                )
+        else:
+            if token.get("role") not in ["student", "teacher"]:
+                raise HTTPException(
+                    status_code=status.HTTP_400_BAD_REQUEST,
+                    detail="event_ids is required",
+                )
+            from backend.controllers import event_controller
+            event_id_objs = await event_controller.get_visible_event_ids(token.get("role"), token.get("user_id"))
+        
+        return await attendance_controller.get_attendance_statuses(token.get("user_id"), event_id_objs)
+    except HTTPException:
+        raise
+    except Exception as e:
+        print(f"[ERROR] Status check error: {str(e)}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Failed to check status: {str(e)}",
+        )
+
+@router.get("/status/{event_id}", response_description="Check attendance status for current user", dependencies=[Depends(admission.admit("read"))])
 async def get_attendance_status(event_id: str, token: dict = Depends(decodeJWT)):
     try:
         if not token:
@@ -195,7 +575,81 @@ async def get_attendance_status(event_id: str, token: dict = Depends(decodeJWT))
             detail=f"Failed to check status: {str(e)}",
         )
 
-@router.get("/event/{event_id}", response_description="Get attendance for a specific event")
+@router.get("/verification/{verification_id}", response_description="Poll a background face verification", dependencies=[Depends(admission.admit("read"))])
+async def get_verification_status(verification_id: str, token: dict = Depends(decodeJWT)):
+    try:
+        if not token:
+            raise HTTPException(
+                status_code=status.HTTP_401_UNAUTHORIZED,
+                detail="Invalid or expired token",
+            )
+        
+        job = await verification_controller.get_job(verification_id, token.get("user_id"))
+        if not job:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail="Verification not found",
+            )
+        
+        return job
+    except HTTPException:
+        raise
+    except Exception as e:
+        print(f"[ERROR] Verification status error: {str(e)}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Failed to fetch verification status: {str(e)}",
+        )
+
+@router.get("/counts", response_description="Get attendance totals for many events", dependencies=[Depends(admission.admit("read"))])
+async def get_event_attendance_counts(event_ids: Optional[List[str]] = Query(None, description="Event ids; omit for every event in your event list"), token: dict = Depends(decodeJWT)):
+    try:
+        if not token:
+            raise HTTPException(
+                status_code=status.HTTP_401_UNAUTHORIZED,
+                detail="Invalid or expired token",
+            )
+        
+        if token.get("role") not in ["teacher", "admin"]:
+            raise HTTPException(
+                status_code=status.HTTP_403_FORBIDDEN,
+                detail="Only teachers and admins can view attendance totals",
+            )
+        
+        if event_ids:
+            event_ids = [value for item in event_ids for value in item.split(",") if value]
+            if len(event_ids) > ATTENDANCE_STATUS_MAX_EVENTS:
+                raise HTTPException(
+                    status_code=status.HTTP_400_BAD_REQUEST,
+                    detail=f"At most {ATTENDANCE_STATUS_MAX_EVENTS} events per request",
+                )
+            try:
+                event_id_objs = [ObjectId(event_id) for event_id in event_ids]
+            except InvalidId:
+                raise HTTPException(
+                    status_code=status.HTTP_400_BAD_REQUEST,
+                    detail="Invalid event ID format",
+                )
+        else:
+            if token.get("role") != "teacher":
+                raise HTTPException(
+                    status_code=status.HTTP_400_BAD_REQUEST,
+                    detail="event_ids is required",
+                )
+            from backend.controllers import event_controller
+            event_id_objs = await event_controller.get_visible_event_ids("teacher", token.get("user_id"))
+        
+        return await attendance_controller.get_event_attendance_counts(event_id_objs)
+    except HTTPException:
+        raise
+    except Exception as e:
+        print(f"[ERROR] Attendance counts error: {str(e)}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Failed to fetch attendance counts: {str(e)}",
+        )
+
+@router.get("/event/{event_id}", response_description="Get attendance for a specific event", dependencies=[Depends(admission.admit("read"))])
 async def get_event_attendance(event_id: str, token: dict = Depends(decodeJWT)):
     try:
         if not token:
@@ -236,7 +690,7 @@ async def get_event_attendance(event_id: str, token: dict = Depends(decodeJWT)):
             detail=f"Failed to fetch event attendance: {str(e)}",
         )
 
-@router.post("/event/{event_id}/finalize", response_description="Finalize attendance - mark absent students")
+@router.post("/event/{event_id}/finalize", response_description="Finalize attendance - mark absent students", dependencies=[Depends(admission.admit("bulk"))])
 async def finalize_attendance(event_id: str, token: dict = Depends(decodeJWT)):
     try:
         if not token:
@@ -273,7 +727,7 @@ async def finalize_attendance(event_id: str, token: dict = Depends(decodeJWT)):
             detail=f"Failed to finalize attendance: {str(e)}",
         )
 
-@router.get("/event/{event_id}/export", response_description="Export event attendance to Excel")
+@router.get("/event/{event_id}/export", response_description="Export event attendance to Excel", dependencies=[Depends(admission.admit("bulk"))])
 async def export_event_attendance(event_id: str, token: dict = Depends(decodeJWT)):
     try:
         if not token:
@@ -2,6 +2,7 @@ from fastapi import APIRouter, Body, HTTPException, status, UploadFile, File, De
 from backend.controllers import auth_controller
 from backend.models.user_model import User
 from backend.utils.jwt_handler import decodeJWT
+from backend.utils.face_encoding import HAS_FACE_REGISTERED
 from pydantic import BaseModel, EmailStr
 from typing import Optional
 from bson import ObjectId
@@ -54,7 +55,7 @@ async def register(reg_data: RegisterRequest = Body(...)):
             "department_id": reg_data.department_id
         }
         
-        existing_user = await auth_controller.user_collection.find_one({"email": user_data["email"]})
+        existing_user = await auth_controller.user_collection.find_one({"email": user_data["email"]}, {"_id": 1})
         if existing_user:
             raise HTTPException(
                 status_code=status.HTTP_400_BAD_REQUEST,
@@ -108,7 +109,21 @@ async def register_face(file: UploadFile = File(...), token: dict = Depends(deco
 @router.get("/me", response_description="Get current user")
 async def get_me(token: dict = Depends(decodeJWT)):
     user_id = token.get("user_id")
-    user = await auth_controller.user_collection.find_one({"_id": ObjectId(user_id)})
+    # Project only the profile fields; the face encoding blob is reduced to a flag
+    user = await auth_controller.user_collection.find_one(
+        {"_id": ObjectId(user_id)},
+        {
+            "first_name": 1,
+            "middle_name": 1,
+            "last_name": 1,
+            "name": 1,
+            "id_number": 1,
+            "email": 1,
+            "role": 1,
+            "department_id": 1,
+            "has_face_registered": HAS_FACE_REGISTERED
+        }
+    )
     if user:
         return {
             "id": str(user["_id"]),
@@ -120,7 +135,7 @@ async def get_me(token: dict = Depends(decodeJWT)):
             "email": user["email"],
             "role": user["role"],
             "department_id": user.get("department_id"),
-            "has_face_registered": bool(user.get("face_encoding"))
+            "has_face_registered": bool(user.get("has_face_registered"))
         }
     raise HTTPException(status_code=404, detail="User not found")
 
@@ -1,7 +1,9 @@
-from fastapi import APIRouter, Body, HTTPException, status, Depends
+from fastapi import APIRouter, Body, HTTPException, Request, Response, status, Depends
 from backend.models.enrollment_model import Enrollment
 from backend.utils.jwt_handler import decodeJWT
+from backend.utils import admission, pagination, list_versions
 from backend.database.connection import enrollment_collection, department_collection, user_collection
+from backend.utils.face_encoding import WITHOUT_FACE_ENCODING
 from datetime import datetime
 from bson import ObjectId
 
@@ -10,8 +12,8 @@ router = APIRouter(
     tags=["Enrollments"],
 )
 
-@router.get("/societies", response_description="Get all available societies/departments")
-async def get_societies(token: dict = Depends(decodeJWT)):
+@router.get("/societies", response_description="Get all available societies/departments", dependencies=[Depends(admission.admit("read"))])
+async def get_societies(request: Request, response: Response, page: dict = Depends(pagination.page_params), token: dict = Depends(decodeJWT)):
     """Get all departments that students can enroll in (only those with approved teachers)"""
     try:
         if not token:
@@ -22,16 +24,27 @@ async def get_societies(token: dict = Depends(decodeJWT)):
         
         user_role = token.get("role")
         
+        scopes = [list_versions.DEPARTMENTS]
+        if user_role in ["student", "teacher"]:
+            scopes.append(list_versions.enrollments(token.get("user_id")))
+        tag = await list_versions.etag(scopes, "societies", user_role, token.get("user_id"), page["limit"], page["after"])
+        cached = list_versions.not_modified(request, tag)
+        if cached:
+            return cached
+        
         # Get departments based on role
         if user_role == "student":
             # Students see all departments so they can enroll in any
-            departments = await department_collection.find().to_list(1000)
+            departments, next_cursor = await pagination.fetch(department_collection, {}, page)
             for dept in departments:
                 dept["_id"] = str(dept["_id"])
             
-            # Get student's enrollment status for each department
+            # Get student's enrollment status for each department on this page
             user_id = token.get("user_id")
-            enrollments = await enrollment_collection.find({"user_id": user_id}).to_list(1000)
+            enrollments = await enrollment_collection.find({
+                "user_id": user_id,
+                "department_id": {"$in": [dept["_id"] for dept in departments]}
+            }).to_list(None)
             enrollment_map = {e["department_id"]: {"status": e["status"], "id": str(e["_id"])} for e in enrollments}
             
             for dept in departments:
@@ -42,13 +55,16 @@ async def get_societies(token: dict = Depends(decodeJWT)):
         
         elif user_role == "teacher":
             # Teachers see all departments to request enrollment
-            departments = await department_collection.find().to_list(1000)
+            departments, next_cursor = await pagination.fetch(department_collection, {}, page)
             for dept in departments:
                 dept["_id"] = str(dept["_id"])
             
-            # Get teacher's enrollment status for all departments
+            # Get teacher's enrollment status for the departments on this page
             user_id = token.get("user_id")
-            enrollments = await enrollment_collection.find({"user_id": user_id}).to_list(1000)
+            enrollments = await enrollment_collection.find({
+                "user_id": user_id,
+                "department_id": {"$in": [dept["_id"] for dept in departments]}
+            }).to_list(None)
             enrollment_map = {e["department_id"]: {"status": e["status"], "id": str(e["_id"])} for e in enrollments}
             
             for dept in departments:
@@ -59,10 +75,12 @@ async def get_societies(token: dict = Depends(decodeJWT)):
         
         else:
             # Admins see all departments
-            departments = await department_collection.find().to_list(1000)
+            departments, next_cursor = await pagination.fetch(department_collection, {}, page)
             for dept in departments:
                 dept["_id"] = str(dept["_id"])
         
+        pagination.set_next_cursor(response, next_cursor)
+        list_versions.set_etag(response, tag)
         return departments
     except HTTPException:
         raise
@@ -111,6 +129,7 @@ async def request_enrollment(department_id: str = Body(..., embed=True), token:
         }
         
         result = await enrollment_collection.insert_one(enrollment_data)
+        await list_versions.bump(list_versions.enrollments(user_id))
         created = await enrollment_collection.find_one({"_id": result.inserted_id})
         
         # Convert ObjectId to string
@@ -128,8 +147,8 @@ async def request_enrollment(department_id: str = Body(..., embed=True), token:
             detail=f"Failed to request enrollment: {str(e)}",
         )
 
-@router.get("/my-enrollments", response_description="Get student's enrollments")
-async def get_my_enrollments(token: dict = Depends(decodeJWT)):
+@router.get("/my-enrollments", response_description="Get student's enrollments", dependencies=[Depends(admission.admit("read"))])
+async def get_my_enrollments(request: Request, response: Response, page: dict = Depends(pagination.page_params), token: dict = Depends(decodeJWT)):
     """Get current user's enrollment requests"""
     try:
         if not token:
@@ -139,7 +158,15 @@ async def get_my_enrollments(token: dict = Depends(decodeJWT)):
             )
         
         user_id = token.get("user_id")
-        enrollments = await enrollment_collection.find({"user_id": user_id}).to_list(1000)
+        tag = await list_versions.etag(
+            [list_versions.DEPARTMENTS, list_versions.enrollments(user_id)],
+            "my-enrollments", user_id, page["limit"], page["after"]
+        )
+        cached = list_versions.not_modified(request, tag)
+        if cached:
+            return cached
+        
+        enrollments, next_cursor = await pagination.fetch(enrollment_collection, {"user_id": user_id}, page)
         
         # Populate department info and convert ObjectId to string
         for enrollment in enrollments:
@@ -156,6 +183,8 @@ async def get_my_enrollments(token: dict = Depends(decodeJWT)):
             else:
                 enrollment["department_name"] = "Unknown"
         
+        pagination.set_next_cursor(response, next_cursor)
+        list_versions.set_etag(response, tag)
         return enrollments
     except HTTPException:
         raise
@@ -168,11 +197,12 @@ async def get_my_enrollments(token: dict = Depends(decodeJWT)):
             detail=f"Failed to fetch enrollments: {str(e)}",
         )
 
-@router.get("/pending", response_description="Get pending enrollment requests")
-async def get_pending_enrollments(token: dict = Depends(decodeJWT)):
+@router.get("/pending", response_description="Get pending enrollment requests", dependencies=[Depends(admission.admit("read"))])
+async def get_pending_enrollments(response: Response, page: dict = Depends(pagination.page_params), token: dict = Depends(decodeJWT)):
     """Get pending enrollments based on role:
     - Admins see teacher enrollment requests
-    - Teachers see student enrollment requests for their department"""
+    - Teachers see student enrollment requests for their department
+    Pages are cut before the role filter, so a page may hold fewer than `limit` entries"""
     try:
         if not token or token.get("role") not in ["teacher", "admin"]:
             raise HTTPException(
@@ -187,9 +217,9 @@ async def get_pending_enrollments(token: dict = Depends(decodeJWT)):
         
         if user_role == "admin":
             # Admin sees teacher enrollment requests
-            all_pending = await enrollment_collection.find({"status": "pending"}).to_list(1000)
+            all_pending, next_cursor = await pagination.fetch(enrollment_collection, {"status": "pending"}, page)
             for enrollment in all_pending:
-                user = await user_collection.find_one({"_id": ObjectId(enrollment["user_id"])})
+                user = await user_collection.find_one({"_id": ObjectId(enrollment["user_id"])}, WITHOUT_FACE_ENCODING)
                 if user and user.get("role") == "teacher":
                     enrollment["_id"] = str(enrollment["_id"])
                     
@@ -216,7 +246,7 @@ async def get_pending_enrollments(token: dict = Depends(decodeJWT)):
             teacher_enrollments = await enrollment_collection.find({
                 "user_id": user_id,
                 "status": "approved"
-            }).to_list(1000)
+            }).to_list(None)
             
             # Collect valid department IDs
             teacher_dept_ids = []
@@ -229,13 +259,13 @@ async def get_pending_enrollments(token: dict = Depends(decodeJWT)):
                 return []
             
             # Get pending student enrollments for ALL teacher's departments
-            all_pending = await enrollment_collection.find({
+            all_pending, next_cursor = await pagination.fetch(enrollment_collection, {
                 "status": "pending",
                 "department_id": {"$in": teacher_dept_ids}
-            }).to_list(1000)
+            }, page)
             
             for enrollment in all_pending:
-                user = await user_collection.find_one({"_id": ObjectId(enrollment["user_id"])})
+                user = await user_collection.find_one({"_id": ObjectId(enrollment["user_id"])}, WITHOUT_FACE_ENCODING)
                 if user and user.get("role") == "student":
                     enrollment["_id"] = str(enrollment["_id"])
                     
@@ -260,6 +290,7 @@ async def get_pending_enrollments(token: dict = Depends(decodeJWT)):
                     enrollment["department_id"] = str(enrollment.get("department_id", ""))
                     enrollments.append(enrollment)
         
+        pagination.set_next_cursor(response, next_cursor)
         return enrollments
     except HTTPException:
         raise
@@ -272,8 +303,8 @@ async def get_pending_enrollments(token: dict = Depends(decodeJWT)):
             detail=f"Failed to fetch pending enrollments: {str(e)}",
         )
 
-@router.get("/approved", response_description="Get approved students")
-async def get_approved_enrollments(department_id: str = None, token: dict = Depends(decodeJWT)):
+@router.get("/approved", response_description="Get approved students", dependencies=[Depends(admission.admit("read"))])
+async def get_approved_enrollments(response: Response, department_id: str = None, page: dict = Depends(pagination.page_params), token: dict = Depends(decodeJWT)):
     """Teachers can view all approved students in their department(s)"""
     try:
         if not token or token.get("role") != "teacher":
@@ -288,7 +319,7 @@ async def get_approved_enrollments(department_id: str = None, token: dict = Depe
         teacher_enrollments = await enrollment_collection.find({
             "user_id": user_id,
             "status": "approved"
-        }).to_list(1000)
+        }).to_list(None)
         
         if not teacher_enrollments:
             return []
@@ -309,14 +340,14 @@ async def get_approved_enrollments(department_id: str = None, token: dict = Depe
             target_dept_ids = teacher_dept_ids
         
         # Get approved student enrollments for these departments
-        approved_enrollments = await enrollment_collection.find({
+        approved_enrollments, next_cursor = await pagination.fetch(enrollment_collection, {
             "status": "approved",
             "department_id": {"$in": target_dept_ids}
-        }).to_list(1000)
+        }, page)
         
         result = []
         for enrollment in approved_enrollments:
-            user = await user_collection.find_one({"_id": ObjectId(enrollment["user_id"])})
+            user = await user_collection.find_one({"_id": ObjectId(enrollment["user_id"])}, WITHOUT_FACE_ENCODING)
             if user and user.get("role") == "student":
                 enrollment["_id"] = str(enrollment["_id"])
                 
@@ -353,6 +384,7 @@ async def get_approved_enrollments(department_id: str = None, token: dict = Depe
                     "approved_at": enrollment.get("reviewed_at", enrollment.get("requested_at"))
                 })
         
+        pagination.set_next_cursor(response, next_cursor)
         return result
     except HTTPException:
         raise
@@ -362,7 +394,7 @@ async def get_approved_enrollments(department_id: str = None, token: dict = Depe
             detail=f"Failed to fetch approved enrollments: {str(e)}",
         )
 
-@router.get("/approved/export", response_description="Export approved students to Excel")
+@router.get("/approved/export", response_description="Export approved students to Excel", dependencies=[Depends(admission.admit("bulk"))])
 async def export_approved_enrollments(department_id: str = None, token: dict = Depends(decodeJWT)):
     """Export approved students list to Excel"""
     from fastapi.responses import StreamingResponse
@@ -443,7 +475,7 @@ async def export_approved_enrollments(department_id: str = None, token: dict = D
         # Add data
         row_num = 4
         for idx, enrollment in enumerate(approved_enrollments, 1):
-            user = await user_collection.find_one({"_id": ObjectId(enrollment["user_id"])})
+            user = await user_collection.find_one({"_id": ObjectId(enrollment["user_id"])}, WITHOUT_FACE_ENCODING)
             if user and user.get("role") == "student":
                 # Handle department_id - it might be string, ObjectId, or None
                 dept_id = enrollment.get("department_id")
@@ -502,8 +534,8 @@ async def export_approved_enrollments(department_id: str = None, token: dict = D
             detail=f"Failed to export enrollments: {str(e)}",
         )
 
-@router.get("/teacher/departments", response_description="Get teacher's approved departments")
-async def get_teacher_departments(token: dict = Depends(decodeJWT)):
+@router.get("/teacher/departments", response_description="Get teacher's approved departments", dependencies=[Depends(admission.admit("read"))])
+async def get_teacher_departments(request: Request, response: Response, token: dict = Depends(decodeJWT)):
     """Get list of departments teacher is approved in"""
     try:
         if not token or token.get("role") != "teacher":
@@ -513,6 +545,13 @@ async def get_teacher_departments(token: dict = Depends(decodeJWT)):
             )
         
         user_id = token.get("user_id")
+        tag = await list_versions.etag(
+            [list_versions.DEPARTMENTS, list_versions.enrollments(user_id)],
+            "teacher/departments", user_id
+        )
+        cached = list_versions.not_modified(request, tag)
+        if cached:
+            return cached
         
         # Get teacher's approved departments
         teacher_enrollments = await enrollment_collection.find({
@@ -537,6 +576,7 @@ async def get_teacher_departments(token: dict = Depends(decodeJWT)):
                     "enrollment_id": str(enrollment["_id"])
                 })
         
+        list_versions.set_etag(response, tag)
         return departments
     except HTTPException:
         raise
@@ -567,7 +607,7 @@ async def review_enrollment(
             )
         
         # Update enrollment
-        result = await enrollment_collection.update_one(
+        reviewed = await enrollment_collection.find_one_and_update(
             {"_id": ObjectId(enrollment_id)},
             {
                 "$set": {
@@ -575,15 +615,18 @@ async def review_enrollment(
                     "reviewed_at": datetime.now().isoformat(),
                     "reviewed_by": token.get("user_id")
                 }
-            }
+            },
+            projection={"user_id": 1}
         )
         
-        if result.modified_count == 0:
+        if reviewed is None:
             raise HTTPException(
                 status_code=status.HTTP_404_NOT_FOUND,
                 detail="Enrollment not found",
             )
         
+        await list_versions.bump(list_versions.enrollments(reviewed["user_id"]))
+        
         return {
             "message": f"Enrollment {action} successfully",
             "status": action
@@ -636,6 +679,8 @@ async def cancel_enrollment(enrollment_id: str, token: dict = Depends(decodeJWT)
                     detail="Failed to cancel enrollment",
                 )
             
+            await list_versions.bump(list_versions.enrollments(user_id))
+            
             return {
                 "message": "Successfully left the society",
                 "enrollment_id": enrollment_id
@@ -650,6 +695,8 @@ async def cancel_enrollment(enrollment_id: str, token: dict = Depends(decodeJWT)
                     detail="Failed to cancel enrollment",
                 )
             
+            await list_versions.bump(list_versions.enrollments(user_id))
+            
             return {
                 "message": "Enrollment request cancelled",
                 "enrollment_id": enrollment_id
@@ -1,7 +1,8 @@
-from fastapi import APIRouter, Body, HTTPException, status, Depends
+from fastapi import APIRouter, Body, HTTPException, Request, Response, status, Depends, Query
 from backend.controllers import event_controller
 from backend.models.event_model import Event
 from backend.utils.jwt_handler import decodeJWT
+from backend.utils import admission, pagination, list_versions
 
 router = APIRouter(
     prefix="/events",
@@ -78,8 +79,8 @@ async def create_event(event: Event = Body(...), token: dict = Depends(decodeJWT
             detail=f"Failed to create event: {str(e)}",
         )
 
-@router.get("/", response_description="Get all events")
-async def get_events(token: dict = Depends(decodeJWT)):
+@router.get("/", response_description="Get all events", dependencies=[Depends(admission.admit("read"))])
+async def get_events(request: Request, response: Response, page: dict = Depends(pagination.page_params), token: dict = Depends(decodeJWT)):
     try:
         if not token:
             raise HTTPException(
@@ -87,112 +88,34 @@ async def get_events(token: dict = Depends(decodeJWT)):
                 detail="Invalid or expired token",
             )
         
-        # Get all events
-        events = await event_controller.get_events()
-        
-        # Filter events based on user role and enrollment
         user_role = token.get("role")
         user_id = token.get("user_id")
         
+        # The list only changes with events, this user's enrollments and, for
+        # students, the clock; answer an unchanged list before querying anything
+        scopes = [list_versions.EVENTS]
+        parts = [user_role, page["limit"], page["after"]]
+        if user_role in ["student", "teacher"]:
+            scopes.append(list_versions.enrollments(user_id))
+            parts.append(user_id)
         if user_role == "student":
-            # Students can only see events from societies they're enrolled in and approved
-            # AND only active events (not ended)
-            from backend.database.connection import enrollment_collection
-            from bson import ObjectId
-            from datetime import datetime
-            
-            # Get approved enrollments for this user
-            enrollments = await enrollment_collection.find({
-                "user_id": user_id,
-                "status": "approved"
-            }).to_list(1000)
-            
-            # Convert ObjectIds to strings for comparison
-            approved_dept_ids = [str(e["department_id"]) for e in enrollments]
-            
-            print(f"[DEBUG] Event filtering for student (user_id: {user_id}):")
-            print(f"   Total events: {len(events)}")
-            print(f"   Approved enrollments: {len(enrollments)}")
-            print(f"   Approved department IDs: {approved_dept_ids}")
-            
-            # Filter events by department_id and end time
-            # Use local time - no UTC conversion
-            now = datetime.now()
-            filtered_events = []
-            print(f"\n[TIME] Current local time: {now}\n")
-            
-            for event in events:
-                event_dept_id = event.get("department_id")
-                event_end_time = event.get("end_time")
-                check_out_end = event.get("check_out_end")
-                is_active = event.get("is_active", True)
-                
-                # Determine if event is still available
-                # Priority: check_out_end > end_time
-                event_is_available = False
-                end_deadline = None
-                
-                if check_out_end:
-                    event_is_available = now <= check_out_end
-                    end_deadline = check_out_end
-                elif event_end_time:
-                    event_is_available = now <= event_end_time
-                    end_deadline = event_end_time
-                
-                # Only show events that:
-                # 1. Belong to student's enrolled department
-                # 2. Have not ended yet
-                # 3. Are marked as active
-                is_enrolled = event_dept_id in approved_dept_ids
-                
-                if is_enrolled and event_is_available and is_active:
-                    filtered_events.append(event)
-                    print(f"   [OK] Event '{event.get('name')}' - Available (ends: {end_deadline})")
-                else:
-                    if not is_enrolled:
-                        reason = "not enrolled"
-                    elif not is_active:
-                        reason = "inactive"
-                    elif not event_is_available:
-                        reason = f"ended (deadline was: {end_deadline})"
-                    else:
-                        reason = "unknown"
-                    print(f"   [HIDDEN] Event '{event.get('name')}' - Hidden ({reason})")
-            
-            print(f"\n   Total events: {len(events)}, Filtered events: {len(filtered_events)}\n")
-            return filtered_events
+            parts.append(list_versions.time_window())
+        tag = await list_versions.etag(scopes, *parts)
+        cached = list_versions.not_modified(request, tag)
+        if cached:
+            return cached
         
-        elif user_role == "teacher":
-            # Teachers can only see events from societies they're enrolled in and approved
-            from backend.database.connection import enrollment_collection
-            from bson import ObjectId
-            
-            # Get approved enrollments for this user
-            enrollments = await enrollment_collection.find({
-                "user_id": user_id,
-                "status": "approved"
-            }).to_list(1000)
-            
-            # Convert ObjectIds to strings for comparison
-            approved_dept_ids = [str(e["department_id"]) for e in enrollments]
-            
-            print(f"[DEBUG] Event filtering for teacher (user_id: {user_id}):")
-            print(f"   Total events: {len(events)}")
-            print(f"   Approved enrollments: {len(enrollments)}")
-            print(f"   Approved department IDs: {approved_dept_ids}")
-            
-            # Filter events by department_id
-            filtered_events = []
-            for event in events:
-                event_dept_id = event.get("department_id")
-                if event_dept_id in approved_dept_ids:
-                    filtered_events.append(event)
-            
-            print(f"   Filtered events: {len(filtered_events)}")
-            return filtered_events
+        # Students and teachers only see events of departments they're approved in;
+        # students additionally only see active events that have not ended.
+        # Both rules run as one indexed query instead of filtering all events here.
+        approved_dept_ids = await event_controller.visible_department_ids(user_role, user_id)
+        if approved_dept_ids is None:
+            # Admins see all events
+            user_role = "admin"
         
-        # Admins see all events
-        print(f"[DEBUG] Event filtering for admin - returning all {len(events)} events")
+        events, next_cursor = await event_controller.get_visible_events(user_role, approved_dept_ids, page)
+        pagination.set_next_cursor(response, next_cursor)
+        list_versions.set_etag(response, tag)
         return events
     except HTTPException:
         raise
@@ -202,6 +125,54 @@ async def get_events(token: dict = Depends(decodeJWT)):
             detail=f"Failed to fetch events: {str(e)}",
         )
 
+@router.get("/count", response_description="Count visible events", dependencies=[Depends(admission.admit("read"))])
+async def count_events(token: dict = Depends(decodeJWT)):
+    try:
+        if not token:
+            raise HTTPException(
+                status_code=status.HTTP_401_UNAUTHORIZED,
+                detail="Invalid or expired token",
+            )
+        
+        approved_dept_ids = await event_controller.visible_department_ids(token.get("role"), token.get("user_id"))
+        user_role = token.get("role") if approved_dept_ids is not None else "admin"
+        return {"count": await event_controller.count_visible_events(user_role, approved_dept_ids)}
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Failed to count events: {str(e)}",
+        )
+
+@router.get("/nearby", response_description="Get open events near a location", dependencies=[Depends(admission.admit("read"))])
+async def get_nearby_events(
+    latitude: float = Query(..., ge=-90, le=90),
+    longitude: float = Query(..., ge=-180, le=180),
+    within: float = Query(100, ge=0, le=5000, description="Meters beyond the geofence edge to include"),
+    token: dict = Depends(decodeJWT)
+):
+    try:
+        if not token:
+            raise HTTPException(
+                status_code=status.HTTP_401_UNAUTHORIZED,
+                detail="Invalid or expired token",
+            )
+        
+        # Students and teachers only see events of their approved departments
+        department_ids = await event_controller.visible_department_ids(token.get("role"), token.get("user_id"))
+        if department_ids is not None and not department_ids:
+            return []
+        
+        return await event_controller.get_nearby_events(latitude, longitude, within, department_ids)
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Failed to fetch nearby events: {str(e)}",
+        )
+
 @router.put("/{event_id}", response_description="Update an event")
 async def update_event(event_id: str, event: Event = Body(...), token: dict = Depends(decodeJWT)):
     try:
@@ -283,6 +254,12 @@ async def delete_event(event_id: str, token: dict = Depends(decodeJWT)):
         # Also delete all attendance records for this event
         await attendance_collection.delete_many({"event_id": event_id_obj})
         
+        from backend.utils import event_cache, geofence, roster_matrix
+        await list_versions.bump(list_versions.EVENTS)
+        event_cache.invalidate(event_id_obj)
+        geofence.invalidate(event_id_obj)
+        roster_matrix.invalidate_event(event_id_obj)
+        
         return {
             "message": "Event and associated attendance records deleted successfully",
             "event_id": event_id
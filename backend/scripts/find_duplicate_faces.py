@@ -0,0 +1,49 @@
+"""Report accounts whose registered faces look like the same person.
+
+Usage (from the project root):
+    python -m backend.scripts.find_duplicate_faces [--threshold 0.5] [--block-size 2048]
+"""
+import argparse
+import asyncio
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent.parent))
+
+from backend.database.connection import client
+from backend.utils import duplicate_faces
+
+async def run(threshold: float, block_size: int):
+    started = time.perf_counter()
+    ids, matrix = await duplicate_faces.load_all_encodings()
+    print(f"[DUPLICATES] Loaded {len(ids)} encoding(s) in {time.perf_counter() - started:.1f}s")
+
+    started = time.perf_counter()
+    pairs = duplicate_faces.find_duplicate_pairs(matrix, threshold, block_size)
+    clusters = duplicate_faces.cluster_pairs(pairs)
+    print(f"[DUPLICATES] Compared all pairs in {time.perf_counter() - started:.1f}s")
+
+    if not clusters:
+        print("[OK] No duplicate faces found")
+        return
+
+    print(f"[WARNING] {len(clusters)} suspicious cluster(s):")
+    for members in clusters:
+        print(f"   {', '.join(ids[i] for i in members)}")
+
+def main():
+    parser = argparse.ArgumentParser(description="Find accounts that registered the same face")
+    parser.add_argument("--threshold", type=float, default=duplicate_faces.DUPLICATE_FACE_THRESHOLD,
+                        help="Maximum face distance to treat as the same person")
+    parser.add_argument("--block-size", type=int, default=duplicate_faces.DUPLICATE_FACE_BLOCK_SIZE,
+                        help="Rows/columns per distance block (bounds memory)")
+    args = parser.parse_args()
+
+    try:
+        asyncio.run(run(args.threshold, args.block_size))
+    finally:
+        client.close()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,73 @@
+"""Rewrite legacy list-of-floats face encodings into the binary format.
+
+Usage (from the project root):
+    python -m backend.scripts.migrate_face_encodings [--batch-size 500] [--dry-run]
+
+Only documents whose face_encoding is still a BSON array are touched, so the
+command is safe to re-run and to interrupt.
+"""
+import argparse
+import asyncio
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent.parent))
+
+from pymongo import UpdateOne
+from backend.database.connection import client, user_collection
+from backend.utils.face_encoding import pack_encoding, ENCODING_FORMAT_VERSION
+
+async def migrate(batch_size: int, dry_run: bool):
+    legacy_filter = {"face_encoding": {"$type": "array"}}
+    total = await user_collection.count_documents(legacy_filter)
+    print(f"[MIGRATE] {total} user(s) with legacy face encodings")
+
+    migrated = 0
+    skipped = 0
+    batch = []
+    cursor = user_collection.find(legacy_filter, {"face_encoding": 1}).batch_size(batch_size)
+
+    async for user in cursor:
+        encoding = user.get("face_encoding")
+        if not encoding:
+            skipped += 1
+            continue
+
+        batch.append(UpdateOne(
+            # Match the array again so a concurrent re-registration is not overwritten
+            {"_id": user["_id"], "face_encoding": {"$type": "array"}},
+            {"$set": {
+                "face_encoding": pack_encoding(encoding),
+                "face_encoding_format": ENCODING_FORMAT_VERSION
+            }}
+        ))
+
+        if len(batch) >= batch_size:
+            migrated += await _flush(batch, dry_run)
+            batch = []
+            print(f"[MIGRATE] {migrated}/{total} migrated")
+
+    if batch:
+        migrated += await _flush(batch, dry_run)
+
+    print(f"[OK] Migrated {migrated} user(s), skipped {skipped} empty encoding(s){' (dry run)' if dry_run else ''}")
+
+async def _flush(batch, dry_run: bool) -> int:
+    if dry_run:
+        return len(batch)
+    result = await user_collection.bulk_write(batch, ordered=False)
+    return result.modified_count
+
+def main():
+    parser = argparse.ArgumentParser(description="Convert face encodings to the compact binary format")
+    parser.add_argument("--batch-size", type=int, default=500, help="Users per bulk write")
+    parser.add_argument("--dry-run", action="store_true", help="Count the work without writing")
+    args = parser.parse_args()
+
+    try:
+        asyncio.run(migrate(args.batch_size, args.dry_run))
+    finally:
+        client.close()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,119 @@
+"""Workload isolation for the API.
+
+Requests are admitted into one of three lanes, each with its own concurrency
+limit and bounded wait queue:
+
+* interactive - check-in and check-out, which students are waiting on;
+* read        - list and status endpoints;
+* bulk        - exports, reports and other whole-collection work.
+
+A lane that is full, or a request that waits longer than ADMISSION_QUEUE_TIMEOUT,
+gets an immediate 429 with Retry-After instead of queuing without bound. A
+teacher exporting during check-in can then only use the bulk lane's slots.
+
+Check-ins are additionally rate limited per event with a token bucket, so one
+event's opening surge cannot starve check-ins for the others.
+"""
+import asyncio
+import math
+import os
+import time
+
+from fastapi import HTTPException, status
+
+# lane -> (concurrent requests, requests allowed to wait for a slot)
+ADMISSION_LANES = {
+    "interactive": (
+        int(os.getenv("ADMISSION_INTERACTIVE_CONCURRENCY", "64")),
+        int(os.getenv("ADMISSION_INTERACTIVE_QUEUE", "256")),
+    ),
+    "read": (
+        int(os.getenv("ADMISSION_READ_CONCURRENCY", "32")),
+        int(os.getenv("ADMISSION_READ_QUEUE", "128")),
+    ),
+    "bulk": (
+        int(os.getenv("ADMISSION_BULK_CONCURRENCY", "2")),
+        int(os.getenv("ADMISSION_BULK_QUEUE", "4")),
+    ),
+}
+ADMISSION_QUEUE_TIMEOUT = float(os.getenv("ADMISSION_QUEUE_TIMEOUT", "5"))
+ADMISSION_RETRY_AFTER = int(os.getenv("ADMISSION_RETRY_AFTER", "1"))
+
+# Sustained check-ins per second per event, and the burst allowed on top; 0 disables
+CHECKIN_RATE_PER_EVENT = float(os.getenv("CHECKIN_RATE_PER_EVENT", "20"))
+CHECKIN_BURST_PER_EVENT = float(os.getenv("CHECKIN_BURST_PER_EVENT", "100"))
+CHECKIN_BUCKETS_MAX = 10000
+
+_lanes = {
+    name: {"semaphore": asyncio.Semaphore(limit), "limit": limit, "queue": queue, "waiting": 0, "rejected": 0}
+    for name, (limit, queue) in ADMISSION_LANES.items()
+}
+_buckets = {}
+_bucket_stats = {"throttled": 0}
+
+def _too_busy(detail: str, retry_after: int = ADMISSION_RETRY_AFTER):
+    return HTTPException(
+        status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+        detail=detail,
+        headers={"Retry-After": str(retry_after)},
+    )
+
+def admit(lane_name: str):
+    """FastAPI dependency that holds a slot in the lane for the request's duration"""
+    lane = _lanes[lane_name]
+
+    async def dependency():
+        if lane["waiting"] >= lane["queue"]:
+            lane["rejected"] += 1
+            raise _too_busy("Server is busy. Please try again shortly.")
+
+        lane["waiting"] += 1
+        try:
+            await asyncio.wait_for(lane["semaphore"].acquire(), ADMISSION_QUEUE_TIMEOUT)
+        except asyncio.TimeoutError:
+            lane["rejected"] += 1
+            raise _too_busy("Server is busy. Please try again shortly.")
+        finally:
+            lane["waiting"] -= 1
+
+        try:
+            yield
+        finally:
+            lane["semaphore"].release()
+
+    return dependency
+
+def take_check_in_token(event_id):
+    """Spend one check-in token for the event, raising 429 when the bucket is empty"""
+    if CHECKIN_RATE_PER_EVENT <= 0:
+        return
+
+    now = time.monotonic()
+    bucket = _buckets.get(event_id)
+    if bucket is None:
+        if len(_buckets) >= CHECKIN_BUCKETS_MAX:
+            _buckets.pop(next(iter(_buckets)))
+        bucket = _buckets[event_id] = [CHECKIN_BURST_PER_EVENT, now]
+
+    tokens = min(CHECKIN_BURST_PER_EVENT, bucket[0] + (now - bucket[1]) * CHECKIN_RATE_PER_EVENT)
+    if tokens < 1:
+        bucket[0], bucket[1] = tokens, now
+        _bucket_stats["throttled"] += 1
+        retry_after = max(1, math.ceil((1 - tokens) / CHECKIN_RATE_PER_EVENT))
+        raise _too_busy("Too many check-ins for this event right now. Please try again shortly.", retry_after)
+    bucket[0], bucket[1] = tokens - 1, now
+
+def stats() -> dict:
+    return {
+        "lanes": {
+            name: {
+                "limit": lane["limit"],
+                "in_use": lane["limit"] - lane["semaphore"]._value,
+                "waiting": lane["waiting"],
+                "rejected": lane["rejected"],
+            }
+            for name, lane in _lanes.items()
+        },
+        "check_in_buckets": len(_buckets),
+        **_bucket_stats,
+    }
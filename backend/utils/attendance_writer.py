@@ -0,0 +1,116 @@
+"""Optional write-behind batching of attendance writes.
+
+When ATTENDANCE_WRITE_BUFFER is enabled, check-in and check-out writes are
+collected for up to ATTENDANCE_FLUSH_INTERVAL_MS (or until
+ATTENDANCE_FLUSH_SIZE are waiting) and sent as one unordered bulk_write.
+Every caller awaits its own future, which resolves only once the batch has
+been acknowledged. A request therefore never reports success for a write the
+database has not accepted. Per-operation write errors, such as duplicate key
+errors from the unique attendance index, are raised to the caller who owns
+the operation.
+"""
+import asyncio
+import os
+
+from pymongo.errors import BulkWriteError, DuplicateKeyError, WriteError
+
+from backend.database.connection import attendance_collection
+
+ATTENDANCE_WRITE_BUFFER = os.getenv("ATTENDANCE_WRITE_BUFFER", "false").lower() == "true"
+ATTENDANCE_FLUSH_SIZE = int(os.getenv("ATTENDANCE_FLUSH_SIZE", "100"))
+ATTENDANCE_FLUSH_INTERVAL_MS = float(os.getenv("ATTENDANCE_FLUSH_INTERVAL_MS", "5"))
+
+_pending = []
+_flush_handle = None
+_tasks = set()
+_stats = {"batches": 0, "operations": 0, "max_batch": 0, "errors": 0}
+
+def enabled() -> bool:
+    return ATTENDANCE_WRITE_BUFFER
+
+async def write(operation):
+    """Queue one pymongo write operation and wait until its batch is acknowledged.
+
+    Returns {"upserted_id": ObjectId or None, "matched": True or None}.
+    "matched" is None when the batch cannot prove that a non-upsert update
+    matched a document; the caller should then read the record back.
+    """
+    global _flush_handle
+    future = asyncio.get_running_loop().create_future()
+    _pending.append((operation, future))
+
+    if len(_pending) >= ATTENDANCE_FLUSH_SIZE:
+        _schedule_flush()
+    elif _flush_handle is None:
+        _flush_handle = asyncio.get_running_loop().call_later(ATTENDANCE_FLUSH_INTERVAL_MS / 1000, _schedule_flush)
+    return await future
+
+def _schedule_flush():
+    global _flush_handle
+    if _flush_handle is not None:
+        _flush_handle.cancel()
+        _flush_handle = None
+    if not _pending:
+        return
+    batch = _pending[:]
+    _pending.clear()
+    task = asyncio.create_task(_flush(batch))
+    _tasks.add(task)
+    task.add_done_callback(_tasks.discard)
+
+async def _flush(batch):
+    operations = [operation for operation, _ in batch]
+    _stats["batches"] += 1
+    _stats["operations"] += len(batch)
+    _stats["max_batch"] = max(_stats["max_batch"], len(batch))
+
+    errors = {}
+    try:
+        result = await attendance_collection.bulk_write(operations, ordered=False)
+        details = result.bulk_api_result
+    except BulkWriteError as e:
+        details = e.details
+        for error in details.get("writeErrors", []):
+            errors[error["index"]] = error
+    except Exception as e:
+        _stats["errors"] += len(batch)
+        for _, future in batch:
+            if not future.done():
+                future.set_exception(e)
+        return
+
+    upserted = {entry["index"]: entry["_id"] for entry in details.get("upserted", [])}
+    # Every successful operation that did not upsert should have matched a
+    # document; if the totals disagree, at least one update matched nothing
+    expected_matches = len(batch) - len(errors) - len(upserted)
+    all_matched = details.get("nMatched", 0) == expected_matches
+
+    for index, (_, future) in enumerate(batch):
+        if future.done():
+            continue
+        error = errors.get(index)
+        if error:
+            _stats["errors"] += 1
+            exception_type = DuplicateKeyError if error.get("code") == 11000 else WriteError
+            future.set_exception(exception_type(error.get("errmsg"), error.get("code"), error))
+        elif index in upserted:
+            future.set_result({"upserted_id": upserted[index], "matched": False})
+        else:
+            future.set_result({"upserted_id": None, "matched": True if all_matched else None})
+
+async def drain():
+    """Flush whatever is queued and wait for in-flight batches (used at shutdown)"""
+    _schedule_flush()
+    if _tasks:
+        await asyncio.gather(*_tasks, return_exceptions=True)
+
+def stats() -> dict:
+    batches = _stats["batches"]
+    return {
+        "enabled": ATTENDANCE_WRITE_BUFFER,
+        "pending": len(_pending),
+        "flush_size": ATTENDANCE_FLUSH_SIZE,
+        "flush_interval_ms": ATTENDANCE_FLUSH_INTERVAL_MS,
+        "avg_batch": round(_stats["operations"] / batches, 2) if batches else 0,
+        **_stats,
+    }
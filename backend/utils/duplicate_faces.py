@@ -0,0 +1,135 @@
+"""Detect accounts that registered the same face.
+
+All stored encodings are stacked into one float32 matrix and compared in
+blocks of rows x columns. A 1024 x 1024 block of float32 distances is 4 MB,
+so with its temporaries the working set stays around 16 MB however many
+users there are, while every block is a single BLAS matrix product. Pairs closer than
+DUPLICATE_FACE_THRESHOLD are grouped into clusters with union-find.
+
+For incremental checks on register_face, the matrix is kept in memory once
+built and only the new row is compared against it.
+"""
+import os
+
+import numpy as np
+
+from backend.utils import face_cache
+from backend.utils.face_encoding import unpack_encoding
+
+# Stricter than the 0.6 verification tolerance to keep false positives rare
+DUPLICATE_FACE_THRESHOLD = float(os.getenv("DUPLICATE_FACE_THRESHOLD", "0.5"))
+DUPLICATE_FACE_BLOCK_SIZE = int(os.getenv("DUPLICATE_FACE_BLOCK_SIZE", "1024"))
+DUPLICATE_FACE_CHECK_ON_REGISTER = os.getenv("DUPLICATE_FACE_CHECK_ON_REGISTER", "false").lower() == "true"
+
+_index = None
+
+async def load_all_encodings():
+    """Return (user_ids, matrix) for every user with a registered face"""
+    from backend.database.connection import user_collection
+
+    ids = []
+    rows = []
+    async for user in user_collection.find(
+        {"face_encoding": {"$exists": True}},
+        face_cache.ENCODING_PROJECTION
+    ).batch_size(2000):
+        encoding = unpack_encoding(user.get("face_encoding"))
+        if encoding is not None and encoding.size:
+            ids.append(str(user["_id"]))
+            rows.append(encoding)
+
+    matrix = np.vstack(rows).astype(np.float32) if rows else np.empty((0, 128), dtype=np.float32)
+    return ids, matrix
+
+def find_duplicate_pairs(matrix: np.ndarray, threshold: float = None, block_size: int = None):
+    """Return (i, j, distance) for every pair i < j closer than the threshold"""
+    threshold = DUPLICATE_FACE_THRESHOLD if threshold is None else threshold
+    block_size = block_size or DUPLICATE_FACE_BLOCK_SIZE
+    sq_threshold = threshold * threshold
+
+    n = matrix.shape[0]
+    sq_norms = np.einsum("ij,ij->i", matrix, matrix)
+    pairs = []
+
+    for row_start in range(0, n, block_size):
+        rows = matrix[row_start:row_start + block_size]
+        row_norms = sq_norms[row_start:row_start + block_size]
+        # Only the upper triangle is needed, so column blocks start at the row block
+        for col_start in range(row_start, n, block_size):
+            cols = matrix[col_start:col_start + block_size]
+            sq_distances = row_norms[:, None] + sq_norms[col_start:col_start + block_size][None, :] - 2.0 * rows @ cols.T
+
+            hits_i, hits_j = np.nonzero(sq_distances < sq_threshold)
+            for i, j in zip(hits_i, hits_j):
+                a, b = row_start + int(i), col_start + int(j)
+                if a < b:
+                    pairs.append((a, b, float(np.sqrt(max(sq_distances[i, j], 0.0)))))
+
+    return pairs
+
+def cluster_pairs(pairs):
+    """Group pair indices into clusters (lists of indices) with union-find"""
+    parent = {}
+
+    def find(x):
+        parent.setdefault(x, x)
+        while parent[x] != x:
+            parent[x] = parent[parent[x]]
+            x = parent[x]
+        return x
+
+    for a, b, _ in pairs:
+        root_a, root_b = find(a), find(b)
+        if root_a != root_b:
+            parent[root_b] = root_a
+
+    clusters = {}
+    for x in parent:
+        clusters.setdefault(find(x), []).append(x)
+    return [sorted(members) for members in clusters.values()]
+
+def find_duplicate_clusters(ids, matrix, threshold: float = None):
+    """Return clusters of user ids whose faces are closer than the threshold"""
+    pairs = find_duplicate_pairs(matrix, threshold)
+    closest = {}
+    for a, b, distance in pairs:
+        for x in (a, b):
+            closest[x] = min(closest.get(x, distance), distance)
+
+    return [
+        {
+            "user_ids": [ids[i] for i in members],
+            "min_distance": round(min(closest[i] for i in members), 4),
+        }
+        for members in cluster_pairs(pairs)
+    ]
+
+async def check_registration(user_id: str, encoding):
+    """Compare one newly registered encoding against the in-memory index.
+
+    Builds the index on first use, then updates it in place. Returns the ids
+    of other users whose stored face is within the duplicate threshold.
+    """
+    global _index
+    if _index is None:
+        ids, matrix = await load_all_encodings()
+        _index = {"ids": ids, "matrix": matrix, "sq_norms": np.einsum("ij,ij->i", matrix, matrix)}
+
+    row = np.asarray(encoding, dtype=np.float32)
+    matches = []
+    if _index["matrix"].shape[0]:
+        sq_distances = _index["sq_norms"] + row @ row - 2.0 * _index["matrix"] @ row
+        for index in np.flatnonzero(sq_distances < DUPLICATE_FACE_THRESHOLD ** 2):
+            if _index["ids"][index] != user_id:
+                matches.append(_index["ids"][index])
+
+    if user_id in _index["ids"]:
+        position = _index["ids"].index(user_id)
+        _index["matrix"][position] = row
+        _index["sq_norms"][position] = row @ row
+    else:
+        _index["ids"].append(user_id)
+        _index["matrix"] = np.vstack([_index["matrix"], row[None, :]])
+        _index["sq_norms"] = np.append(_index["sq_norms"], row @ row)
+
+    return matches
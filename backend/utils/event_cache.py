@@ -0,0 +1,66 @@
+"""In-process TTL cache of event documents for the check-in path.
+
+Check-in, check-out, kiosk and group check-in only need an event's geofence and
+time windows, which rarely change while the event is running. Entries are
+trusted for EVENT_CACHE_TTL seconds. After that a projected read of the event's
+`cache_version` stamp, which update_event increments on every change,
+revalidates the entry. So other workers pick up edits, deactivations and
+deletions within one TTL without re-reading the full document.
+"""
+import os
+import time
+from collections import OrderedDict
+
+from backend.database.connection import event_collection
+
+EVENT_CACHE_TTL = float(os.getenv("EVENT_CACHE_TTL", "30"))
+EVENT_CACHE_SIZE = int(os.getenv("EVENT_CACHE_SIZE", "1000"))
+
+VERSION_PROJECTION = {"cache_version": 1}
+
+# event_id -> (cache_version, event, checked_at)
+_entries: "OrderedDict[object, tuple]" = OrderedDict()
+_stats = {"hits": 0, "revalidated": 0, "misses": 0}
+
+def _store(event: dict):
+    _entries[event["_id"]] = (event.get("cache_version", 0), event, time.monotonic())
+    _entries.move_to_end(event["_id"])
+    while len(_entries) > EVENT_CACHE_SIZE:
+        _entries.popitem(last=False)
+
+async def get(event_id):
+    """Return the event document, or None if it does not exist.
+
+    The returned dict is shared between requests and must not be modified.
+    """
+    entry = _entries.get(event_id)
+    if entry:
+        version, event, checked_at = entry
+        if time.monotonic() - checked_at < EVENT_CACHE_TTL:
+            _entries.move_to_end(event_id)
+            _stats["hits"] += 1
+            return event
+
+        stamp = await event_collection.find_one({"_id": event_id}, VERSION_PROJECTION)
+        if stamp is None:
+            _entries.pop(event_id, None)
+            return None
+        if stamp.get("cache_version", 0) == version:
+            _entries[event_id] = (version, event, time.monotonic())
+            _entries.move_to_end(event_id)
+            _stats["revalidated"] += 1
+            return event
+
+    _stats["misses"] += 1
+    event = await event_collection.find_one({"_id": event_id})
+    if event:
+        _store(event)
+    else:
+        _entries.pop(event_id, None)
+    return event
+
+def invalidate(event_id):
+    _entries.pop(event_id, None)
+
+def stats() -> dict:
+    return {"size": len(_entries), "capacity": EVENT_CACHE_SIZE, **_stats}
@@ -0,0 +1,208 @@
+"""In-process LRU cache of decoded face encodings for the check-in path.
+
+Entries are keyed by user id and carry the user's face_encoding_rev, which
+register_face increments on every re-registration. A load that read an older
+revision than the one already cached is discarded, so a check-in racing with a
+re-registration cannot put a stale encoding back into the cache.
+
+Re-registration only clears the cache of the worker that handled it, so like
+event_cache, entries are trusted for FACE_CACHE_TTL seconds and then
+revalidated with a projected read of face_encoding_rev. Other workers drop an
+outdated encoding within one TTL.
+
+Optionally, a background task preloads the encodings of every approved student
+in an event's department shortly before that event's check-in opens, and
+revalidates the whole roster in one query when check-in opens so the first
+check-ins find entries that are still within their TTL.
+"""
+import asyncio
+import os
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta
+
+from bson import ObjectId
+
+from backend.utils.face_encoding import unpack_encoding
+
+FACE_CACHE_SIZE = int(os.getenv("FACE_CACHE_SIZE", "5000"))
+FACE_CACHE_TTL = float(os.getenv("FACE_CACHE_TTL", "30"))
+# Minutes before check_in_start to preload an event's roster; 0 disables warm-up
+FACE_CACHE_WARMUP_LEAD_MINUTES = int(os.getenv("FACE_CACHE_WARMUP_LEAD_MINUTES", "10"))
+FACE_CACHE_WARMUP_INTERVAL = int(os.getenv("FACE_CACHE_WARMUP_INTERVAL", "60"))
+
+# Projection for loading exactly what the cache needs
+ENCODING_PROJECTION = {"face_encoding": 1, "face_encoding_rev": 1}
+REV_PROJECTION = {"face_encoding_rev": 1}
+
+# user_id -> (face_encoding_rev, encoding, checked_at)
+_entries: "OrderedDict[str, tuple]" = OrderedDict()
+_stats = {"hits": 0, "revalidated": 0, "misses": 0, "evictions": 0}
+_warmed_events = {}
+
+async def get_many(user_ids) -> dict:
+    """Return {user_id: encoding} for the users whose cached encoding is current.
+
+    Entries older than FACE_CACHE_TTL are checked against the stored revision in
+    one projected query; outdated ones are dropped and count as misses.
+    """
+    found = {}
+    stale = {}
+    now = time.monotonic()
+    for user_id in user_ids:
+        entry = _entries.get(user_id)
+        if entry is None:
+            _stats["misses"] += 1
+        elif now - entry[2] < FACE_CACHE_TTL:
+            _entries.move_to_end(user_id)
+            _stats["hits"] += 1
+            found[user_id] = entry[1]
+        else:
+            stale[user_id] = entry
+
+    if stale:
+        found.update(await _revalidate(stale))
+    return found
+
+async def _revalidate(stale: dict) -> dict:
+    """Check cached entries against the stored revisions in one projected query.
+
+    Current entries are restamped and returned as {user_id: encoding}; outdated
+    ones are dropped.
+    """
+    from backend.database.connection import user_collection
+
+    revs = {}
+    async for user in user_collection.find(
+        {"_id": {"$in": [ObjectId(user_id) for user_id in stale if ObjectId.is_valid(user_id)]}},
+        REV_PROJECTION
+    ):
+        revs[str(user["_id"])] = user.get("face_encoding_rev", 0)
+
+    found = {}
+    now = time.monotonic()
+    for user_id, (rev, encoding, _) in stale.items():
+        if revs.get(user_id) == rev:
+            _entries[user_id] = (rev, encoding, now)
+            _entries.move_to_end(user_id)
+            _stats["revalidated"] += 1
+            found[user_id] = encoding
+        else:
+            _entries.pop(user_id, None)
+            _stats["misses"] += 1
+    return found
+
+async def get(user_id: str):
+    """Return the current cached encoding for a user, or None on a miss"""
+    return (await get_many([user_id])).get(user_id)
+
+def put(user_id: str, rev: int, encoding):
+    """Cache an encoding unless a newer revision is already cached"""
+    current = _entries.get(user_id)
+    if current is not None and current[0] > rev:
+        return
+    _entries[user_id] = (rev, encoding, time.monotonic())
+    _entries.move_to_end(user_id)
+    while len(_entries) > FACE_CACHE_SIZE:
+        _entries.popitem(last=False)
+        _stats["evictions"] += 1
+
+def put_document(user: dict):
+    """Cache the encoding from a user document loaded with ENCODING_PROJECTION"""
+    encoding = unpack_encoding(user.get("face_encoding"))
+    if encoding is not None:
+        put(str(user["_id"]), user.get("face_encoding_rev", 0), encoding)
+    return encoding
+
+def invalidate(user_id: str):
+    _entries.pop(str(user_id), None)
+
+def stats() -> dict:
+    return {"size": len(_entries), "capacity": FACE_CACHE_SIZE, **_stats}
+
+async def warm_event(event: dict) -> list:
+    """Preload the encodings of all approved students in the event's department.
+
+    Returns the roster's user ids, for revalidate_roster() when check-in opens.
+    """
+    from backend.database.connection import enrollment_collection, user_collection
+
+    department_id = event.get("department_id")
+    if not department_id:
+        return []
+
+    roster = []
+    user_ids = []
+    async for enrollment in enrollment_collection.find(
+        {"department_id": department_id, "status": "approved"},
+        {"user_id": 1}
+    ):
+        user_id = enrollment.get("user_id")
+        if user_id and ObjectId.is_valid(user_id):
+            roster.append(user_id)
+            if user_id not in _entries:
+                user_ids.append(ObjectId(user_id))
+
+    loaded = 0
+    if user_ids:
+        async for user in user_collection.find(
+            {"_id": {"$in": user_ids}, "face_encoding": {"$exists": True}},
+            ENCODING_PROJECTION
+        ):
+            if put_document(user) is not None:
+                loaded += 1
+
+    print(f"[FACE CACHE] Warmed {loaded} encoding(s) for event '{event.get('name', event.get('_id'))}'")
+    return roster
+
+async def revalidate_roster(user_ids) -> int:
+    """Restamp every cached roster entry whose revision is current, in one query"""
+    stale = {user_id: _entries[user_id] for user_id in user_ids if user_id in _entries}
+    if not stale:
+        return 0
+    return len(await _revalidate(stale))
+
+async def warmup_loop():
+    """Periodically warm rosters of events whose check-in opens soon"""
+    from backend.database.connection import event_collection
+
+    lead = timedelta(minutes=FACE_CACHE_WARMUP_LEAD_MINUTES)
+    while True:
+        delay = FACE_CACHE_WARMUP_INTERVAL
+        try:
+            now = datetime.now()
+            async for event in event_collection.find(
+                {
+                    "check_in_start": {"$gte": now - lead, "$lte": now + lead},
+                    "is_active": {"$ne": False}
+                },
+                {"name": 1, "department_id": 1, "check_in_start": 1}
+            ):
+                if event["_id"] in _warmed_events:
+                    continue
+                _warmed_events[event["_id"]] = {
+                    "check_in_start": event["check_in_start"],
+                    "roster": await warm_event(event),
+                    # Loaded just now, so an event already open needs no revalidation
+                    "revalidated": event["check_in_start"] <= now,
+                }
+
+            # Entries warmed minutes ahead are past their TTL when check-in opens;
+            # revalidate each roster in one query at that moment
+            for event_id, warmed in list(_warmed_events.items()):
+                if warmed["check_in_start"] < now - lead:
+                    # Forget events whose check-in opened well in the past
+                    del _warmed_events[event_id]
+                elif not warmed["revalidated"]:
+                    if warmed["check_in_start"] <= now:
+                        current = await revalidate_roster(warmed["roster"])
+                        warmed["revalidated"] = True
+                        print(f"[FACE CACHE] Revalidated {current} encoding(s) for event {event_id} as check-in opened")
+                    else:
+                        delay = min(delay, (warmed["check_in_start"] - now).total_seconds())
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            print(f"[FACE CACHE] Warm-up error: {str(e)}")
+
+        await asyncio.sleep(delay)
@@ -0,0 +1,45 @@
+"""Compact storage format for face encodings.
+
+Encodings are stored as a BSON Binary blob: a 4-byte header (format version,
+dtype code, dimension) followed by little-endian float32 values. 128 floats
+take 516 bytes instead of a 128-element BSON array of doubles (~2 KB), and
+decoding is a zero-copy np.frombuffer over the blob.
+
+Older documents still hold a plain list of floats; unpack_encoding accepts both
+until backend/scripts/migrate_face_encodings.py has rewritten them.
+"""
+import struct
+
+import numpy as np
+from bson.binary import Binary
+
+ENCODING_FORMAT_VERSION = 1
+ENCODING_BINARY_SUBTYPE = 0x80  # BSON user-defined binary subtype
+_DTYPE_FLOAT32 = 1
+_HEADER = struct.Struct("<BBH")
+
+# Projection for user reads that never need the encoding blob
+WITHOUT_FACE_ENCODING = {"face_encoding": 0}
+
+# Computed field telling whether a user has a face registered, in either format
+HAS_FACE_REGISTERED = {"$in": [{"$type": "$face_encoding"}, ["binData", "array"]]}
+
+def pack_encoding(encoding) -> Binary:
+    """Serialize a face encoding into a versioned float32 Binary blob"""
+    values = np.ascontiguousarray(encoding, dtype="<f4").ravel()
+    header = _HEADER.pack(ENCODING_FORMAT_VERSION, _DTYPE_FLOAT32, values.size)
+    return Binary(header + values.tobytes(), subtype=ENCODING_BINARY_SUBTYPE)
+
+def unpack_encoding(stored) -> np.ndarray:
+    """Decode a stored face encoding (Binary blob or legacy list) to a float32 array"""
+    if stored is None:
+        return None
+
+    if isinstance(stored, (list, tuple)):
+        return np.asarray(stored, dtype=np.float32)
+
+    version, dtype_code, size = _HEADER.unpack_from(stored)
+    if version != ENCODING_FORMAT_VERSION or dtype_code != _DTYPE_FLOAT32:
+        raise ValueError(f"Unsupported face encoding format (version {version}, dtype {dtype_code})")
+
+    return np.frombuffer(stored, dtype="<f4", count=size, offset=_HEADER.size)
@@ -0,0 +1,251 @@
+"""Dedicated process pool for CPU-heavy face recognition work.
+
+dlib releases the GIL only partially and a single encoding can take a second
+or more, so face jobs run in their own worker processes instead of Starlette's
+shared thread pool. Each worker imports face_recognition once at startup (which
+loads the dlib models), and the number of jobs waiting for a worker is bounded
+so a check-in surge gets a fast 503 instead of an unbounded queue.
+"""
+import asyncio
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Optional
+
+import numpy as np
+from fastapi import HTTPException, status
+
+from backend.utils.image_pipeline import load_face_image, face_box_location
+
+FACE_POOL_WORKERS = int(os.getenv("FACE_POOL_WORKERS", str(max(1, (os.cpu_count() or 2) - 1))))
+FACE_POOL_QUEUE_DEPTH = int(os.getenv("FACE_POOL_QUEUE_DEPTH", "32"))
+FACE_JOB_TIMEOUT = float(os.getenv("FACE_JOB_TIMEOUT", "10"))
+FACE_POOL_RETRY_AFTER = int(os.getenv("FACE_POOL_RETRY_AFTER", "2"))
+FACE_MATCH_TOLERANCE = float(os.getenv("FACE_MATCH_TOLERANCE", "0.6"))
+
+# Per-deployment detector settings: "hog" is CPU friendly, "cnn" is more
+# accurate but needs a GPU to be practical
+FACE_DETECTION_MODEL = os.getenv("FACE_DETECTION_MODEL", "hog")
+FACE_UPSAMPLE_TIMES = int(os.getenv("FACE_UPSAMPLE_TIMES", "1"))
+FACE_NUM_JITTERS = int(os.getenv("FACE_NUM_JITTERS", "1"))
+# Extra context around a client face box, as a fraction of its size, so a face
+# that is slightly off the guide is still fully inside the detection region
+FACE_BOX_DETECT_MARGIN = float(os.getenv("FACE_BOX_DETECT_MARGIN", "0.25"))
+
+# ---------------------------------------------------------------------------
+# Worker side - these functions run inside the pool processes
+# ---------------------------------------------------------------------------
+
+face_recognition = None
+
+def _init_worker():
+    """Load face_recognition (and with it the dlib models) once per worker"""
+    global face_recognition
+    import face_recognition as fr
+    face_recognition = fr
+
+def _ping():
+    return os.getpid()
+
+def _detect(image):
+    return face_recognition.face_locations(
+        image,
+        number_of_times_to_upsample=FACE_UPSAMPLE_TIMES,
+        model=FACE_DETECTION_MODEL,
+    )
+
+def _detect_in_box(image, location):
+    """Run the detector on the box region only; locations are in image coordinates.
+
+    The client box is just the on-screen guide, not a detected face, so it only
+    narrows where we look - the detector still has to find a face there.
+    """
+    top, right, bottom, left = location
+    margin_y = int((bottom - top) * FACE_BOX_DETECT_MARGIN)
+    margin_x = int((right - left) * FACE_BOX_DETECT_MARGIN)
+    top, bottom = max(0, top - margin_y), min(image.shape[0], bottom + margin_y)
+    left, right = max(0, left - margin_x), min(image.shape[1], right + margin_x)
+
+    crop = np.ascontiguousarray(image[top:bottom, left:right])
+    return [(t + top, r + left, b + top, l + left) for t, r, b, l in _detect(crop)]
+
+def _encode(image, locations):
+    if not locations:
+        return []
+    return face_recognition.face_encodings(image, known_face_locations=locations, num_jitters=FACE_NUM_JITTERS)
+
+def encode_faces(image_bytes, max_side=None, face_box=None):
+    """Return the 128-d encodings of every face found in the image.
+
+    A plausible client face box limits detection to that region, which is much
+    cheaper than searching the full frame. Without a box, or when no face is
+    found inside it, the whole frame is searched.
+    """
+    image = load_face_image(image_bytes, max_side)
+
+    location = face_box_location(image, face_box)
+    if location:
+        locations = _detect_in_box(image, location)
+        if locations:
+            return _encode(image, locations)
+    elif face_box:
+        print("[FACE POOL] Client face box failed sanity checks, running full detection")
+
+    return _encode(image, _detect(image))
+
+def _first_matches(known_encoding, encodings) -> bool:
+    if not encodings:
+        return False
+    results = face_recognition.compare_faces([known_encoding], encodings[0], tolerance=FACE_MATCH_TOLERANCE)
+    return bool(results[0])
+
+def verify_face(known_encoding, image_bytes, face_box=None):
+    """Check whether the first face in the image matches the known encoding"""
+    try:
+        image = load_face_image(image_bytes)
+        known_encoding = np.asarray(known_encoding)
+
+        location = face_box_location(image, face_box)
+        if location:
+            if _first_matches(known_encoding, _encode(image, _detect_in_box(image, location))):
+                return True
+            # The face in the guide may be someone else, or the student may
+            # stand off-center; search the whole frame before rejecting
+        elif face_box:
+            print("[FACE POOL] Client face box failed sanity checks, running full detection")
+
+        return _first_matches(known_encoding, _encode(image, _detect(image)))
+    except Exception as e:
+        print(f"Face verification error: {e}")
+        return False
+
+# ---------------------------------------------------------------------------
+# Server side - submission, backpressure and metrics
+# ---------------------------------------------------------------------------
+
+_executor: Optional[ProcessPoolExecutor] = None
+_in_flight = 0
+
+_metrics = {
+    "submitted": 0,
+    "completed": 0,
+    "failed": 0,
+    "rejected": 0,
+    "timed_out": 0,
+    "peak_in_flight": 0,
+    "total_job_seconds": 0.0,
+}
+
+def _busy(detail: str) -> HTTPException:
+    return HTTPException(
+        status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+        detail=detail,
+        headers={"Retry-After": str(FACE_POOL_RETRY_AFTER)},
+    )
+
+def start():
+    """Start the worker processes (called from the app lifespan)"""
+    global _executor
+    if _executor is None:
+        # Spawn rather than fork: the server process already runs the event loop
+        # and motor's threads, and a forked copy of their locks can deadlock
+        _executor = ProcessPoolExecutor(
+            max_workers=FACE_POOL_WORKERS,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_init_worker,
+        )
+        # Workers are spawned on demand; submit one no-op per worker so every
+        # process is up and has its models loaded before real traffic arrives
+        for _ in range(FACE_POOL_WORKERS):
+            _executor.submit(_ping)
+        print(f"[FACE POOL] Started {FACE_POOL_WORKERS} worker(s), queue depth {FACE_POOL_QUEUE_DEPTH}")
+    return _executor
+
+def shutdown():
+    """Stop the worker processes without waiting for queued jobs"""
+    global _executor
+    if _executor is not None:
+        _executor.shutdown(wait=False, cancel_futures=True)
+        _executor = None
+        print("[FACE POOL] Stopped")
+
+def _release():
+    global _in_flight
+    _in_flight -= 1
+
+def _release_threadsafe(loop):
+    # Done callbacks run on the executor's management thread
+    try:
+        loop.call_soon_threadsafe(_release)
+    except RuntimeError:
+        # The loop is closed at shutdown; nothing reads the counter any more
+        pass
+
+async def run(fn, *args, timeout: float = None):
+    """Run a face job in the pool.
+
+    Raises a 503 HTTPException with Retry-After when the queue is full, the
+    job exceeds its timeout, or the pool has crashed.
+    """
+    global _in_flight, _executor
+
+    capacity = FACE_POOL_WORKERS + FACE_POOL_QUEUE_DEPTH
+    if _in_flight >= capacity:
+        _metrics["rejected"] += 1
+        print(f"[FACE POOL] Queue full ({_in_flight}/{capacity}), rejecting job")
+        raise _busy("Face verification is busy. Please try again in a moment.")
+
+    executor = start()
+    loop = asyncio.get_running_loop()
+    _in_flight += 1
+    _metrics["submitted"] += 1
+    _metrics["peak_in_flight"] = max(_metrics["peak_in_flight"], _in_flight)
+    started = time.perf_counter()
+    job = None
+    try:
+        job = executor.submit(fn, *args)
+        # A timed-out job keeps its worker busy until it really ends, so the slot
+        # is released when the process future finishes, not when we stop waiting
+        job.add_done_callback(lambda _: _release_threadsafe(loop))
+        result = await asyncio.wait_for(asyncio.wrap_future(job), timeout or FACE_JOB_TIMEOUT)
+        _metrics["completed"] += 1
+        return result
+    except asyncio.TimeoutError:
+        _metrics["timed_out"] += 1
+        print(f"[FACE POOL] Job {fn.__name__} timed out after {timeout or FACE_JOB_TIMEOUT}s")
+        raise _busy("Face verification timed out. Please try again.")
+    except BrokenProcessPool:
+        _metrics["failed"] += 1
+        print("[FACE POOL] Worker process died, restarting pool")
+        if _executor is executor:
+            _executor = None
+            executor.shutdown(wait=False, cancel_futures=True)
+        raise _busy("Face verification is restarting. Please try again.")
+    except Exception:
+        _metrics["failed"] += 1
+        raise
+    finally:
+        if job is None:
+            # Never submitted (the pool was broken)
+            _release()
+        _metrics["total_job_seconds"] += time.perf_counter() - started
+
+def stats() -> dict:
+    """Queue depth and throughput counters for the health endpoint"""
+    finished = _metrics["completed"] + _metrics["failed"] + _metrics["timed_out"]
+    return {
+        "running": _executor is not None,
+        "workers": FACE_POOL_WORKERS,
+        "queue_capacity": FACE_POOL_QUEUE_DEPTH,
+        "in_flight": _in_flight,
+        "queued": max(0, _in_flight - FACE_POOL_WORKERS),
+        "peak_in_flight": _metrics["peak_in_flight"],
+        "submitted": _metrics["submitted"],
+        "completed": _metrics["completed"],
+        "failed": _metrics["failed"],
+        "rejected": _metrics["rejected"],
+        "timed_out": _metrics["timed_out"],
+        "avg_job_ms": round(_metrics["total_job_seconds"] * 1000 / finished, 1) if finished else 0.0,
+    }
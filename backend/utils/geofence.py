@@ -0,0 +1,236 @@
+"""Fast geofence distance checks.
+
+Haversine on a sphere is within ~0.5% of the ellipsoidal (Karney) geodesic,
+which is far below GPS noise for a campus-sized radius. Only when a point lands
+inside a thin band around the radius - where that error could flip the answer -
+do we pay for geopy's exact geodesic.
+
+The batch API evaluates many points against many circles at once with NumPy
+for the bulk and analytics paths.
+
+Events may also carry a GeoJSON Polygon or MultiPolygon `geofence`. Its
+bounding boxes and edge arrays are prepared once per geofence revision and
+cached, so a containment test is a bbox comparison plus one vectorized
+crossing count over the edges.
+"""
+import math
+import os
+
+import numpy as np
+from geopy.distance import geodesic
+
+EARTH_RADIUS_M = 6371008.8  # mean Earth radius (IUGG)
+
+# Points closer to the radius than this are re-measured with the exact geodesic
+GEOFENCE_EXACT_BAND_M = float(os.getenv("GEOFENCE_EXACT_BAND_M", "1.0"))
+GEOFENCE_EXACT_BAND_RATIO = 0.005
+
+def haversine_m(lat1: float, lon1: float, lat2: float, lon2: float) -> float:
+    """Great-circle distance in meters"""
+    phi1 = math.radians(lat1)
+    phi2 = math.radians(lat2)
+    dphi = phi2 - phi1
+    dlambda = math.radians(lon2 - lon1)
+    a = math.sin(dphi / 2) ** 2 + math.cos(phi1) * math.cos(phi2) * math.sin(dlambda / 2) ** 2
+    return 2 * EARTH_RADIUS_M * math.asin(min(1.0, math.sqrt(a)))
+
+def _band(radius: float) -> float:
+    return max(GEOFENCE_EXACT_BAND_M, radius * GEOFENCE_EXACT_BAND_RATIO)
+
+def check_circle(user_lat: float, user_lon: float, center_lat: float, center_lon: float, radius: float):
+    """Return (inside, distance_m) for a point against a circular geofence"""
+    distance = haversine_m(user_lat, user_lon, center_lat, center_lon)
+    if abs(distance - radius) <= _band(radius):
+        distance = geodesic((user_lat, user_lon), (center_lat, center_lon)).meters
+    return distance <= radius, distance
+
+def haversine_matrix(lats, lons, center_lats, center_lons) -> np.ndarray:
+    """Distances in meters from every point (rows) to every center (columns)"""
+    phi1 = np.radians(np.asarray(lats, dtype=np.float64))[:, None]
+    lam1 = np.radians(np.asarray(lons, dtype=np.float64))[:, None]
+    phi2 = np.radians(np.asarray(center_lats, dtype=np.float64))[None, :]
+    lam2 = np.radians(np.asarray(center_lons, dtype=np.float64))[None, :]
+
+    a = np.sin((phi2 - phi1) / 2) ** 2 + np.cos(phi1) * np.cos(phi2) * np.sin((lam2 - lam1) / 2) ** 2
+    return 2 * EARTH_RADIUS_M * np.arcsin(np.minimum(1.0, np.sqrt(a)))
+
+def check_circles_batch(lats, lons, center_lats, center_lons, radii):
+    """Evaluate many points against many circular geofences at once.
+
+    Returns (inside, distances), both shaped (points, circles). Entries inside
+    the exact band are re-measured with the geodesic, which is rare.
+    """
+    radii = np.asarray(radii, dtype=np.float64)[None, :]
+    distances = haversine_matrix(lats, lons, center_lats, center_lons)
+
+    band = np.maximum(GEOFENCE_EXACT_BAND_M, radii * GEOFENCE_EXACT_BAND_RATIO)
+    for i, j in zip(*np.nonzero(np.abs(distances - radii) <= band)):
+        distances[i, j] = geodesic((lats[i], lons[i]), (center_lats[j], center_lons[j])).meters
+
+    return distances <= radii, distances
+
+def point_geometry(lat: float, lon: float) -> dict:
+    """GeoJSON Point for an event location (GeoJSON order is longitude, latitude)"""
+    return {"type": "Point", "coordinates": [float(lon), float(lat)]}
+
+# Polygon geofences
+
+GEOFENCE_TYPES = ("Polygon", "MultiPolygon")
+GEOFENCE_PREPARED_CACHE_SIZE = int(os.getenv("GEOFENCE_PREPARED_CACHE_SIZE", "512"))
+
+_prepared = {}
+
+def normalize_geometry(geometry: dict) -> dict:
+    """Validate a GeoJSON Polygon/MultiPolygon and close any open rings.
+
+    Raises ValueError with a user-facing message on malformed input.
+    """
+    if not isinstance(geometry, dict) or geometry.get("type") not in GEOFENCE_TYPES:
+        raise ValueError("geofence must be a GeoJSON Polygon or MultiPolygon")
+
+    polygons = geometry.get("coordinates")
+    if geometry["type"] == "Polygon":
+        polygons = [polygons]
+    if not isinstance(polygons, list) or not polygons:
+        raise ValueError("geofence has no coordinates")
+
+    normalized = []
+    for polygon in polygons:
+        if not isinstance(polygon, list) or not polygon:
+            raise ValueError("geofence polygon has no rings")
+        rings = []
+        for ring in polygon:
+            try:
+                points = [[float(lon), float(lat)] for lon, lat in ring]
+            except (TypeError, ValueError):
+                raise ValueError("geofence positions must be [longitude, latitude] pairs")
+            if any(not (-180 <= lon <= 180 and -90 <= lat <= 90) for lon, lat in points):
+                raise ValueError("geofence position out of range")
+            if points and points[0] != points[-1]:
+                points.append(points[0])
+            if len(points) < 4:
+                raise ValueError("geofence rings need at least 3 distinct positions")
+            rings.append(points)
+        normalized.append(rings)
+
+    if geometry["type"] == "Polygon":
+        return {"type": "Polygon", "coordinates": normalized[0]}
+    return {"type": "MultiPolygon", "coordinates": normalized}
+
+def prepare(geometry: dict) -> dict:
+    """Precompute bounding boxes and edge arrays for fast point-in-polygon tests"""
+    polygons = geometry["coordinates"]
+    if geometry["type"] == "Polygon":
+        polygons = [polygons]
+
+    prepared = []
+    for polygon in polygons:
+        # Holes are just more edges under the even-odd rule
+        x1, y1, x2, y2 = [], [], [], []
+        for ring in polygon:
+            ring = np.asarray(ring, dtype=np.float64)
+            x1.append(ring[:-1, 0])
+            y1.append(ring[:-1, 1])
+            x2.append(ring[1:, 0])
+            y2.append(ring[1:, 1])
+        x1, y1, x2, y2 = (np.concatenate(part) for part in (x1, y1, x2, y2))
+        dy = y2 - y1
+        prepared.append({
+            "bbox": (float(x1.min()), float(y1.min()), float(x1.max()), float(y1.max())),
+            "x1": x1,
+            "y1": y1,
+            "x2": x2,
+            "y2": y2,
+            # Inverse slope for the crossing test; horizontal edges never cross
+            "dxdy": np.divide(x2 - x1, dy, out=np.zeros_like(dy), where=dy != 0),
+        })
+
+    return {
+        "bbox": (
+            min(p["bbox"][0] for p in prepared), min(p["bbox"][1] for p in prepared),
+            max(p["bbox"][2] for p in prepared), max(p["bbox"][3] for p in prepared),
+        ),
+        "polygons": prepared,
+    }
+
+def prepared_for(event: dict) -> dict:
+    """Return the prepared geofence for an event, building it once per revision"""
+    key = (event.get("_id"), event.get("geofence_rev"))
+    prepared = _prepared.get(key)
+    if prepared is None:
+        prepared = prepare(event["geofence"])
+        if len(_prepared) >= GEOFENCE_PREPARED_CACHE_SIZE:
+            _prepared.pop(next(iter(_prepared)))
+        _prepared[key] = prepared
+    return prepared
+
+def invalidate(event_id):
+    for key in [key for key in _prepared if key[0] == event_id]:
+        _prepared.pop(key, None)
+
+def _contains(prepared: dict, lons: np.ndarray, lats: np.ndarray) -> np.ndarray:
+    inside = np.zeros(lons.shape, dtype=bool)
+    min_x, min_y, max_x, max_y = prepared["bbox"]
+    candidates = (lons >= min_x) & (lons <= max_x) & (lats >= min_y) & (lats <= max_y)
+    if not candidates.any():
+        return inside
+
+    for polygon in prepared["polygons"]:
+        min_x, min_y, max_x, max_y = polygon["bbox"]
+        hit = candidates & ~inside & (lons >= min_x) & (lons <= max_x) & (lats >= min_y) & (lats <= max_y)
+        if not hit.any():
+            continue
+        x = lons[hit][:, None]
+        y = lats[hit][:, None]
+        straddles = (polygon["y1"] > y) != (polygon["y2"] > y)
+        crossings = straddles & (x < polygon["x1"] + (y - polygon["y1"]) * polygon["dxdy"])
+        inside[hit] = (crossings.sum(axis=1) % 2) == 1
+    return inside
+
+def _distance_to_edges(prepared: dict, lon: float, lat: float) -> float:
+    """Approximate distance in meters from a point to the nearest geofence edge"""
+    # Local equirectangular projection around the point; accurate at venue scale
+    scale_x = math.radians(1) * EARTH_RADIUS_M * math.cos(math.radians(lat))
+    scale_y = math.radians(1) * EARTH_RADIUS_M
+    best = math.inf
+    for polygon in prepared["polygons"]:
+        ax = (polygon["x1"] - lon) * scale_x
+        ay = (polygon["y1"] - lat) * scale_y
+        bx = (polygon["x2"] - lon) * scale_x
+        by = (polygon["y2"] - lat) * scale_y
+        ex, ey = bx - ax, by - ay
+        length_sq = ex * ex + ey * ey
+        t = np.clip(np.divide(-(ax * ex + ay * ey), length_sq, out=np.zeros_like(length_sq), where=length_sq > 0), 0.0, 1.0)
+        best = min(best, float(np.min(np.hypot(ax + t * ex, ay + t * ey))))
+    return best
+
+def check_polygon(prepared: dict, user_lat: float, user_lon: float):
+    """Return (inside, distance_m) for a point against a prepared polygon geofence.
+
+    The distance is 0 inside and the distance to the nearest edge outside.
+    """
+    min_x, min_y, max_x, max_y = prepared["bbox"]
+    if min_x <= user_lon <= max_x and min_y <= user_lat <= max_y:
+        for polygon in prepared["polygons"]:
+            min_x, min_y, max_x, max_y = polygon["bbox"]
+            if not (min_x <= user_lon <= max_x and min_y <= user_lat <= max_y):
+                continue
+            straddles = (polygon["y1"] > user_lat) != (polygon["y2"] > user_lat)
+            crossings = np.count_nonzero(straddles & (user_lon < polygon["x1"] + (user_lat - polygon["y1"]) * polygon["dxdy"]))
+            if crossings % 2:
+                return True, 0.0
+    return False, _distance_to_edges(prepared, user_lon, user_lat)
+
+def contains_many(prepared: dict, lats, lons) -> np.ndarray:
+    """Vectorized containment of many points in one prepared polygon geofence"""
+    return _contains(prepared, np.asarray(lons, dtype=np.float64), np.asarray(lats, dtype=np.float64))
+
+def check_event(event: dict, user_lat: float, user_lon: float):
+    """Return (inside, distance_m) for a point against an event's geofence.
+
+    Events with a polygon `geofence` use it; otherwise the circle given by
+    latitude, longitude and radius applies.
+    """
+    if event.get("geofence"):
+        return check_polygon(prepared_for(event), user_lat, user_lon)
+    return check_circle(user_lat, user_lon, event["latitude"], event["longitude"], event["radius"])
@@ -0,0 +1,112 @@
+"""Idempotency keys for check-in and check-out submissions.
+
+A client sends an `Idempotency-Key` header and reuses it when it retries the
+same submission. The first request claims the key. Its final response, whether
+a success or a client error such as "Out of Range", is stored against the key.
+A retry gets that stored response back without uploading or verifying the
+photo again.
+
+Keys are scoped to the user and the action and live in the idempotency_keys
+collection, so every worker sees them. They expire after IDEMPOTENCY_TTL_SECONDS.
+Responses that are worth retrying (429 and 5xx) are not stored; the claim is
+released instead.
+
+A claim records a fingerprint of the request it was made for (the event), and
+reusing the key for a different request is rejected with 422. A claim still
+"processing" after IDEMPOTENCY_PROCESSING_TIMEOUT belongs to a request that
+died without releasing it, and the next retry takes it over.
+"""
+import os
+from datetime import datetime, timedelta
+
+from fastapi import HTTPException, status
+from pymongo.errors import DuplicateKeyError
+
+from backend.database.connection import idempotency_collection
+
+IDEMPOTENCY_TTL_SECONDS = int(os.getenv("IDEMPOTENCY_TTL_SECONDS", "3600"))
+IDEMPOTENCY_KEY_MAX_LENGTH = 128
+IDEMPOTENCY_RETRY_AFTER = 2
+# Longer than any check-in can take (admission queue, upload and face job)
+IDEMPOTENCY_PROCESSING_TIMEOUT = int(os.getenv("IDEMPOTENCY_PROCESSING_TIMEOUT", "60"))
+
+async def begin(user_id: str, action: str, key: str, fingerprint: str):
+    """Claim a key for this request.
+
+    `fingerprint` identifies the request parameters the key may be reused
+    with; a stored claim with a different fingerprint is rejected with 422.
+    Returns (claim, None) when the request should run. `claim` is None if no
+    key was sent. Returns (None, body) to replay a stored success, and raises
+    the stored HTTPException to replay a stored error.
+    """
+    if not key:
+        return None, None
+    if len(key) > IDEMPOTENCY_KEY_MAX_LENGTH:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Idempotency-Key must be at most {IDEMPOTENCY_KEY_MAX_LENGTH} characters",
+        )
+
+    claim = f"{user_id}:{action}:{key}"
+    try:
+        await idempotency_collection.insert_one({
+            "_id": claim, "state": "processing", "fingerprint": fingerprint, "created_at": datetime.now()
+        })
+        return claim, None
+    except DuplicateKeyError:
+        record = await idempotency_collection.find_one({"_id": claim})
+
+    if record is None:
+        # Expired between the insert and the read; treat it as a fresh key
+        return await begin(user_id, action, key, fingerprint)
+    if record.get("fingerprint") != fingerprint:
+        raise HTTPException(
+            status_code=422,
+            detail="Idempotency-Key was already used for a different submission",
+        )
+    if record["state"] == "processing":
+        if datetime.now() - record["created_at"] > timedelta(seconds=IDEMPOTENCY_PROCESSING_TIMEOUT):
+            # The request holding the claim never finished; take it over unless
+            # another retry got there first
+            taken = await idempotency_collection.update_one(
+                {"_id": claim, "state": "processing", "created_at": record["created_at"]},
+                {"$set": {"created_at": datetime.now()}}
+            )
+            if taken.modified_count:
+                print(f"[IDEMPOTENCY] Took over abandoned {action} claim for user {user_id}")
+                return claim, None
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail="This submission is still being processed. Please wait.",
+            headers={"Retry-After": str(IDEMPOTENCY_RETRY_AFTER)},
+        )
+
+    print(f"[IDEMPOTENCY] Replaying stored {action} response for user {user_id}")
+    if record["status_code"] >= 400:
+        raise HTTPException(status_code=record["status_code"], detail=record["detail"])
+    return None, record["body"]
+
+async def complete(claim: str, body: dict):
+    """Store a successful response for the claimed key"""
+    if claim:
+        await idempotency_collection.update_one(
+            {"_id": claim},
+            {"$set": {"state": "done", "status_code": 200, "body": body}}
+        )
+
+async def fail(claim: str, error: HTTPException):
+    """Store a client error for the claimed key, or release it if retrying may succeed"""
+    if not claim:
+        return
+    if error.status_code == status.HTTP_429_TOO_MANY_REQUESTS or error.status_code >= 500:
+        await release(claim)
+        return
+    await idempotency_collection.update_one(
+        {"_id": claim},
+        {"$set": {"state": "done", "status_code": error.status_code, "detail": error.detail}}
+    )
+
+async def release(claim: str):
+    """Forget a claimed key so the next retry runs the request again"""
+    if claim:
+        await idempotency_collection.delete_one({"_id": claim})
@@ -0,0 +1,106 @@
+"""Per-event replay detection for check-in photos.
+
+Every photo gets a SHA-256 digest and a 64-bit difference hash (dHash) computed
+from a tiny draft-mode decode. Both are remembered per event, so before any
+dlib work runs we can:
+
+* reject a byte-identical photo that another student already submitted for
+  the event - a shared or replayed image;
+* log a near-duplicate of another student's photo. Two people photographed
+  against the same wall can land within a bit or two of each other, so a
+  close dHash is only a signal for review, never a rejection;
+* reject a byte-identical photo reused for a different action (the check-in
+  frame replayed for check-out);
+* short-circuit a byte-identical retry of a photo that already failed
+  verification, returning the same failure without re-running the pipeline.
+"""
+import hashlib
+import io
+import os
+from collections import OrderedDict
+
+import numpy as np
+from PIL import Image
+
+IMAGE_DEDUP_MAX_EVENTS = int(os.getenv("IMAGE_DEDUP_MAX_EVENTS", "64"))
+IMAGE_DEDUP_PER_EVENT = int(os.getenv("IMAGE_DEDUP_PER_EVENT", "2000"))
+# Hamming distance (out of 64 bits) at which two photos are logged as near-duplicates
+IMAGE_DEDUP_HASH_DISTANCE = int(os.getenv("IMAGE_DEDUP_HASH_DISTANCE", "1"))
+
+FAILED_VERIFICATION_MESSAGE = "Face verification failed. Face does not match registered user."
+
+_events: "OrderedDict[object, dict]" = OrderedDict()
+
+def fingerprint(image_bytes: bytes):
+    """Return (sha256 hex digest, 64-bit dHash or None if the image does not decode)"""
+    digest = hashlib.sha256(image_bytes).hexdigest()
+    try:
+        image = Image.open(io.BytesIO(image_bytes))
+        if image.format == "JPEG":
+            image.draft("L", (64, 64))
+        pixels = np.asarray(image.convert("L").resize((9, 8), Image.BILINEAR), dtype=np.int16)
+        bits = (pixels[:, 1:] > pixels[:, :-1]).flatten()
+        phash = int(np.packbits(bits).view(">u8")[0])
+    except Exception:
+        phash = None
+    return digest, phash
+
+def _event_entries(event_id) -> dict:
+    entries = _events.get(event_id)
+    if entries is None:
+        entries = {"digests": OrderedDict(), "hashes": OrderedDict()}
+        _events[event_id] = entries
+        while len(_events) > IMAGE_DEDUP_MAX_EVENTS:
+            _events.popitem(last=False)
+    else:
+        _events.move_to_end(event_id)
+    return entries
+
+def _nearest_other_student(entries: dict, phash: int, student_id: str):
+    if phash is None or not entries["hashes"]:
+        return None
+    owners = list(entries["hashes"].values())
+    hashes = np.fromiter(entries["hashes"].keys(), dtype=np.uint64, count=len(owners))
+    distances = np.unpackbits((hashes ^ np.uint64(phash)).view(np.uint8)).reshape(-1, 64).sum(axis=1)
+    for index in np.flatnonzero(distances <= IMAGE_DEDUP_HASH_DISTANCE):
+        if owners[index] != student_id:
+            return owners[index]
+    return None
+
+def check(event_id, student_id: str, action: str, fp):
+    """Return an error message if the photo must not be processed, else None"""
+    digest, phash = fp
+    entries = _events.get(event_id)
+    if not entries:
+        return None
+
+    previous = entries["digests"].get(digest)
+    if previous:
+        if previous["student_id"] != student_id:
+            print(f"[DEDUP] Student {student_id} submitted a photo already used by {previous['student_id']}")
+            return "This photo was already submitted by another student. Please take a new photo."
+        if previous["action"] != action:
+            return "This photo was already used. Please take a new photo."
+        if previous["verified"] is False:
+            return FAILED_VERIFICATION_MESSAGE
+
+    similar = _nearest_other_student(entries, phash, student_id)
+    if similar:
+        print(f"[DEDUP] Student {student_id} submitted a near-duplicate of {similar}'s photo for event {event_id}")
+
+    return None
+
+def record(event_id, student_id: str, action: str, fp, verified=None):
+    """Remember a processed photo and its verification outcome (None if unknown yet)"""
+    digest, phash = fp
+    entries = _event_entries(event_id)
+
+    entries["digests"][digest] = {"student_id": student_id, "action": action, "verified": verified}
+    entries["digests"].move_to_end(digest)
+    if phash is not None:
+        entries["hashes"][phash] = student_id
+        entries["hashes"].move_to_end(phash)
+
+    for key in ("digests", "hashes"):
+        while len(entries[key]) > IMAGE_DEDUP_PER_EVENT:
+            entries[key].popitem(last=False)
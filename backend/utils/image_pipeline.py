@@ -0,0 +1,96 @@
+"""Decode and downscale uploaded photos before face detection.
+
+Phone cameras produce 12 MP images, and HOG detection plus encoding cost grows
+with pixel count. JPEGs are decoded in draft mode (libjpeg DCT scaling, so the
+full-resolution bitmap is never materialised), EXIF orientation is applied so
+portrait selfies are upright, and the longest side is capped before detection.
+"""
+import io
+import json
+import math
+import os
+
+import numpy as np
+from PIL import Image, ImageOps
+
+FACE_IMAGE_MAX_SIDE = int(os.getenv("FACE_IMAGE_MAX_SIDE", "800"))
+# Group photos keep more resolution so faces at the back stay detectable
+GROUP_IMAGE_MAX_SIDE = int(os.getenv("GROUP_IMAGE_MAX_SIDE", "2400"))
+
+# Sanity limits for client-supplied face boxes
+FACE_BOX_MIN_PIXELS = int(os.getenv("FACE_BOX_MIN_PIXELS", "80"))
+FACE_BOX_MIN_CONTRAST = float(os.getenv("FACE_BOX_MIN_CONTRAST", "12"))
+
+def load_face_image(image_bytes: bytes, max_side: int = None) -> np.ndarray:
+    """Decode image bytes into an upright RGB array no larger than max_side"""
+    max_side = max_side or FACE_IMAGE_MAX_SIDE
+
+    image = Image.open(io.BytesIO(image_bytes))
+
+    # Let the JPEG decoder scale by 1/2, 1/4 or 1/8 while decoding. draft()
+    # picks the largest reduction that keeps both sides >= the requested size,
+    # so ask for the image scaled to max_side on its longest edge. EXIF
+    # rotation only swaps the sides, so the longest edge is unaffected.
+    if image.format == "JPEG" and max(image.size) > max_side:
+        scale = max_side / max(image.size)
+        image.draft("RGB", (math.ceil(image.width * scale), math.ceil(image.height * scale)))
+
+    image = ImageOps.exif_transpose(image)
+    if image.mode != "RGB":
+        image = image.convert("RGB")
+
+    if max(image.size) > max_side:
+        image.thumbnail((max_side, max_side), Image.BILINEAR)
+
+    return np.array(image)
+
+def parse_face_box(raw):
+    """Parse a client face box JSON string into normalized (x, y, width, height).
+
+    The box is given as fractions of the captured image so it survives the
+    server-side downscale. Returns None for anything malformed.
+    """
+    if not raw:
+        return None
+    try:
+        box = json.loads(raw) if isinstance(raw, str) else raw
+        x, y = float(box["x"]), float(box["y"])
+        width, height = float(box["width"]), float(box["height"])
+    except (ValueError, KeyError, TypeError):
+        return None
+
+    if not (0 <= x < 1 and 0 <= y < 1 and 0 < width <= 1 and 0 < height <= 1):
+        return None
+    if x + width > 1.001 or y + height > 1.001:
+        return None
+    return (x, y, width, height)
+
+def face_box_location(image: np.ndarray, face_box):
+    """Turn a normalized face box into a (top, right, bottom, left) location.
+
+    Returns None when the box is too small, oddly shaped, or covers a nearly
+    flat region (lens covered, black frame), so the caller falls back to full
+    face detection.
+    """
+    if not face_box:
+        return None
+
+    x, y, width, height = face_box
+    image_height, image_width = image.shape[:2]
+    left = int(round(x * image_width))
+    top = int(round(y * image_height))
+    right = min(image_width, int(round((x + width) * image_width)))
+    bottom = min(image_height, int(round((y + height) * image_height)))
+
+    box_width = right - left
+    box_height = bottom - top
+    if min(box_width, box_height) < FACE_BOX_MIN_PIXELS:
+        return None
+    if not 0.5 <= box_width / box_height <= 2.0:
+        return None
+
+    # Sparse sample of the crop is enough to spot a blank region
+    if image[top:bottom:4, left:right:4].std() < FACE_BOX_MIN_CONTRAST:
+        return None
+
+    return (top, right, bottom, left)
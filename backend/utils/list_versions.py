@@ -0,0 +1,64 @@
+"""Version counters and ETags for conditional GETs on list endpoints.
+
+Every write to events, departments or enrollments bumps a counter for the
+scope it touches: "events", "departments", or "enrollments:<user_id>" for the
+user whose enrollment changed. A list endpoint builds a strong ETag from the
+counters its result depends on plus the request parameters, so a matching
+If-None-Match is answered with 304 after one indexed read of the counters,
+without running the list query or serializing anything.
+
+Counters live in the list_versions collection so every worker agrees on them.
+"""
+import hashlib
+import os
+import time
+
+from fastapi import Request, Response, status
+from pymongo import UpdateOne
+
+from backend.database.connection import list_version_collection
+
+# Open-event lists also change when events end, with no write to bump a counter
+EVENT_LIST_ETAG_WINDOW = int(os.getenv("EVENT_LIST_ETAG_WINDOW", "60"))
+
+EVENTS = "events"
+DEPARTMENTS = "departments"
+
+def enrollments(user_id) -> str:
+    return f"enrollments:{user_id}"
+
+async def bump(*scopes):
+    """Record a write to the given scopes"""
+    if len(scopes) == 1:
+        await list_version_collection.update_one({"_id": scopes[0]}, {"$inc": {"version": 1}}, upsert=True)
+    elif scopes:
+        await list_version_collection.bulk_write(
+            [UpdateOne({"_id": scope}, {"$inc": {"version": 1}}, upsert=True) for scope in scopes],
+            ordered=False
+        )
+
+async def etag(scopes, *parts) -> str:
+    """Strong ETag for a list that depends on `scopes` and the request `parts`"""
+    docs = await list_version_collection.find({"_id": {"$in": list(scopes)}}).to_list(None)
+    versions = {doc["_id"]: doc.get("version", 0) for doc in docs}
+    key = repr(([(scope, versions.get(scope, 0)) for scope in scopes], parts))
+    return '"' + hashlib.sha1(key.encode()).hexdigest() + '"'
+
+def time_window() -> int:
+    return int(time.time() // EVENT_LIST_ETAG_WINDOW)
+
+def not_modified(request: Request, tag: str):
+    """Return a 304 response if the client already holds `tag`, else None"""
+    header = request.headers.get("if-none-match")
+    if not header:
+        return None
+    # If-None-Match uses the weak comparison, so a W/ prefix still matches
+    candidates = [value.strip().removeprefix("W/") for value in header.split(",")]
+    if tag in candidates or "*" in candidates:
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers={"ETag": tag})
+    return None
+
+def set_etag(response: Response, tag: str):
+    response.headers["ETag"] = tag
+    # Clients may keep the list but must revalidate it before reuse
+    response.headers["Cache-Control"] = "private, no-cache"
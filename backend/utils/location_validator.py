@@ -1,9 +1,10 @@
-from geopy.distance import geodesic
+from backend.utils.geofence import check_circle
 
 def is_within_radius(user_lat: float, user_lon: float, event_lat: float, event_lon: float, radius: float) -> bool:
     """
     Checks if a user is within a given radius from an event location.
-    Uses the Haversine formula via geopy library.
+    Uses the haversine formula, falling back to the exact geodesic (geopy)
+    only when the point is close to the edge of the radius.
     
     Args:
         user_lat: User's latitude
@@ -16,10 +17,8 @@ def is_within_radius(user_lat: float, user_lon: float, event_lat: float, event_l
         bool: True if user is within radius, False otherwise
     """
     try:
-        event_location = (event_lat, event_lon)
-        user_location = (user_lat, user_lon)
-        distance = geodesic(user_location, event_location).meters
-        return distance <= radius
+        inside, _ = check_circle(user_lat, user_lon, event_lat, event_lon, radius)
+        return inside
     except Exception as e:
         print(f"Error calculating distance: {str(e)}")
         return False
@@ -0,0 +1,47 @@
+"""Signing keys for offline check-in batches.
+
+While online, a client fetches a key for one event with issue_key(). The key
+is an HMAC of the user id, the event id, the issue time and an expiry under the
+server secret, so the server never has to store it. Offline records are signed
+with that key (HMAC-SHA256 over the exact payload text). On upload, verify()
+derives the key again from the authenticated user id and the event, issue time
+and expiry the client sends back, and checks the signature.
+
+The key lives on the same device that signs, so a valid signature only proves
+the batch came from a device that was online for this user and event after
+`issued_at`, and is unchanged since. Records must be for the key's event and
+captured after the key was issued; they are still stored as pending
+verification rather than present.
+"""
+import hashlib
+import hmac
+import os
+import time
+
+from backend.utils.jwt_handler import JWT_SECRET
+
+OFFLINE_SIGNING_SECRET = os.getenv("OFFLINE_SIGNING_SECRET", JWT_SECRET)
+# How long a device may keep capturing offline with one key
+OFFLINE_KEY_TTL_SECONDS = int(os.getenv("OFFLINE_KEY_TTL_SECONDS", str(7 * 24 * 3600)))
+
+def _derive(user_id: str, event_id: str, issued_at: int, expires: int) -> str:
+    message = f"{user_id}:{event_id}:{issued_at}:{expires}".encode()
+    return hmac.new(OFFLINE_SIGNING_SECRET.encode(), message, hashlib.sha256).hexdigest()
+
+def issue_key(user_id: str, event_id: str) -> dict:
+    """Return {"key", "event_id", "issued_at", "expires"}; clients use the key string itself as the HMAC key"""
+    issued_at = int(time.time())
+    expires = issued_at + OFFLINE_KEY_TTL_SECONDS
+    return {
+        "key": _derive(user_id, event_id, issued_at, expires),
+        "event_id": event_id,
+        "issued_at": issued_at,
+        "expires": expires,
+    }
+
+def verify(user_id: str, event_id: str, issued_at: int, expires: int, payload: str, signature: str) -> bool:
+    """True if the payload was signed with the user's key for the event and the key has not expired"""
+    if expires < time.time() or issued_at > expires:
+        return False
+    expected = hmac.new(_derive(user_id, event_id, issued_at, expires).encode(), payload.encode(), hashlib.sha256).hexdigest()
+    return hmac.compare_digest(expected, signature.lower())
@@ -0,0 +1,56 @@
+"""Keyset pagination for list endpoints.
+
+Pages are ordered by `_id` and a cursor is the last `_id` of the previous
+page, so page N costs the same index seek as page 1 and documents inserted
+while a client scrolls never shift or repeat entries. Responses stay plain
+lists; the cursor for the next page is sent in the X-Next-Cursor header and
+is absent on the last page.
+"""
+import os
+
+from bson import ObjectId
+from fastapi import HTTPException, Query, Response, status
+
+PAGE_DEFAULT_LIMIT = int(os.getenv("PAGE_DEFAULT_LIMIT", "500"))
+PAGE_MAX_LIMIT = int(os.getenv("PAGE_MAX_LIMIT", "1000"))
+
+NEXT_CURSOR_HEADER = "X-Next-Cursor"
+
+def page_params(
+    limit: int = Query(None, ge=1, le=PAGE_MAX_LIMIT, description="Page size"),
+    after: str = Query(None, description="Cursor from the previous page's X-Next-Cursor header"),
+) -> dict:
+    """FastAPI dependency returning {"limit", "after"} for a list endpoint"""
+    if after is not None and not ObjectId.is_valid(after):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Invalid page cursor",
+        )
+    return {
+        "limit": limit or PAGE_DEFAULT_LIMIT,
+        "after": ObjectId(after) if after else None,
+    }
+
+def keyset(query: dict, page: dict) -> dict:
+    """Restrict a filter to documents after the page cursor"""
+    if not page or page["after"] is None:
+        return query
+    after = {"_id": {"$gt": page["after"]}}
+    if "_id" in query:
+        return {"$and": [query, after]}
+    return {**query, **after}
+
+async def fetch(collection, query: dict, page: dict, projection: dict = None):
+    """Return (docs, next_cursor) for one page of a find ordered by _id"""
+    page = page or {"limit": PAGE_DEFAULT_LIMIT, "after": None}
+    limit = page["limit"]
+    # One extra document tells us whether another page exists
+    docs = await collection.find(keyset(query, page), projection).sort("_id", 1).limit(limit + 1).to_list(None)
+    if len(docs) > limit:
+        docs = docs[:limit]
+        return docs, str(docs[-1]["_id"])
+    return docs, None
+
+def set_next_cursor(response: Response, next_cursor):
+    if next_cursor:
+        response.headers[NEXT_CURSOR_HEADER] = next_cursor
@@ -0,0 +1,136 @@
+"""Per-event roster encoding matrices for 1:N face identification.
+
+Each entry stacks the encodings of every approved student in an event's
+department into one (n, 128) float32 matrix, so identifying a face is a single
+vectorized distance computation instead of n separate comparisons. Rosters are
+rebuilt after ROSTER_MATRIX_TTL seconds to pick up new enrollments, and are
+dropped when one of their students re-registers a face.
+"""
+import asyncio
+import os
+import time
+
+import numpy as np
+from bson import ObjectId
+
+from backend.utils import face_cache
+
+ROSTER_MATRIX_TTL = int(os.getenv("ROSTER_MATRIX_TTL", "300"))
+# The best match must beat the runner-up by this margin, otherwise two
+# similar-looking students could be confused for each other
+FACE_IDENTIFY_MARGIN = float(os.getenv("FACE_IDENTIFY_MARGIN", "0.05"))
+
+_rosters = {}
+_locks = {}
+
+async def _build(event: dict) -> dict:
+    from backend.database.connection import enrollment_collection, user_collection
+
+    department_id = event.get("department_id")
+    user_ids = []
+    if department_id:
+        async for enrollment in enrollment_collection.find(
+            {"department_id": department_id, "status": "approved"},
+            {"user_id": 1}
+        ):
+            user_id = enrollment.get("user_id")
+            if user_id and ObjectId.is_valid(user_id):
+                user_ids.append(str(user_id))
+
+    encodings = await face_cache.get_many(user_ids)
+    missing = [ObjectId(user_id) for user_id in user_ids if user_id not in encodings]
+
+    # Load every cache miss in one round trip
+    if missing:
+        async for user in user_collection.find(
+            {"_id": {"$in": missing}, "face_encoding": {"$exists": True}},
+            face_cache.ENCODING_PROJECTION
+        ):
+            encoding = face_cache.put_document(user)
+            if encoding is not None:
+                encodings[str(user["_id"])] = encoding
+
+    ids = list(encodings.keys())
+    matrix = np.vstack([encodings[i] for i in ids]).astype(np.float32) if ids else np.empty((0, 128), dtype=np.float32)
+    # Squared row norms, precomputed once for batched distance computations
+    sq_norms = np.einsum("ij,ij->i", matrix, matrix)
+
+    print(f"[ROSTER] Built matrix for event '{event.get('name', event.get('_id'))}': "
+          f"{len(ids)} of {len(user_ids)} enrolled student(s) have a registered face")
+    return {
+        "event_id": event["_id"],
+        "user_ids": ids,
+        "matrix": matrix,
+        "sq_norms": sq_norms,
+        "built_at": time.monotonic(),
+    }
+
+async def get_roster(event: dict) -> dict:
+    """Return the cached roster matrix for an event, building it if needed"""
+    event_id = event["_id"]
+    roster = _rosters.get(event_id)
+    if roster and time.monotonic() - roster["built_at"] < ROSTER_MATRIX_TTL:
+        return roster
+
+    # Only one build per event at a time; concurrent callers wait for it
+    lock = _locks.setdefault(event_id, asyncio.Lock())
+    async with lock:
+        roster = _rosters.get(event_id)
+        if roster and time.monotonic() - roster["built_at"] < ROSTER_MATRIX_TTL:
+            return roster
+        roster = await _build(event)
+        _rosters[event_id] = roster
+        return roster
+
+def invalidate_user(user_id: str):
+    """Drop every roster that contains the user"""
+    user_id = str(user_id)
+    for event_id, roster in list(_rosters.items()):
+        if user_id in roster["user_ids"]:
+            _rosters.pop(event_id, None)
+
+def invalidate_event(event_id):
+    _rosters.pop(event_id, None)
+
+def identify_many(roster: dict, encodings, tolerance: float):
+    """Match several face encodings against a roster in one batched computation.
+
+    Returns a list of (user_id, distance) pairs in input order; user_id is None
+    when nobody is within the tolerance or the best match is not clearly better
+    than the runner-up.
+    """
+    matrix = roster["matrix"]
+    if len(encodings) == 0:
+        return []
+    if matrix.shape[0] == 0:
+        return [(None, None)] * len(encodings)
+
+    faces = np.asarray(encodings, dtype=np.float32).reshape(-1, matrix.shape[1])
+    # |a - b|^2 = |a|^2 + |b|^2 - 2ab, giving the full (faces x roster) matrix
+    # from a single matrix product
+    sq_distances = (
+        np.einsum("ij,ij->i", faces, faces)[:, None]
+        + roster["sq_norms"][None, :]
+        - 2.0 * faces @ matrix.T
+    )
+    distances = np.sqrt(np.maximum(sq_distances, 0.0))
+
+    best = np.argmin(distances, axis=1)
+    best_distances = distances[np.arange(len(faces)), best]
+    if matrix.shape[0] > 1:
+        runner_up = np.partition(distances, 1, axis=1)[:, 1]
+    else:
+        runner_up = np.full(len(faces), np.inf)
+
+    results = []
+    for index, distance, second in zip(best, best_distances, runner_up):
+        distance = float(distance)
+        if distance > tolerance or second - distance < FACE_IDENTIFY_MARGIN:
+            results.append((None, distance))
+        else:
+            results.append((roster["user_ids"][int(index)], distance))
+    return results
+
+def identify(roster: dict, encoding, tolerance: float):
+    """Find the roster student closest to a single encoding (see identify_many)"""
+    return identify_many(roster, [encoding], tolerance)[0]
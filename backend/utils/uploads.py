@@ -0,0 +1,39 @@
+"""Bounded reads of uploaded photos.
+
+Starlette already spools multipart files into a SpooledTemporaryFile, so a
+large upload sits on disk rather than in memory until someone reads it. These
+helpers make sure that read happens only when the photo is actually needed,
+and that it never pulls more than the configured limit into memory.
+"""
+import os
+
+from fastapi import HTTPException, UploadFile
+
+FACE_IMAGE_MAX_BYTES = int(os.getenv("FACE_IMAGE_MAX_BYTES", str(5 * 1024 * 1024)))
+GROUP_IMAGE_MAX_BYTES = int(os.getenv("GROUP_IMAGE_MAX_BYTES", str(15 * 1024 * 1024)))
+
+def _too_large(max_bytes: int):
+    return HTTPException(
+        status_code=413,
+        detail=f"Image is too large. The maximum size is {max_bytes // (1024 * 1024)} MB.",
+    )
+
+async def read_upload(upload: UploadFile, max_bytes: int = FACE_IMAGE_MAX_BYTES) -> bytes:
+    """Read an uploaded file, raising 413 if it is larger than max_bytes"""
+    if upload.size is not None and upload.size > max_bytes:
+        raise _too_large(max_bytes)
+    # Read one byte past the limit to detect oversize files without a known size
+    data = await upload.read(max_bytes + 1)
+    if len(data) > max_bytes:
+        raise _too_large(max_bytes)
+    return data
+
+def deferred_reader(upload: UploadFile, max_bytes: int = FACE_IMAGE_MAX_BYTES):
+    """Return a coroutine function that reads the upload when called, or None without one"""
+    if upload is None:
+        return None
+
+    async def read():
+        return await read_upload(upload, max_bytes)
+
+    return read
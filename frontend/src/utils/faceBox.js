@@ -0,0 +1,39 @@
+// The on-screen face guide (.guide-circle / .face-guide) is a centered oval
+// covering 60% x 70% of the camera container
+const GUIDE_WIDTH = 0.6;
+const GUIDE_HEIGHT = 0.7;
+// The oval also frames hair and neck; the face itself fills its inner part
+const FACE_SHRINK = 0.8;
+
+/**
+ * Return the face guide region as fractions of the captured video frame,
+ * e.g. { x: 0.26, y: 0.22, width: 0.48, height: 0.56 }.
+ * The server runs face detection in this region first, which is much cheaper
+ * than searching the full frame, and searches the full frame when no matching
+ * face is found there.
+ */
+export function guideFaceBox(video) {
+  const frameWidth = video.videoWidth;
+  const frameHeight = video.videoHeight;
+  const rect = video.getBoundingClientRect();
+  if (!frameWidth || !frameHeight || !rect.width || !rect.height) {
+    return null;
+  }
+
+  // object-fit: cover scales the frame to fill the element and crops the overflow
+  const scale = Math.max(rect.width / frameWidth, rect.height / frameHeight);
+  const visibleWidth = rect.width / scale;
+  const visibleHeight = rect.height / scale;
+
+  const boxWidth = visibleWidth * GUIDE_WIDTH * FACE_SHRINK;
+  const boxHeight = visibleHeight * GUIDE_HEIGHT * FACE_SHRINK;
+  const x = (frameWidth - boxWidth) / 2;
+  const y = (frameHeight - boxHeight) / 2;
+
+  return {
+    x: x / frameWidth,
+    y: y / frameHeight,
+    width: boxWidth / frameWidth,
+    height: boxHeight / frameHeight
+  };
+}
@@ -0,0 +1,57 @@
+import axios from 'axios';
+
+// List endpoints return one keyset page at a time and send the cursor for the
+// next page in this header; it is absent on the last page
+const NEXT_CURSOR_HEADER = 'x-next-cursor';
+const PAGE_SIZE = 500;
+
+// Pages that came with an ETag, so revisiting a list only costs a 304 per page.
+// Keyed by the full request including the Authorization header.
+const pageCache = new Map();
+
+async function getPage(url, config) {
+  const key = JSON.stringify([url, config.params, config.headers?.Authorization]);
+  const cached = pageCache.get(key);
+  const headers = { ...(config.headers || {}) };
+  if (cached) {
+    headers['If-None-Match'] = cached.etag;
+  }
+
+  const response = await axios.get(url, {
+    ...config,
+    headers,
+    validateStatus: (status) => (status >= 200 && status < 300) || status === 304
+  });
+  if (response.status === 304 && cached) {
+    // Hand out a fresh copy so callers can modify the items freely
+    return { items: JSON.parse(cached.body), next: cached.next };
+  }
+
+  const items = response.data || [];
+  const next = response.headers[NEXT_CURSOR_HEADER] || null;
+  if (response.headers.etag) {
+    pageCache.set(key, { etag: response.headers.etag, body: JSON.stringify(items), next });
+  } else {
+    pageCache.delete(key);
+  }
+  return { items, next };
+}
+
+/**
+ * GET every page of a paginated list endpoint and return the concatenated items.
+ * `config` is passed to axios as-is; its params are merged with limit/after.
+ */
+export async function getAllPages(url, config = {}) {
+  const items = [];
+  let after = null;
+  do {
+    const params = { ...(config.params || {}), limit: PAGE_SIZE };
+    if (after) {
+      params.after = after;
+    }
+    const page = await getPage(url, { ...config, params });
+    items.push(...page.items);
+    after = page.next;
+  } while (after);
+  return items;
+}